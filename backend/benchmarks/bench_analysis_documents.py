@@ -0,0 +1,108 @@
+"""
+Size of analysis entities with the document inline versus offloaded to a compressed blob
+Reports the stored entity size, what a date-range (summary) query transfers, and the cost
+of reading one full result back
+
+    python -m benchmarks.bench_analysis_documents --rows 500 --ocr-lines 200
+"""
+import argparse
+import datetime
+import json
+import uuid
+
+from benchmarks.common import measure, print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import ImageAnalysisRepository, TableEntity, UpdateMode
+
+
+def large_analysis(image_id, ocr_lines, objects, tags):
+    """An analysis document shaped like a busy street scene with lots of signage"""
+    return {
+        "imageId": image_id,
+        "blobName": f"{image_id}.jpg",
+        "features": ["description", "objects", "tags", "text"],
+        "analysis": {
+            "objects": [{"name": f"object{i}", "confidence": 0.9, "rectangle": {"x": i, "y": i, "w": 40, "h": 30}}
+                        for i in range(objects)],
+            "descriptions": [{"text": "a busy street with shops and signs", "confidence": 0.81}],
+            "tags": [{"name": f"tag{i}", "confidence": 0.99 - i / 1000} for i in range(tags)],
+            "text": {
+                "text_detected": True,
+                "status": "succeeded",
+                "total_lines": ocr_lines,
+                "extracted_text": [{"text": f"OPEN DAILY 9AM - 9PM SALE {i}% OFF",
+                                    "bounding_box": [10.0, 20.5 * i, 300.0, 20.5 * i, 300.0, 20.5 * i + 18, 10.0, 20.5 * i + 18]}
+                                   for i in range(ocr_lines)]
+            }
+        }
+    }
+
+
+def entity_bytes(entity):
+    return len(json.dumps(dict(entity), default=str))
+
+
+def inline(entity, analysis_data):
+    """Rewrite an entity the way it was stored before documents moved to blobs"""
+    legacy = TableEntity()
+    legacy.update({key: value for key, value in entity.items() if key != "analysisBlob"})
+    legacy["analysisResults"] = json.dumps(analysis_data)
+    return legacy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--ocr-lines", type=int, default=200)
+    parser.add_argument("--objects", type=int, default=30)
+    parser.add_argument("--tags", type=int, default=60)
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    parser.add_argument("--reads", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = []
+    for layout in ("inline", "offloaded"):
+        latency = Latency()
+        repository = ImageAnalysisRepository(FakeTableServiceClient(latency), FakeBlobServiceClient(latency))
+        results_table = repository.table_service.get_table_client(repository.table_name)
+        index_table = repository.table_service.get_table_client(repository.index.table_name)
+
+        image_ids = [str(uuid.uuid4()) for _ in range(args.rows)]
+        for image_id in image_ids:
+            analysis_data = large_analysis(image_id, args.ocr_lines, args.objects, args.tags)
+            repository.save_analysis_result(image_id, f"{image_id}.jpg", analysis_data, "", {"fileSize": 1024})
+            if layout == "inline":
+                latest = index_table.get_entity(partition_key=image_id, row_key=repository.index.LATEST_ROW_KEY)
+                index_table.upsert_entity(inline(latest, analysis_data), mode=UpdateMode.REPLACE)
+                history = results_table.get_entity(partition_key=latest["resultPartitionKey"], row_key=latest["resultRowKey"])
+                results_table.upsert_entity(inline(history, analysis_data), mode=UpdateMode.REPLACE)
+
+        stored = [entity_bytes(entity) for entity in results_table.list_entities()]
+        blobs = repository.documents.blob_service.containers.get(repository.documents.container_name, {})
+
+        # Summary queries select their columns, so count what an unselected scan (stats, search) would carry
+        today = datetime.datetime.utcnow()
+        scanned = sum(entity_bytes(entity) for entity in results_table.list_entities())
+        latency.round_trip = args.round_trip_ms / 1000.0
+        summary_stats = measure(lambda: repository.get_results_by_date_range(today, today, args.rows), 5)
+        targets = iter(image_ids[:args.reads])
+        latency.round_trips = 0
+        read_stats = measure(lambda: repository.get_analysis_result(next(targets)), args.reads)
+
+        rows.append({
+            "layout": layout,
+            "max_entity_kb": round(max(stored) / 1024, 1),
+            "avg_entity_kb": round(sum(stored) / len(stored) / 1024, 2),
+            "avg_blob_kb": round(sum(blob.size for blob in blobs.values()) / len(blobs) / 1024, 2) if layout == "offloaded" else "-",
+            "scan_mb": round(scanned / 1024 / 1024, 2),
+            "date_range_p50_ms": summary_stats["p50_ms"],
+            "get_result_p50_ms": read_stats["p50_ms"],
+            "get_result_round_trips": latency.round_trips / args.reads,
+        })
+
+    print_table(rows, ["layout", "max_entity_kb", "avg_entity_kb", "avg_blob_kb", "scan_mb",
+                       "date_range_p50_ms", "get_result_p50_ms", "get_result_round_trips"])
+
+
+if __name__ == "__main__":
+    main()
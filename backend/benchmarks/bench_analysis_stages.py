@@ -0,0 +1,53 @@
+"""
+Per-stage timings of analyze_blob against a fake Computer Vision service
+Shows wall time tracking the slower of image analysis and OCR rather than their sum
+
+    python -m benchmarks.bench_analysis_stages --analyze-ms 400 --ocr-ms 600
+"""
+import argparse
+import asyncio
+import time
+
+import function_app
+from benchmarks.common import print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeComputerVisionClient, FakeTableServiceClient, UnlimitedRateLimiter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--analyze-ms", type=float, default=400.0)
+    parser.add_argument("--ocr-ms", type=float, default=600.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    function_app.clients.reset()
+    function_app.clients.set("blob", FakeBlobServiceClient())
+    function_app.clients.set("table", FakeTableServiceClient())
+    cv_client = FakeComputerVisionClient(analyze_ms=args.analyze_ms, ocr_ms=args.ocr_ms)
+    function_app.clients.set("computer_vision", cv_client)
+    function_app.clients.set("cv_rate_limiter", UnlimitedRateLimiter())
+
+    rows = []
+    for run in range(args.runs):
+        # Back-to-back, as analyze_image used to do it
+        started = time.perf_counter()
+        function_app.describe_image(cv_client, "https://fake/blob.jpg")
+        analyze_done = time.perf_counter()
+        asyncio.run_coroutine_threadsafe(
+            function_app.extract_text(cv_client, "https://fake/blob.jpg"), function_app.get_poll_loop()
+        ).result()
+        finished = time.perf_counter()
+        rows.append({"run": run, "mode": "sequential",
+                     "analyze_image_ms": round((analyze_done - started) * 1000, 1),
+                     "ocr_ms": round((finished - analyze_done) * 1000, 1),
+                     "wall_ms": round((finished - started) * 1000, 1)})
+
+        timings = function_app.analyze_blob(f"bench-{run}", "blob.jpg")["timings_ms"]
+        rows.append({"run": run, "mode": "concurrent", "analyze_image_ms": timings["analyze_image"],
+                     "ocr_ms": timings["ocr"], "wall_ms": timings["wall"]})
+
+    print_table(rows, ["run", "mode", "analyze_image_ms", "ocr_ms", "wall_ms"])
+
+
+if __name__ == "__main__":
+    main()
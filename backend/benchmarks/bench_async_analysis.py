@@ -0,0 +1,94 @@
+"""
+Throughput of the queue-backed analysis pipeline against in-memory fakes
+Compares sequential synchronous analyze calls with 202 + queue workers
+
+    python -m benchmarks.bench_async_analysis --images 40 --workers 1 4 16
+"""
+import argparse
+import json
+import time
+
+import azure.functions as func
+
+import function_app
+from benchmarks.common import print_table
+from benchmarks.fakes import (
+    FakeBlobServiceClient, FakeComputerVisionClient, FakeTableServiceClient, Latency, UnlimitedRateLimiter
+)
+
+
+def install_fakes(round_trip_ms, analyze_ms, ocr_ms):
+    """Point the shared client registry at fresh in-memory services"""
+    latency = Latency(round_trip_ms)
+    function_app.clients.reset()
+    function_app.clients.set("blob", FakeBlobServiceClient(latency))
+    function_app.clients.set("table", FakeTableServiceClient(latency))
+    function_app.clients.set("computer_vision", FakeComputerVisionClient(analyze_ms=analyze_ms, ocr_ms=ocr_ms))
+    function_app.clients.set("cv_rate_limiter", UnlimitedRateLimiter())
+
+
+def seed_images(count):
+    """Index fake blobs directly; the upload path is not what is being measured"""
+    repository = function_app.ImageIndexRepository()
+    image_ids = []
+    for index in range(count):
+        image_id = f"bench-{index:05d}"
+        repository.save_blob_entry(image_id, f"{image_id}.jpg", {
+            "upload_time": "2025-08-06T00:00:00Z", "file_size": "1024", "dimensions": "640x480", "format": "jpeg"
+        })
+        image_ids.append(image_id)
+    return image_ids
+
+
+def call_analyze(image_id, params):
+    request = func.HttpRequest("POST", f"/api/images/{image_id}/analyze", body=b"",
+                               route_params={"imageId": image_id}, params=params)
+    response = function_app.analyze_image.build().get_user_function()(request)
+    return response.status_code, json.loads(response.get_body())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    parser.add_argument("--analyze-ms", type=float, default=300.0)
+    parser.add_argument("--ocr-ms", type=float, default=500.0)
+    args = parser.parse_args()
+
+    rows = []
+
+    install_fakes(args.round_trip_ms, args.analyze_ms, args.ocr_ms)
+    image_ids = seed_images(args.images)
+    started = time.perf_counter()
+    for image_id in image_ids:
+        call_analyze(image_id, {"force": "true"})
+    elapsed = time.perf_counter() - started
+    rows.append({"mode": "sync", "workers": 1, "request_ms": round(elapsed / args.images * 1000, 1),
+                 "total_s": round(elapsed, 2), "images_per_s": round(args.images / elapsed, 2)})
+
+    for workers in args.workers:
+        install_fakes(args.round_trip_ms, args.analyze_ms, args.ocr_ms)
+        image_ids = seed_images(args.images)
+        analysis_queue = function_app.InMemoryAnalysisQueue(function_app.handle_analysis_job, workers=workers)
+        function_app.clients.set("analysis_queue", analysis_queue)
+
+        started = time.perf_counter()
+        for image_id in image_ids:
+            status, _ = call_analyze(image_id, {"force": "true", "async": "true"})
+            assert status == 202
+        accepted = time.perf_counter() - started
+        analysis_queue.join()
+        elapsed = time.perf_counter() - started
+
+        repository = function_app.ImageAnalysisRepository()
+        completed = sum(1 for image_id in image_ids if repository.get_status(image_id)["status"] == "completed")
+        rows.append({"mode": "async", "workers": workers, "request_ms": round(accepted / args.images * 1000, 1),
+                     "total_s": round(elapsed, 2), "images_per_s": round(args.images / elapsed, 2),
+                     "completed": completed})
+
+    print_table(rows, ["mode", "workers", "request_ms", "total_s", "images_per_s", "completed"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Batch analysis throughput against a local fake Computer Vision service
+Compares one-by-one analyze calls with POST /images/batch/analyze at several concurrency limits
+
+    python -m benchmarks.bench_batch_analysis --images 64 --concurrency 1 8 32
+"""
+import argparse
+import json
+import time
+
+import azure.functions as func
+
+import function_app
+from benchmarks.bench_async_analysis import call_analyze, install_fakes, seed_images
+from benchmarks.common import print_table
+
+
+def call_batch(image_ids, concurrency):
+    request = func.HttpRequest("POST", "/api/images/batch/analyze", body=json.dumps({
+        "imageIds": image_ids, "force": True, "concurrency": concurrency
+    }).encode(), headers={"Content-Type": "application/json"})
+    response = function_app.analyze_images_batch.build().get_user_function()(request)
+    return json.loads(response.get_body())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    parser.add_argument("--analyze-ms", type=float, default=300.0)
+    parser.add_argument("--ocr-ms", type=float, default=500.0)
+    args = parser.parse_args()
+
+    rows = []
+
+    install_fakes(args.round_trip_ms, args.analyze_ms, args.ocr_ms)
+    image_ids = seed_images(args.images)
+    table_latency = function_app.get_table_service_client().latency
+    table_latency.round_trips = 0
+    started = time.perf_counter()
+    for image_id in image_ids:
+        call_analyze(image_id, {"force": "true"})
+    elapsed = time.perf_counter() - started
+    rows.append({"mode": "one by one", "concurrency": 1, "total_s": round(elapsed, 2),
+                 "images_per_s": round(args.images / elapsed, 2), "succeeded": args.images,
+                 "storage_round_trips": table_latency.round_trips})
+
+    for concurrency in args.concurrency:
+        install_fakes(args.round_trip_ms, args.analyze_ms, args.ocr_ms)
+        image_ids = seed_images(args.images)
+        table_latency = function_app.get_table_service_client().latency
+        table_latency.round_trips = 0
+        started = time.perf_counter()
+        response = call_batch(image_ids, concurrency)
+        elapsed = time.perf_counter() - started
+        rows.append({"mode": "batch", "concurrency": response["concurrency"], "total_s": round(elapsed, 2),
+                     "images_per_s": round(args.images / elapsed, 2), "succeeded": response["succeeded"],
+                     "storage_round_trips": table_latency.round_trips})
+
+    print_table(rows, ["mode", "concurrency", "total_s", "images_per_s", "succeeded", "storage_round_trips"])
+
+
+if __name__ == "__main__":
+    main()
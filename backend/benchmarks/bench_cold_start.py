@@ -0,0 +1,88 @@
+"""
+Cold start of a worker process: import time of each heavy dependency, and time from interpreter
+start to the first /api/health and analyze responses with lazy imports, with every dependency
+imported up front (as before), and with warm_up run before the first analyze
+
+    python -m benchmarks.bench_cold_start --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import print_table
+from function_app import LazyImport
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter per measurement, so nothing is already imported
+IMPORT_PROBE = """
+import sys, time
+import azure.functions
+started = time.perf_counter()
+__import__(sys.argv[1])
+print((time.perf_counter() - started) * 1000)
+"""
+
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+mode = sys.argv[1]
+if mode == "eager":
+    for module in sys.argv[2:]:
+        __import__(module)
+import azure.functions as func
+import function_app
+timings = {"import_ms": (time.perf_counter() - started) * 1000}
+
+health = function_app.health.build().get_user_function()
+assert health(func.HttpRequest("GET", "/api/health", body=b"")).status_code == 200
+timings["first_health_ms"] = (time.perf_counter() - started) * 1000
+
+# The fakes import azure.core and azure.data.tables themselves; their setup is not counted
+setup_started = time.perf_counter()
+from benchmarks.bench_async_analysis import call_analyze, install_fakes, seed_images
+install_fakes(0, 1, 1)
+image_id = seed_images(1)[0]
+excluded = time.perf_counter() - setup_started
+if mode == "warm-up":
+    function_app.warm_up()
+analyze_started = time.perf_counter()
+status, _ = call_analyze(image_id, {"features": "tags"})
+assert status == 200
+timings["first_analyze_ms"] = (time.perf_counter() - started - excluded) * 1000
+timings["analyze_request_ms"] = (time.perf_counter() - analyze_started) * 1000
+print(json.dumps(timings))
+"""
+
+
+def run(script, *args):
+    output = subprocess.run([sys.executable, "-c", script, *args], cwd=BACKEND_DIR, check=True,
+                            capture_output=True, text=True, env={**os.environ, "PYTHONPATH": BACKEND_DIR}).stdout
+    return output.strip().splitlines()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement (medians are reported)")
+    args = parser.parse_args()
+
+    modules = list(dict.fromkeys(lazy.module_name for lazy in LazyImport.instances))
+    rows = [{"module": module, "import_ms": round(statistics.median(
+        float(run(IMPORT_PROBE, module)) for _ in range(args.runs)), 1)} for module in ["azure.core", "function_app"] + modules]
+    print("Import time in a fresh process, after azure.functions")
+    print_table(rows, ["module", "import_ms"])
+
+    rows = []
+    for mode in ("eager", "lazy", "warm-up"):
+        samples = [json.loads(run(STARTUP_PROBE, mode, *modules)) for _ in range(args.runs)]
+        rows.append({"mode": mode, **{key: round(statistics.median(sample[key] for sample in samples), 1)
+                                      for key in samples[0]}})
+    print("\nTime from interpreter start (first_analyze_ms excludes installing the fakes)")
+    print_table(rows, ["mode", "import_ms", "first_health_ms", "first_analyze_ms", "analyze_request_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+GET /results/color-search: build, reopen and query cost of the memory-mapped colour feature
+matrix at catalogue sizes, with a pure-Python scan of the same rows for comparison
+
+    python -m benchmarks.bench_color_search --images 100000,1000000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+from benchmarks.common import measure, print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import COLOR_NAMES, ColorFeatureIndex, ImageAnalysisRepository, TableEntity, UpdateMode
+
+
+def random_colors(rng):
+    return {
+        "dominant": rng.sample(COLOR_NAMES, rng.choice([1, 2, 2, 3])),
+        "accent": f"{rng.getrandbits(24):06X}",
+        "bw": rng.random() < 0.05
+    }
+
+
+def python_scan(rows, query, max_results):
+    """Without the matrix: compare the query with every image's colours one by one"""
+    distances = [(sum((a - b) ** 2 for a, b in zip(vector, query)), image_id) for image_id, vector in rows]
+    return sorted(distances)[:max_results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", default="100000,1000000", help="comma-separated catalogue sizes")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--max-results", type=int, default=20)
+    parser.add_argument("--updates", type=int, default=1000, help="analyses saved between refreshes")
+    parser.add_argument("--python-scan-limit", type=int, default=100000, help="largest size to time the Python scan at")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = []
+    for images in (int(size) for size in args.images.split(",")):
+        rng = random.Random(args.seed)
+        latency = Latency()
+        repository = ImageAnalysisRepository(FakeTableServiceClient(latency), FakeBlobServiceClient(latency))
+        index_client = repository.table_service.get_table_client(repository.index.table_name)
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        catalogue = []
+        for _ in range(images):
+            image_id = str(uuid.uuid4())
+            colors = random_colors(rng)
+            catalogue.append((image_id, colors))
+            latest = TableEntity()
+            latest.update({"PartitionKey": image_id, "RowKey": repository.index.LATEST_ROW_KEY, "imageId": image_id,
+                           "analysisTime": now, ColorFeatureIndex.COLUMN: json.dumps(colors)})
+            index_client.upsert_entity(latest, mode=UpdateMode.REPLACE)
+
+        path = tempfile.mkdtemp(prefix="color-index-")
+        try:
+            index = ColorFeatureIndex(repository, path)
+            started = time.perf_counter()
+            index.ensure_fresh()
+            build_s = time.perf_counter() - started
+            disk_mb = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1024 / 1024
+
+            # A restarted worker maps the files and only reads today's history partitions
+            latency.round_trips = 0
+            started = time.perf_counter()
+            reopened = ColorFeatureIndex(repository, path)
+            reopened.ensure_fresh()
+            reopen_s = time.perf_counter() - started
+            reopen_trips = latency.round_trips
+
+            for _ in range(args.updates):
+                image_id = rng.choice(catalogue)[0] if rng.random() < 0.5 else str(uuid.uuid4())
+                repository.save_analysis_result(image_id, f"{image_id}.jpg", {
+                    "imageId": image_id, "features": ["color"],
+                    "analysis": {"metadata": dict(zip(("dominant_colors", "accent_color", "is_bw_image"),
+                                                      random_colors(rng).values()))}
+                }, "", {})
+            started = time.perf_counter()
+            reopened.refresh()
+            refresh_ms = (time.perf_counter() - started) * 1000
+
+            queries = iter([ColorFeatureIndex.vector(random_colors(rng)) for _ in range(args.queries)])
+            stats = measure(lambda: reopened.nearest(next(queries), args.max_results), args.queries)
+            row = {"images": images, "build_s": round(build_s, 2), "disk_mb": round(disk_mb, 1),
+                   "reopen_ms": round(reopen_s * 1000, 1), "reopen_round_trips": reopen_trips,
+                   f"refresh_{args.updates}_ms": round(refresh_ms, 1),
+                   "query_p50_ms": stats["p50_ms"], "query_p95_ms": stats["p95_ms"], "python_scan_ms": "-"}
+
+            if images <= args.python_scan_limit:
+                vectors = [(image_id, ColorFeatureIndex.vector(colors).tolist()) for image_id, colors in catalogue]
+                query = ColorFeatureIndex.vector(random_colors(rng)).tolist()
+                row["python_scan_ms"] = measure(lambda: python_scan(vectors, query, args.max_results), 1)["p50_ms"]
+            rows.append(row)
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    print_table(rows, ["images", "build_s", "disk_mb", "reopen_ms", "reopen_round_trips", f"refresh_{args.updates}_ms",
+                       "query_p50_ms", "query_p95_ms", "python_scan_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Batch analysis against a fake Computer Vision subscription with a per-second transaction quota
+Compares calling with no throttling control, 429 retries only, and the token-bucket limiter
+
+    python -m benchmarks.bench_cv_rate_limit --images 30 --quota-tps 10
+"""
+import argparse
+import time
+
+import function_app
+from benchmarks.bench_async_analysis import seed_images
+from benchmarks.common import print_table
+from benchmarks.fakes import (
+    FakeBlobServiceClient, FakeComputerVisionClient, FakeTableServiceClient, Latency, UnlimitedRateLimiter
+)
+
+
+def run(args, limiter_factory, max_retries):
+    latency = Latency(args.round_trip_ms)
+    function_app.clients.reset()
+    function_app.metrics.reset()
+    function_app.clients.set("blob", FakeBlobServiceClient(latency))
+    function_app.clients.set("table", FakeTableServiceClient(latency))
+    cv_client = FakeComputerVisionClient(analyze_ms=args.analyze_ms, ocr_ms=args.ocr_ms, quota_tps=args.quota_tps)
+    function_app.clients.set("computer_vision", cv_client)
+    function_app.clients.set("cv_rate_limiter", limiter_factory())
+    function_app.CV_MAX_RETRIES = max_retries
+
+    image_ids = seed_images(args.images)
+    started = time.perf_counter()
+    outcomes = function_app.run_batch_analysis(image_ids, force=True, concurrency=args.concurrency)
+    elapsed = time.perf_counter() - started
+
+    snapshot = function_app.metrics.snapshot()
+    counters, timings = snapshot["counters"], snapshot["timings"]
+
+    def total_wait_s(name):
+        timing = timings.get(name)
+        return round(timing["avg_ms"] * timing["count"] / 1000, 2) if timing else 0.0
+
+    return {
+        "total_s": round(elapsed, 2),
+        "analyzed": sum(1 for outcome in outcomes if outcome["status"] == function_app.STATUS_COMPLETED),
+        "ocr_errors": counters.get("ocr.failures", 0),
+        "responses_429": cv_client.calls["throttled"],
+        "limiter_wait_s": total_wait_s("cv.throttle_wait.limiter"),
+        "retry_wait_s": total_wait_s("cv.throttle_wait.retry"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--quota-tps", type=int, default=10)
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    parser.add_argument("--analyze-ms", type=float, default=100.0)
+    parser.add_argument("--ocr-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    retries = function_app.CV_MAX_RETRIES
+    modes = [
+        ("no limit, no retry", UnlimitedRateLimiter, 0),
+        ("429 retry only", UnlimitedRateLimiter, retries),
+        ("limiter (memory) + retry", lambda: function_app.RateLimiter(
+            function_app.InMemoryTokenBucketStore(), "computer-vision", args.quota_tps), retries),
+        ("limiter (table) + retry", lambda: function_app.RateLimiter(
+            function_app.TableTokenBucketStore(), "computer-vision", args.quota_tps), retries),
+    ]
+
+    rows = []
+    for name, limiter_factory, max_retries in modes:
+        rows.append({"mode": name, **run(args, limiter_factory, max_retries)})
+    function_app.CV_MAX_RETRIES = retries
+
+    print_table(rows, ["mode", "total_s", "analyzed", "ocr_errors", "responses_429", "limiter_wait_s", "retry_wait_s"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+get_results_by_date_range latency across range sizes: one range query walking the day
+partitions serially versus concurrent per-day queries merged in order
+
+    python -m benchmarks.bench_date_range_fanout --days 1 7 30 90 --per-day 20
+"""
+import argparse
+import datetime
+import uuid
+
+from benchmarks.common import measure, print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import ImageAnalysisRepository
+
+
+def sample_analysis(image_id):
+    return {
+        "imageId": image_id,
+        "analysis": {"objects": [], "faces": [], "descriptions": [{"text": "a street", "confidence": 0.8}],
+                     "tags": [], "text": {"text_detected": False}}
+    }
+
+
+def range_query(repository, start_date, end_date, max_results):
+    """The pre-fan-out query: one PartitionKey range, pages followed one after another"""
+    table_client = repository.table_service.get_table_client(repository.table_name)
+    entities = table_client.query_entities(
+        query_filter=f"PartitionKey ge '{start_date:%Y-%m-%d}' and PartitionKey le '{end_date:%Y-%m-%d}'",
+        select=repository.SUMMARY_COLUMNS
+    )
+    results = []
+    for entity in entities:
+        if len(results) >= max_results:
+            break
+        results.append(repository._entity_to_summary(entity))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 7, 30, 90])
+    parser.add_argument("--per-day", type=int, default=20)
+    parser.add_argument("--max-results", type=int, nargs="+", default=[50, 1000])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--round-trip-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    latency = Latency()
+    repository = ImageAnalysisRepository(FakeTableServiceClient(latency), FakeBlobServiceClient(latency))
+    end_date = datetime.datetime.utcnow()
+    total_days = max(args.days)
+    day_of = {}
+    for index in range(total_days * args.per_day):
+        image_id = str(uuid.uuid4())
+        day_of[image_id] = (end_date - datetime.timedelta(days=index % total_days)).strftime("%Y-%m-%d")
+        repository.save_analysis_result(image_id, f"{image_id}.jpg", sample_analysis(image_id), "", {})
+    repository.table_service.get_table_client(repository.table_name).repartition(lambda entity: day_of[entity["imageId"]])
+    latency.round_trip = args.round_trip_ms / 1000.0
+
+    rows = []
+    for max_results in args.max_results:
+        for days in args.days:
+            start_date = end_date - datetime.timedelta(days=days - 1)
+            serial = range_query(repository, start_date, end_date, max_results)
+            fanned = repository.get_results_by_date_range(start_date, end_date, max_results, args.concurrency)
+            assert [r["imageId"] for r in serial] == [r["imageId"] for r in fanned]
+            for name, query in (("range query (old)", lambda: range_query(repository, start_date, end_date, max_results)),
+                                ("per-day fan-out", lambda: repository.get_results_by_date_range(
+                                    start_date, end_date, max_results, args.concurrency))):
+                latency.round_trips = 0
+                stats = measure(query, 5)
+                rows.append({"days": days, "max_results": max_results, "query": name, "rows": len(serial),
+                             "round_trips": latency.round_trips / 5, **stats})
+
+    print(f"{args.per_day} analyses per day, {args.round_trip_ms} ms per round trip, concurrency {args.concurrency}")
+    print_table(rows, ["days", "max_results", "query", "rows", "round_trips", "p50_ms", "p95_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Cost of analyze requests limited with ?features= against a local fake Computer Vision service
+Compares full analysis with feature subsets, incremental additions and repeats of stored features
+
+    python -m benchmarks.bench_feature_selection --images 20
+"""
+import argparse
+import time
+
+import function_app
+from benchmarks.bench_async_analysis import call_analyze, install_fakes, seed_images
+from benchmarks.common import print_table
+
+SCENARIOS = [
+    ("all features", [None]),
+    ("tags only", ["tags"]),
+    ("text only", ["text"]),
+    ("tags, then add text", ["tags", "tags,text"]),
+    ("tags, then tags again", ["tags", "tags"]),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    parser.add_argument("--analyze-ms", type=float, default=300.0)
+    parser.add_argument("--ocr-ms", type=float, default=500.0)
+    args = parser.parse_args()
+
+    rows = []
+    for name, requests in SCENARIOS:
+        install_fakes(args.round_trip_ms, args.analyze_ms, args.ocr_ms)
+        function_app.metrics.reset()
+        image_ids = seed_images(args.images)
+        cv_client = function_app.get_computer_vision_client()
+
+        step_ms = []
+        for features in requests:
+            params = {"features": features} if features else {}
+            started = time.perf_counter()
+            for image_id in image_ids:
+                status, body = call_analyze(image_id, params)
+                assert status == 200, body
+            step_ms.append(round((time.perf_counter() - started) / args.images * 1000, 1))
+
+        counters = function_app.metrics.snapshot()["counters"]
+        rows.append({
+            "scenario": name,
+            "ms_per_image": " + ".join(str(ms) for ms in step_ms),
+            "analyze_calls": cv_client.calls["analyze_image"],
+            "read_calls": cv_client.calls["read"],
+            "features_computed": counters.get("features.computed", 0),
+            "features_reused": counters.get("features.reused", 0),
+            "calls_saved": counters.get("cv.calls_saved.analyze_image", 0) + counters.get("cv.calls_saved.ocr", 0),
+            "latency_saved_ms": counters.get("cv.latency_saved_ms", 0),
+        })
+
+    print_table(rows, ["scenario", "ms_per_image", "analyze_calls", "read_calls", "features_computed",
+                       "features_reused", "calls_saved", "latency_saved_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Perceptual hashes of edited copies (re-encoded, resized, cropped, brightened) and the cost of
+finding them: multi-index hash lookups versus scanning every image's hash
+
+    python -m benchmarks.bench_near_duplicates --originals 50 --indexed 5000
+"""
+import argparse
+import io
+import random
+import statistics
+import uuid
+
+from PIL import Image, ImageDraw, ImageEnhance
+
+from benchmarks.common import measure, print_table
+from benchmarks.fakes import FakeTableServiceClient, Latency
+from function_app import (
+    NEAR_DUPLICATE_MAX_DISTANCE,
+    ImageHashIndexRepository,
+    ImageIndexRepository,
+    hamming_distance,
+    perceptual_hash,
+)
+
+
+def photo(rng, size=(800, 600)):
+    """A gradient background with random shapes, so hashes differ the way photos do"""
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    image = Image.merge("RGB", [band.rotate(rng.choice([0, 90, 180, 270])).resize(size) for band in image.split()])
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randrange(20, 200)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=color)
+    return image
+
+
+def encoded(image, quality=90):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+VARIANTS = {
+    "jpeg q=40": lambda image: encoded(image, 40),
+    "resized 50%": lambda image: encoded(image.resize((image.width // 2, image.height // 2))),
+    "resized 25%": lambda image: encoded(image.resize((image.width // 4, image.height // 4))),
+    "cropped 5%": lambda image: encoded(image.crop((image.width // 40, image.height // 40,
+                                                    image.width - image.width // 40, image.height - image.height // 40))),
+    "brightness +15%": lambda image: encoded(ImageEnhance.Brightness(image).enhance(1.15)),
+    "png": png,
+}
+
+
+def hash_of(data):
+    return perceptual_hash(Image.open(io.BytesIO(data)))
+
+
+def scan(image_index, phash, max_distance):
+    """Without a hash index: read every image's lookup row and compare hashes"""
+    table_client = image_index.table_service.get_table_client(image_index.table_name)
+    return [entity["PartitionKey"] for entity in table_client.query_entities(
+        "RowKey eq 'blob'", select=["PartitionKey", "perceptualHash"]
+    ) if hamming_distance(phash, entity["perceptualHash"]) <= max_distance]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--originals", type=int, default=50)
+    parser.add_argument("--indexed", type=int, default=5000, help="unrelated hashes in the index")
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    originals = [photo(rng) for _ in range(args.originals)]
+    original_hashes = [hash_of(encoded(image)) for image in originals]
+
+    rows = []
+    for name, variant in VARIANTS.items():
+        distances = [hamming_distance(phash, hash_of(variant(image))) for image, phash in zip(originals, original_hashes)]
+        rows.append({"variant": name, "mean_bits": round(statistics.mean(distances), 2), "max_bits": max(distances),
+                     f"found_at_{NEAR_DUPLICATE_MAX_DISTANCE}": f"{sum(d <= NEAR_DUPLICATE_MAX_DISTANCE for d in distances) / len(distances):.0%}"})
+    unrelated = [hamming_distance(a, b) for i, a in enumerate(original_hashes) for b in original_hashes[i + 1:]]
+    print("Hash distance from the original")
+    print_table(rows, ["variant", "mean_bits", "max_bits", f"found_at_{NEAR_DUPLICATE_MAX_DISTANCE}"])
+    print(f"Unrelated pairs: mean {statistics.mean(unrelated):.1f} bits, closest {min(unrelated)}, "
+          f"{sum(d <= NEAR_DUPLICATE_MAX_DISTANCE for d in unrelated)} of {len(unrelated)} within {NEAR_DUPLICATE_MAX_DISTANCE}")
+
+    latency = Latency()
+    table_service = FakeTableServiceClient(latency)
+    image_index = ImageIndexRepository(table_service)
+    hash_index = ImageHashIndexRepository(table_service)
+    for phash in original_hashes + [f"{rng.getrandbits(64):016x}" for _ in range(args.indexed)]:
+        image_id = str(uuid.uuid4())
+        image_index.save_blob_entry(image_id, f"{image_id}.jpg", {"perceptual_hash": phash})
+        hash_index.save(image_id, phash, f"{image_id}.jpg")
+    latency.round_trip = args.round_trip_ms / 1000.0
+
+    rows = []
+    query = original_hashes[0]
+    for max_distance in (0, NEAR_DUPLICATE_MAX_DISTANCE, hash_index.MAX_SEARCH_DISTANCE):
+        latency.round_trips = 0
+        found = scan(image_index, query, max_distance)
+        rows.append({"search": "scan lookup rows", "max_distance": max_distance, "found": len(found),
+                     "round_trips": latency.round_trips, "p50_ms": measure(lambda: scan(image_index, query, max_distance), 1)["p50_ms"]})
+
+        latency.round_trips = 0
+        found = hash_index.find_similar(query, max_distance)
+        rows.append({"search": "hash index", "max_distance": max_distance, "found": len(found),
+                     "round_trips": latency.round_trips, "p50_ms": measure(lambda: hash_index.find_similar(query, max_distance), 5)["p50_ms"]})
+
+    print(f"\n{len(original_hashes) + args.indexed} indexed images, {args.round_trip_ms} ms round trips")
+    print_table(rows, ["search", "max_distance", "found", "round_trips", "p50_ms"])
+
+
+if __name__ == "__main__":
+    main()
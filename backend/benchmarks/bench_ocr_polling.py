@@ -0,0 +1,57 @@
+"""
+OCR wait time: adaptive polling vs the old fixed one-second loop
+For each simulated OCR duration, reports how long extract_text waits and how many polls it makes
+
+    python -m benchmarks.bench_ocr_polling --ocr-ms 150 400 1200 3000
+"""
+import argparse
+import asyncio
+import time
+
+import function_app
+from azure.cognitiveservices.vision.computervision.models import OperationStatusCodes
+from benchmarks.common import print_table
+from benchmarks.fakes import FakeComputerVisionClient, UnlimitedRateLimiter
+
+
+def fixed_interval_wait(cv_client):
+    """The pre-change loop: up to 10 polls, one second apart"""
+    operation_id = cv_client.read("https://fake/blob.jpg", raw=True).headers["Operation-Location"].split("/")[-1]
+    polls = 0
+    for _ in range(10):
+        read_result = cv_client.get_read_result(operation_id)
+        polls += 1
+        if read_result.status in (OperationStatusCodes.succeeded, OperationStatusCodes.failed):
+            break
+        time.sleep(1)
+    return polls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ocr-ms", type=float, nargs="+", default=[150, 400, 1200, 3000])
+    args = parser.parse_args()
+
+    function_app.clients.set("cv_rate_limiter", UnlimitedRateLimiter())
+    loop = function_app.get_poll_loop()
+    rows = []
+    for ocr_ms in args.ocr_ms:
+        cv_client = FakeComputerVisionClient(ocr_ms=ocr_ms)
+
+        started = time.perf_counter()
+        polls = fixed_interval_wait(cv_client)
+        rows.append({"ocr_ms": ocr_ms, "strategy": "fixed 1s", "wait_ms": round((time.perf_counter() - started) * 1000), "polls": polls})
+
+        cv_client.calls.clear()
+        started = time.perf_counter()
+        asyncio.run_coroutine_threadsafe(function_app.extract_text(cv_client, "https://fake/blob.jpg"), loop).result()
+        rows.append({"ocr_ms": ocr_ms, "strategy": "adaptive", "wait_ms": round((time.perf_counter() - started) * 1000),
+                     "polls": cv_client.calls["get_read_result"]})
+
+    print_table(rows, ["ocr_ms", "strategy", "wait_ms", "polls"])
+    print()
+    print("ocr.wait histogram:", function_app.metrics.snapshot()["timings"]["ocr.wait"]["histogram"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Sustained analysis save throughput by RESULTS_PARTITION_SHARDS
+The in-memory table serves each partition's writes one at a time at --partition-writes-per-second
+(Azure Table Storage targets about 2000 entities/s per partition; the default is scaled down so
+runs stay short). Pass --connection-string to run against a local emulator such as Azurite instead
+
+    python -m benchmarks.bench_partition_sharding --shards 1 4 16 --saves 600 --writers 32
+    python -m benchmarks.bench_partition_sharding --connection-string "UseDevelopmentStorage=true"
+"""
+import argparse
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import function_app
+from benchmarks.common import print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+
+
+def sample_analysis(image_id):
+    return {
+        "imageId": image_id,
+        "analysis": {"objects": [], "faces": [], "descriptions": [{"text": "a street", "confidence": 0.8}],
+                     "tags": [{"name": "street", "confidence": 0.9}], "text": {"text_detected": False}}
+    }
+
+
+def services(args):
+    if args.connection_string:
+        from azure.data.tables import TableServiceClient
+        from azure.storage.blob import BlobServiceClient
+        return (TableServiceClient.from_connection_string(args.connection_string),
+                BlobServiceClient.from_connection_string(args.connection_string))
+    latency = Latency(args.round_trip_ms)
+    return FakeTableServiceClient(latency, args.partition_writes_per_second), FakeBlobServiceClient(latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--saves", type=int, default=600)
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--partition-writes-per-second", type=float, default=200.0)
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    parser.add_argument("--connection-string", help="Storage connection string of a table/blob emulator")
+    args = parser.parse_args()
+
+    rows = []
+    for shards in args.shards:
+        function_app.RESULTS_PARTITION_SHARDS = shards
+        function_app.clients.reset()
+        function_app.metrics.reset()
+        table_service, blob_service = services(args)
+        repository = function_app.ImageAnalysisRepository(table_service, blob_service)
+        image_ids = [str(uuid.uuid4()) for _ in range(args.saves)]
+
+        def save(image_id):
+            return repository.save_analysis_result(image_id, f"{image_id}.jpg", sample_analysis(image_id), "", {})
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.writers) as executor:
+            saved = sum(executor.map(save, image_ids))
+        elapsed = time.perf_counter() - started
+
+        counters = function_app.metrics.snapshot()["counters"]
+        rows.append({
+            "shards": shards,
+            "saved": saved,
+            "seconds": round(elapsed, 2),
+            "saves_per_s": round(saved / elapsed, 1),
+            "rollup_conflicts": counters.get("stats.rollup_conflicts", 0),
+        })
+
+    target = "emulator" if args.connection_string else f"{args.partition_writes_per_second:g} writes/s per partition"
+    print(f"{args.writers} writers, {target}")
+    print_table(rows, ["shards", "saved", "seconds", "saves_per_s", "rollup_conflicts"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+GET /images/{imageId}/results under front-end polling: Zipf-distributed re-reads of the same
+images with no cache, with the response cache, and with the cache plus If-None-Match revalidation
+
+    python -m benchmarks.bench_results_cache --images 2000 --requests 5000
+"""
+import argparse
+import itertools
+import random
+import time
+import uuid
+
+import azure.functions as func
+
+from benchmarks.common import print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import ImageAnalysisRepository, ResponseCache, clients, get_analysis_results
+import function_app
+
+handler = get_analysis_results.build().get_user_function()
+
+
+def request(image_id, etag=None):
+    headers = {"If-None-Match": etag} if etag else {}
+    return handler(func.HttpRequest("GET", f"/api/images/{image_id}/results", headers=headers,
+                                    route_params={"imageId": image_id}, body=b""))
+
+
+def zipf_ids(rng, image_ids, count, skew):
+    weights = [1 / (rank + 1) ** skew for rank in range(len(image_ids))]
+    return rng.choices(image_ids, weights=weights, k=count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of the polling pattern")
+    parser.add_argument("--max-entries", type=int, default=500)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    latency = Latency()
+    clients.set("table", FakeTableServiceClient(latency))
+    clients.set("blob", FakeBlobServiceClient(latency))
+    repository = ImageAnalysisRepository()
+    image_ids = [str(uuid.uuid4()) for _ in range(args.images)]
+    for image_id in image_ids:
+        repository.save_analysis_result(image_id, f"{image_id}.jpg", {
+            "imageId": image_id, "features": ["tags", "caption"],
+            "analysis": {"description": {"captions": [{"text": "a dog on a beach", "confidence": 0.9}]},
+                         "tags": [{"name": f"tag{i}", "confidence": 0.5} for i in range(25)]}
+        }, "", {})
+    latency.round_trip = args.round_trip_ms / 1000.0
+
+    rows = []
+    for label, ttl, revalidate in (("no cache", 0, False), ("response cache", 30, False),
+                                   ("cache + If-None-Match", 30, True)):
+        function_app.results_cache = cache = ResponseCache(args.max_entries, 64 * 1024 * 1024, ttl)
+        # Each client remembers the ETags it has seen, as a browser does
+        etags = {}
+        statuses = itertools.count()
+        sequence = zipf_ids(random.Random(args.seed), image_ids, args.requests, args.skew)
+        latency.round_trips = 0
+        timings = []
+        not_modified = 0
+        for image_id in sequence:
+            started = time.perf_counter()
+            response = request(image_id, etags.get(image_id) if revalidate else None)
+            timings.append(time.perf_counter() - started)
+            etags[image_id] = response.headers.get("ETag")
+            not_modified += response.status_code == 304
+            # A status change every 500 requests invalidates one image
+            if next(statuses) % 500 == 499:
+                repository.update_status(image_id, "completed")
+        timings.sort()
+        stats = cache.stats()
+        rows.append({"mode": label, "requests": len(sequence), "round_trips": latency.round_trips,
+                     "p50_ms": round(timings[len(timings) // 2] * 1000, 3),
+                     "p95_ms": round(timings[int(len(timings) * 0.95)] * 1000, 3),
+                     "hit_ratio": stats["hitRatio"] if ttl else "-", "evictions": stats["evictions"],
+                     "not_modified": not_modified, "cache_mb": round(stats["bytes"] / 1024 / 1024, 2)})
+
+    print(f"{args.images} images, Zipf s={args.skew}, {args.max_entries} cache entries, "
+          f"{args.round_trip_ms} ms round trips")
+    print_table(rows, ["mode", "requests", "round_trips", "p50_ms", "p95_ms", "hit_ratio", "evictions",
+                       "not_modified", "cache_mb"])
+
+
+if __name__ == "__main__":
+    main()
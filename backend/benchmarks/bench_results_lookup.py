@@ -0,0 +1,70 @@
+"""
+GET /images/{imageId}/results lookup latency as the results table grows
+Compares the imageId-keyed point read with the old `imageId eq` table scan
+
+    python -m benchmarks.bench_results_lookup --sizes 1000 10000 50000
+"""
+import argparse
+import random
+import uuid
+
+from benchmarks.common import measure, print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import ImageAnalysisRepository
+
+
+def sample_analysis(image_id):
+    return {
+        "imageId": image_id,
+        "analysis": {
+            "objects": [{"name": "person", "confidence": 0.9}],
+            "faces": [],
+            "descriptions": [{"text": "a person standing", "confidence": 0.8}],
+            "tags": [{"name": "person", "confidence": 0.95}],
+            "text": {"text_detected": False}
+        }
+    }
+
+
+def legacy_scan(repository, image_id):
+    """The pre-index lookup: filter on a non-key property across every partition"""
+    table_client = repository.table_service.get_table_client(repository.table_name)
+    for entity in table_client.query_entities(query_filter=f"imageId eq '{image_id}'"):
+        return entity
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    parser.add_argument("--lookups", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        latency = Latency()
+        repository = ImageAnalysisRepository(FakeTableServiceClient(latency), FakeBlobServiceClient(latency))
+        image_ids = [str(uuid.uuid4()) for _ in range(size)]
+        for image_id in image_ids:
+            file_metadata = {"fileSize": 1024, "dimensions": "640x480", "format": "jpeg"}
+            repository.save_analysis_result(image_id, f"{image_id}.jpg", sample_analysis(image_id), "", file_metadata)
+
+        # Spread the rows over 30 daily partitions like a month of traffic
+        results_table = repository.table_service.get_table_client(repository.table_name)
+        days = {image_id: f"2025-08-{index % 30 + 1:02d}" for index, image_id in enumerate(image_ids)}
+        results_table.repartition(lambda entity: days[entity["imageId"]])
+
+        latency.round_trip = args.round_trip_ms / 1000.0
+        targets = random.sample(image_ids, min(args.lookups, size))
+        for name, lookup in (("point read", repository.get_analysis_result), ("legacy scan", lambda i: legacy_scan(repository, i))):
+            remaining = iter(targets)
+            latency.round_trips = 0
+            stats = measure(lambda: lookup(next(remaining)), len(targets))
+            rows.append({"rows": size, "lookup": name, **stats, "round_trips": latency.round_trips / len(targets)})
+
+    print_table(rows, ["rows", "lookup", "p50_ms", "p95_ms", "max_ms", "round_trips"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+GET /results/search with selective filters: Table-side filtering and cursors versus
+fetching max_results rows and filtering them in Python
+
+    python -m benchmarks.bench_search_filters --rows 5000 --max-results 50
+"""
+import argparse
+import datetime
+import uuid
+
+from benchmarks.common import measure, print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import ImageAnalysisRepository
+
+# How often each filter matches among the generated analyses
+FACE_EVERY = 20
+TEXT_EVERY = 3
+
+
+def sample_analysis(image_id, index):
+    return {
+        "imageId": image_id,
+        "analysis": {
+            "objects": [{"name": "car", "confidence": 0.9}] * (index % 2),
+            "faces": [{"age": 30}] * (index % FACE_EVERY == 0),
+            "descriptions": [{"text": "a street", "confidence": 0.8}],
+            "tags": [],
+            "text": {"text_detected": index % TEXT_EVERY == 0}
+        }
+    }
+
+
+def python_filtered(repository, start_date, end_date, filters, max_results):
+    """The pre-pushdown search: first max_results rows of the range, then filtered"""
+    results = repository.get_results_by_date_range(start_date, end_date, max_results)
+    checks = {
+        "has_faces": lambda summary: summary["faceCount"] > 0,
+        "has_objects": lambda summary: summary["objectCount"] > 0,
+        "has_text": lambda summary: summary["hasText"],
+    }
+    return [r for r in results if all(checks[name](r["summary"]) for name in filters)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--max-results", type=int, default=50)
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    latency = Latency()
+    repository = ImageAnalysisRepository(FakeTableServiceClient(latency), FakeBlobServiceClient(latency))
+    end_date = datetime.datetime.utcnow()
+    start_date = end_date - datetime.timedelta(days=args.days - 1)
+    day_of = {}
+    for index in range(args.rows):
+        image_id = str(uuid.uuid4())
+        day_of[image_id] = (end_date - datetime.timedelta(days=index * args.days // args.rows)).strftime("%Y-%m-%d")
+        repository.save_analysis_result(image_id, f"{image_id}.jpg", sample_analysis(image_id, index), "", {})
+    repository.table_service.get_table_client(repository.table_name).repartition(lambda entity: day_of[entity["imageId"]])
+    latency.round_trip = args.round_trip_ms / 1000.0
+
+    rows = []
+    for filters in (["has_text"], ["has_faces"], ["has_faces", "has_text"]):
+        latency.round_trips = 0
+        old = python_filtered(repository, start_date, end_date, filters, args.max_results)
+        old_trips = latency.round_trips
+        old_stats = measure(lambda: python_filtered(repository, start_date, end_date, filters, args.max_results), 3)
+
+        latency.round_trips = 0
+        results, cursor = repository.search_results(start_date, end_date, filters, args.max_results)
+        new_trips = latency.round_trips
+        new_stats = measure(lambda: repository.search_results(start_date, end_date, filters, args.max_results), 3)
+
+        # Walk every page to show the whole result set is reachable
+        total, pages = len(results), 1
+        while cursor:
+            page, cursor = repository.search_results(None, None, max_results=args.max_results, cursor=cursor)
+            total += len(page)
+            pages += 1
+
+        label = "+".join(filters)
+        rows.append({"filters": label, "search": "python filter (old)", "returned": len(old),
+                     "round_trips": old_trips, "p50_ms": old_stats["p50_ms"], "all_matches": "-"})
+        rows.append({"filters": label, "search": "table filter", "returned": len(results),
+                     "round_trips": new_trips, "p50_ms": new_stats["p50_ms"], "all_matches": f"{total} in {pages} pages"})
+
+    print(f"{args.rows} analyses over {args.days} days, max_results={args.max_results}")
+    print_table(rows, ["filters", "search", "returned", "round_trips", "p50_ms", "all_matches"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+GET /results/stats cost over long periods: per-day rollup reads versus scanning analyses
+The scan is the old implementation, which also stopped counting after 1000 analyses
+
+    python -m benchmarks.bench_stats_rollup --days 7 30 90 --per-day 50
+"""
+import argparse
+import datetime
+import uuid
+
+from benchmarks.common import measure, print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import ImageAnalysisRepository, days_between
+
+
+def sample_analysis(image_id, index):
+    return {
+        "imageId": image_id,
+        "analysis": {
+            "objects": [{"name": "car", "confidence": 0.9}] * (index % 4),
+            "faces": [{"age": 30}] * (index % 3 == 0),
+            "descriptions": [{"text": "a street", "confidence": 0.5 + index % 5 / 10}],
+            "tags": [{"name": "street", "confidence": 0.95}],
+            "text": {"text_detected": index % 2 == 0}
+        }
+    }
+
+
+def scan_totals(repository, start_date, end_date):
+    """The pre-rollup computation: fetch up to 1000 summaries and count in Python"""
+    results = repository.get_results_by_date_range(start_date, end_date, 1000)
+    return {
+        "images": len(results),
+        "totalFaces": sum(r["summary"]["faceCount"] for r in results),
+        "totalObjects": sum(r["summary"]["objectCount"] for r in results),
+    }
+
+
+def rollup_totals(repository, start_date, end_date):
+    totals = {"images": 0, "totalFaces": 0, "totalObjects": 0}
+    for day_totals in repository.stats.get_days(days_between(start_date, end_date)).values():
+        for field in totals:
+            totals[field] += day_totals[field]
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, nargs="+", default=[7, 30, 90])
+    parser.add_argument("--per-day", type=int, default=50)
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    latency = Latency()
+    repository = ImageAnalysisRepository(FakeTableServiceClient(latency), FakeBlobServiceClient(latency))
+    results_table = repository.table_service.get_table_client(repository.table_name)
+    stats_table = repository.table_service.get_table_client(repository.stats.table_name)
+
+    # Save everything today, then move rows and rollups back over the period
+    end_date = datetime.datetime.utcnow()
+    total_days = max(args.days) + 1
+    rows = total_days * args.per_day
+    day_of = {}
+    for index in range(rows):
+        image_id = str(uuid.uuid4())
+        day_of[image_id] = (end_date - datetime.timedelta(days=index % total_days)).strftime("%Y-%m-%d")
+        repository.save_analysis_result(image_id, f"{image_id}.jpg", sample_analysis(image_id, index), "", {})
+    results_table.repartition(lambda entity: day_of[entity["imageId"]])
+    for entity in results_table.list_entities():
+        entity["analysisTime"] = entity["PartitionKey"] + entity["analysisTime"][10:]
+        results_table.upsert_entity(entity)
+    stats_table.delete_table()
+    repository.stats.rebuild(results_table)
+
+    latency.round_trip = args.round_trip_ms / 1000.0
+    table = []
+    for days in args.days:
+        start_date = end_date - datetime.timedelta(days=days)
+        for name, totals in (("scan (old)", scan_totals), ("rollup", rollup_totals)):
+            latency.round_trips = 0
+            result = totals(repository, start_date, end_date)
+            round_trips = latency.round_trips
+            stats = measure(lambda: totals(repository, start_date, end_date), 5)
+            table.append({"days": days, "method": name, "images_counted": result["images"],
+                          "round_trips": round_trips, **stats})
+
+    print(f"{args.per_day} analyses per day")
+    print_table(table, ["days", "method", "images_counted", "round_trips", "p50_ms", "p95_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Analysis status updates: round trips per update (the original read-scan-replace path versus one
+MERGE), concurrent updates for a batch of images, and stale writes caught by ETag conditions
+
+    python -m benchmarks.bench_status_updates --images 500 --history 2000
+"""
+import argparse
+import json
+import time
+import uuid
+
+from benchmarks.common import print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import (
+    STATUS_COMPLETED,
+    STATUS_PENDING,
+    STATUS_RUNNING,
+    ImageAnalysisRepository,
+    StatusConflictError,
+    UpdateMode,
+)
+
+
+def original_update_status(repository, image_id, status):
+    """The first version: find the result by scanning for its imageId (twice), then replace the row"""
+    table_client = repository.table_service.get_table_client(repository.table_name)
+    found = [entity for entity in table_client.query_entities(f"imageId eq '{image_id}'")]
+    if not found:
+        return False
+    repository.load_document(found[0])
+    for entity in table_client.query_entities(f"imageId eq '{image_id}'"):
+        entity["status"] = status
+        table_client.update_entity(entity, mode=UpdateMode.REPLACE)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=500, help="images updated together")
+    parser.add_argument("--history", type=int, default=2000, help="analyses already stored")
+    parser.add_argument("--round-trip-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    latency = Latency()
+    repository = ImageAnalysisRepository(FakeTableServiceClient(latency), FakeBlobServiceClient(latency))
+    analysed = []
+    for _ in range(args.history):
+        image_id = str(uuid.uuid4())
+        repository.save_analysis_result(image_id, f"{image_id}.jpg", {"imageId": image_id, "analysis": {}}, "", {})
+        analysed.append(image_id)
+    latency.round_trip = args.round_trip_ms / 1000.0
+
+    rows = []
+    target = analysed[len(analysed) // 2]
+    for label, update in (("read + scan + replace (original)", lambda: original_update_status(repository, target, STATUS_RUNNING)),
+                          ("single MERGE", lambda: repository.update_status(target, STATUS_RUNNING))):
+        latency.round_trips = 0
+        started = time.perf_counter()
+        update()
+        rows.append({"update": label, "images": 1, "round_trips": latency.round_trips,
+                     "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+    batch = [str(uuid.uuid4()) for _ in range(args.images)]
+    latency.round_trips = 0
+    started = time.perf_counter()
+    for image_id in batch:
+        repository.update_status(image_id, STATUS_PENDING)
+    rows.append({"update": "update_status in a loop", "images": len(batch), "round_trips": latency.round_trips,
+                 "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+    latency.round_trips = 0
+    started = time.perf_counter()
+    etags = repository.update_statuses(batch, STATUS_PENDING)
+    rows.append({"update": "update_statuses (concurrent)", "images": len(batch), "round_trips": latency.round_trips,
+                 "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+    print_table(rows, ["update", "images", "round_trips", "elapsed_ms"])
+
+    # Stale jobs: each image is analyzed after its job was queued, then the job's "running" write arrives
+    latency.round_trip = 0
+    index_client = repository.table_service.get_table_client(repository.index.table_name)
+    for image_id in batch:
+        index_client.upsert_entity({"PartitionKey": image_id, "RowKey": repository.index.LATEST_ROW_KEY,
+                                    "status": STATUS_COMPLETED}, mode=UpdateMode.MERGE)
+    overwritten = 0
+    for image_id in batch:
+        repository.update_status(image_id, STATUS_RUNNING)
+        overwritten += 1
+    for image_id in batch:
+        index_client.upsert_entity({"PartitionKey": image_id, "RowKey": repository.index.LATEST_ROW_KEY,
+                                    "status": STATUS_COMPLETED}, mode=UpdateMode.MERGE)
+    rejected = 0
+    for image_id in batch:
+        try:
+            repository.update_status(image_id, STATUS_RUNNING, etag=etags[image_id])
+        except StatusConflictError:
+            rejected += 1
+    statuses = {repository.get_status(image_id)["status"] for image_id in batch}
+    print(json.dumps({"stale_writes": len(batch), "completed_overwritten_without_etag": overwritten,
+                      "rejected_with_etag": rejected, "statuses_after": sorted(statuses)}))
+
+
+if __name__ == "__main__":
+    main()
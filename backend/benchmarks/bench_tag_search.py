@@ -0,0 +1,101 @@
+"""
+GET /results/search?tag=...&object=...: term index lookups and intersections versus scanning
+every analysis and parsing its document for the tag or object name
+
+    python -m benchmarks.bench_tag_search --images 1000 --max-results 50
+"""
+import argparse
+import random
+import uuid
+
+from benchmarks.common import measure, print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import ImageAnalysisRepository, TermIndexRepository
+
+TAGS = [f"tag{rank}" for rank in range(200)]
+OBJECTS = [f"object{rank}" for rank in range(30)]
+
+
+def sample_analysis(image_id, rng):
+    # Zipf-like popularity: a few tags are on most images, most tags are rare
+    tags = {rng.choices(TAGS, weights=[1 / (rank + 1) for rank in range(len(TAGS))])[0] for _ in range(12)}
+    objects = {rng.choices(OBJECTS, weights=[1 / (rank + 1) for rank in range(len(OBJECTS))])[0] for _ in range(3)}
+    return {
+        "imageId": image_id,
+        "analysis": {
+            "objects": [{"name": name, "confidence": 0.8} for name in objects],
+            "faces": [],
+            "descriptions": [{"text": "a scene", "confidence": 0.8}],
+            "tags": [{"name": name, "confidence": round(rng.uniform(0.5, 1.0), 4)} for name in sorted(tags)],
+            "text": {"text_detected": False}
+        }
+    }
+
+
+def scan(repository, tags, objects, max_results):
+    """The pre-index search: read every history row and parse its document"""
+    table_client = repository.table_service.get_table_client(repository.table_name)
+    found = []
+    for entity in table_client.list_entities(select=["imageId", "analysisBlob"]):
+        analysis = repository.documents.load(entity["analysisBlob"])["analysis"]
+        names = {tag["name"] for tag in analysis["tags"]}
+        object_names = {obj["name"] for obj in analysis["objects"]}
+        if set(tags) <= names and set(objects) <= object_names:
+            found.append(entity["imageId"])
+            if len(found) >= max_results:
+                break
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--max-results", type=int, default=50)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    latency = Latency()
+    repository = ImageAnalysisRepository(FakeTableServiceClient(latency), FakeBlobServiceClient(latency))
+    for _ in range(args.images):
+        image_id = str(uuid.uuid4())
+        repository.save_analysis_result(image_id, f"{image_id}.jpg", sample_analysis(image_id, rng), "", {})
+    entries = len(repository.table_service.get_table_client(repository.terms.table_name))
+    latency.round_trip = args.round_trip_ms / 1000.0
+
+    queries = [
+        (["tag0"], []),
+        (["tag150"], []),
+        (["tag0", "tag40"], []),
+        (["tag1"], ["object3"]),
+    ]
+    rows = []
+    for tags, objects in queries:
+        keys = [TermIndexRepository.key("tag", tag) for tag in tags] + [TermIndexRepository.key("object", name) for name in objects]
+        label = "+".join(tags + objects)
+
+        latency.round_trips = 0
+        old = scan(repository, tags, objects, args.max_results)
+        rows.append({"query": label, "search": "scan documents (old)", "returned": len(old),
+                     "round_trips": latency.round_trips, "p50_ms": measure(lambda: scan(repository, tags, objects, args.max_results), 1)["p50_ms"],
+                     "all_matches": "-"})
+
+        latency.round_trips = 0
+        results, cursor = repository.terms.search(keys, max_results=args.max_results)
+        trips = latency.round_trips
+        stats = measure(lambda: repository.terms.search(keys, max_results=args.max_results), 5)
+        total, pages = len(results), 1
+        while cursor:
+            page, cursor = repository.terms.search(None, max_results=args.max_results, cursor=cursor)
+            total += len(page)
+            pages += 1
+        rows.append({"query": label, "search": "term index", "returned": len(results),
+                     "round_trips": trips, "p50_ms": stats["p50_ms"], "all_matches": f"{total} in {pages} pages"})
+
+    print(f"{args.images} images, {entries} index entries ({entries / args.images:.1f} per image), max_results={args.max_results}")
+    print_table(rows, ["query", "search", "returned", "round_trips", "p50_ms", "all_matches"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+GET /results/text-search: OCR full-text index versus downloading every analysis document
+and matching its text lines, plus what indexing adds to a save
+
+    python -m benchmarks.bench_text_search --images 500 --lines 40
+"""
+import argparse
+import random
+import time
+import uuid
+
+from benchmarks.common import measure, print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient, Latency
+from function_app import ImageAnalysisRepository, TextIndexRepository
+
+WORDS = [f"word{rank}" for rank in range(2000)]
+PHRASES = ["open daily 9am", "no parking", "fire exit"]
+
+
+def sample_analysis(image_id, rng, lines):
+    # Zipf-like vocabulary, with a known phrase on some images
+    weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+    text = [" ".join(rng.choices(WORDS, weights=weights, k=rng.randint(2, 8))) for _ in range(lines)]
+    for phrase, every in zip(PHRASES, (5, 25, 100)):
+        if rng.randrange(every) == 0:
+            text[rng.randrange(lines)] += f" {phrase.upper()}"
+    return {
+        "imageId": image_id,
+        "analysis": {
+            "objects": [], "faces": [], "tags": [],
+            "descriptions": [{"text": "a storefront", "confidence": 0.8}],
+            "text": {
+                "text_detected": True,
+                "total_lines": lines,
+                "extracted_text": [{"text": line, "bounding_box": [0, 20 * i, 300, 20 * i, 300, 20 * i + 18, 0, 20 * i + 18]}
+                                   for i, line in enumerate(text)]
+            }
+        }
+    }
+
+
+def scan(repository, phrase):
+    """The pre-index search: download every document and look for the phrase in its lines"""
+    words = TextIndexRepository.tokenize(phrase)
+    table_client = repository.table_service.get_table_client(repository.table_name)
+    found = []
+    for entity in table_client.list_entities(select=["imageId", "analysisBlob"]):
+        lines = TextIndexRepository.ocr_lines(repository.documents.load(entity["analysisBlob"]))
+        if any(" ".join(words) in " ".join(TextIndexRepository.tokenize(line["text"])) for line in lines):
+            found.append(entity["imageId"])
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--lines", type=int, default=40)
+    parser.add_argument("--max-results", type=int, default=20)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    latency = Latency(args.round_trip_ms)
+    repository = ImageAnalysisRepository(FakeTableServiceClient(latency), FakeBlobServiceClient(latency))
+    save_ms = []
+    for _ in range(args.images):
+        image_id = str(uuid.uuid4())
+        analysis = sample_analysis(image_id, rng, args.lines)
+        started = time.perf_counter()
+        repository.save_analysis_result(image_id, f"{image_id}.jpg", analysis, "", {})
+        save_ms.append((time.perf_counter() - started) * 1000)
+    entries = len(repository.table_service.get_table_client(repository.text.table_name))
+
+    rows = []
+    for phrase in PHRASES:
+        latency.round_trips = 0
+        old = scan(repository, phrase)
+        old_trips = latency.round_trips
+        rows.append({"query": phrase, "search": "scan documents (old)", "matches": len(old),
+                     "round_trips": old_trips, "p50_ms": measure(lambda: scan(repository, phrase), 1)["p50_ms"]})
+
+        latency.round_trips = 0
+        results, _, _ = repository.text.search(phrase, max_results=args.max_results)
+        trips = latency.round_trips
+        stats = measure(lambda: repository.text.search(phrase, max_results=args.max_results), 5)
+        phrase_hits = sum(1 for result in results if result["phrase_matches"])
+        rows.append({"query": phrase, "search": f"text index (top {args.max_results})",
+                     "matches": f"{phrase_hits} phrase / {len(results)}", "round_trips": trips, "p50_ms": stats["p50_ms"]})
+
+    save_ms.sort()
+    print(f"{args.images} images x {args.lines} OCR lines, {entries} index entries ({entries / args.images:.0f} per image), "
+          f"save p50 {save_ms[len(save_ms) // 2]:.1f} ms at {args.round_trip_ms:g} ms per round trip")
+    print_table(rows, ["query", "search", "matches", "round_trips", "p50_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Peak Python memory of one upload: buffered /images/upload vs chunked /images/upload/stream
+The request object is built inside the measured region, as the Functions worker builds it from
+the host's message, so peak_x_file counts the request body as well as the handler's own copies
+(1.0 is the floor for any route that receives the file as an HttpRequest)
+
+    python -m benchmarks.bench_upload_memory --sizes-mb 2 8 32
+"""
+import argparse
+import io
+import json
+import os
+import time
+import tracemalloc
+
+import azure.functions as func
+from PIL import Image
+
+import function_app
+from benchmarks.common import print_table
+from benchmarks.fakes import FakeBlobServiceClient, FakeTableServiceClient
+
+BOUNDARY = "bench-boundary"
+
+
+def png_of_size(size_bytes):
+    """Random-noise PNG (barely compressible) of roughly size_bytes"""
+    side = min(function_app.MAX_IMAGE_DIMENSION, int((size_bytes / 3) ** 0.5))
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def multipart_request(url, data):
+    body = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"bench.png\"\r\n"
+            f"Content-Type: image/png\r\n\r\n").encode() + data + f"\r\n--{BOUNDARY}--\r\n".encode()
+    return func.HttpRequest("POST", url, body=body,
+                            headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+
+
+def raw_request(url, data):
+    # A fresh copy of the body, as the worker decodes one from the host's message
+    return func.HttpRequest("POST", url, body=bytes(memoryview(data)), headers={"Content-Type": "image/png", "X-File-Name": "bench.png"})
+
+
+def measure_peak(handler, build_request, url, data):
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = handler(build_request(url, data))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return response.status_code, json.loads(response.get_body()), peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[2, 8, 32])
+    args = parser.parse_args()
+
+    function_app.clients.reset()
+    function_app.clients.set("blob", FakeBlobServiceClient(discard_data=True))
+    function_app.clients.set("table", FakeTableServiceClient())
+
+    modes = [
+        ("buffered multipart", function_app.upload_image, multipart_request, "/api/images/upload"),
+        ("chunked multipart", function_app.upload_image_stream, multipart_request, "/api/images/upload/stream"),
+        ("chunked raw body", function_app.upload_image_stream, raw_request, "/api/images/upload/stream"),
+    ]
+
+    rows = []
+    for size_mb in args.sizes_mb:
+        data = png_of_size(int(size_mb * 1024 * 1024))
+        for name, route, build_request, url in modes:
+            handler = route.build().get_user_function()
+            status, body, peak, elapsed = measure_peak(handler, build_request, url, data)
+            rows.append({
+                "file_mb": round(len(data) / (1024 * 1024), 1),
+                "mode": name,
+                "status": status if body.get("success") else f"{status} ({body['error'][:24]})",
+                "peak_mb": round(peak / (1024 * 1024), 2),
+                "peak_x_file": round(peak / len(data), 2),
+                "ms": round(elapsed * 1000, 1),
+            })
+
+    print_table(rows, ["file_mb", "mode", "status", "peak_mb", "peak_x_file", "ms"])
+    print(f"\nchunk size: {function_app.STREAM_CHUNK_BYTES // 1024} KB")
+
+
+if __name__ == "__main__":
+    main()
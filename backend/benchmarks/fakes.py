@@ -0,0 +1,763 @@
+"""
+In-memory stand-ins for the Azure services the function app talks to
+They mimic the SDK surface the app uses closely enough to run the repositories offline,
+and charge a configurable delay per round trip so benchmarks reflect request counts
+"""
+import collections
+import copy
+import datetime
+import io
+import itertools
+import json
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.core.paging import ItemPaged
+from azure.data.tables import RequestTooLargeError, TableEntity, TableTransactionError, UpdateMode
+
+# Azure Table Storage returns at most 1000 entities per page
+MAX_PAGE_SIZE = 1000
+# String properties hold at most 64 KiB of UTF-16; a transaction's payload is at most 4 MiB
+MAX_STRING_PROPERTY = 32 * 1024
+MAX_TRANSACTION_PAYLOAD = 4 * 1024 * 1024
+
+
+class Latency:
+    """Simulated network cost shared by all fakes of one benchmark run"""
+
+    def __init__(self, round_trip_ms=0.0):
+        self.round_trip = round_trip_ms / 1000.0
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def charge(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.round_trip:
+            time.sleep(self.round_trip)
+
+
+# --- OData filter evaluation ------------------------------------------------
+
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|'((?:[^']|'')*)'|(-?\d+(?:\.\d+)?)|(\w+))")
+_COMPARISONS = {
+    "eq": lambda a, b: a == b,
+    "ne": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "ge": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "le": lambda a, b: a is not None and a <= b,
+}
+
+
+def _tokenize(query_filter):
+    tokens = []
+    position = 0
+    query_filter = query_filter.strip()
+    while position < len(query_filter):
+        match = _TOKEN.match(query_filter, position)
+        if not match:
+            raise ValueError(f"Unsupported filter syntax near: {query_filter[position:]!r}")
+        position = match.end()
+        open_paren, close_paren, string, number, word = match.groups()
+        if open_paren:
+            tokens.append(("(", None))
+        elif close_paren:
+            tokens.append((")", None))
+        elif string is not None:
+            tokens.append(("value", string.replace("''", "'")))
+        elif number is not None:
+            tokens.append(("value", float(number) if "." in number else int(number)))
+        elif word in ("true", "false"):
+            tokens.append(("value", word == "true"))
+        elif word in ("and", "or", "not") or word in _COMPARISONS:
+            tokens.append((word, None))
+        else:
+            tokens.append(("name", word))
+    return tokens
+
+
+def compile_filter(query_filter):
+    """Compile the subset of OData the app emits into a predicate over entity dicts"""
+    if not query_filter:
+        return lambda entity: True
+
+    tokens = _tokenize(query_filter)
+    position = 0
+
+    def peek():
+        return tokens[position][0] if position < len(tokens) else None
+
+    def take(kind=None):
+        nonlocal position
+        token = tokens[position]
+        if kind and token[0] != kind:
+            raise ValueError(f"Expected {kind}, got {token[0]} in {query_filter!r}")
+        position += 1
+        return token
+
+    def parse_or():
+        left = parse_and()
+        while peek() == "or":
+            take()
+            right = parse_and()
+            left = (lambda l, r: lambda e: l(e) or r(e))(left, right)
+        return left
+
+    def parse_and():
+        left = parse_unary()
+        while peek() == "and":
+            take()
+            right = parse_unary()
+            left = (lambda l, r: lambda e: l(e) and r(e))(left, right)
+        return left
+
+    def parse_unary():
+        if peek() == "not":
+            take()
+            inner = parse_unary()
+            return lambda e: not inner(e)
+        if peek() == "(":
+            take()
+            inner = parse_or()
+            take(")")
+            return inner
+        _, name = take("name")
+        operator, _ = take()
+        _, value = take("value")
+        compare = _COMPARISONS[operator]
+        return lambda e: compare(e.get(name), value)
+
+    predicate = parse_or()
+    if position != len(tokens):
+        raise ValueError(f"Trailing tokens in filter {query_filter!r}")
+    return predicate
+
+
+def _substitute_parameters(query_filter, parameters):
+    if not parameters:
+        return query_filter
+    for name, value in parameters.items():
+        if isinstance(value, str):
+            literal = "'" + value.replace("'", "''") + "'"
+        elif isinstance(value, bool):
+            literal = "true" if value else "false"
+        else:
+            literal = str(value)
+        query_filter = query_filter.replace(f"@{name}", literal)
+    return query_filter
+
+
+_PARTITION_BOUND = re.compile(r"PartitionKey (eq|ge|gt|le|lt) '((?:[^']|'')*)'")
+
+
+def _partition_bounds(query_filter):
+    """PartitionKey range a filter is confined to, as the service uses it to seek; (None, None) if unknown"""
+    if not query_filter or re.search(r"\b(or|not)\b", query_filter):
+        return None, None
+    low = high = None
+    for operator, value in _PARTITION_BOUND.findall(query_filter):
+        value = value.replace("''", "'")
+        if operator in ("eq", "ge", "gt"):
+            low = value if low is None else max(low, value)
+        if operator in ("eq", "le", "lt"):
+            high = value if high is None else min(high, value)
+    return low, high
+
+
+_ROW_LOW_BOUND = re.compile(r"RowKey (ge|gt) '((?:[^']|'')*)'")
+
+
+def _row_low_bound(query_filter):
+    """Lowest RowKey a single-partition filter starts at, as the service seeks to it; None if unknown"""
+    low, high = _partition_bounds(query_filter)
+    if low is None or low != high:
+        return None
+    bounds = [value.replace("''", "'") for _, value in _ROW_LOW_BOUND.findall(query_filter)]
+    return max(bounds) if bounds else None
+
+
+# --- Table Storage ------------------------------------------------------------
+
+class FakeTableClient:
+    """
+    One in-memory table, ordered by (PartitionKey, RowKey) like the real service
+    partition_writes_per_second serves each partition's entity writes one after another at
+    that rate, like the single partition server that owns it (None means unlimited)
+    """
+
+    def __init__(self, table_name, latency, partition_writes_per_second=None):
+        self.table_name = table_name
+        self.latency = latency
+        self.partition_writes_per_second = partition_writes_per_second
+        self._entities = {}
+        self._keys = []
+        self._etags = itertools.count(1)
+        self._lock = threading.RLock()
+        self._partition_busy_until = {}
+        self._partition_lock = threading.Lock()
+
+    def _charge_partition(self, partition_key, writes=1):
+        if not self.partition_writes_per_second:
+            return
+        with self._partition_lock:
+            now = time.monotonic()
+            done = max(now, self._partition_busy_until.get(partition_key, 0.0)) + writes / self.partition_writes_per_second
+            self._partition_busy_until[partition_key] = done
+        time.sleep(max(0.0, done - now))
+
+    # Helpers
+
+    def _stored(self, entity):
+        for name, value in entity.items():
+            if isinstance(value, str) and len(value.encode("utf-16-le")) > 2 * MAX_STRING_PROPERTY:
+                raise HttpResponseError(message=f"PropertyValueTooLarge: the property value of {name} exceeds the maximum allowed size (64KB).")
+        stored = TableEntity()
+        stored.update(copy.deepcopy(dict(entity)))
+        stored._metadata = {
+            "etag": f'W/"{next(self._etags)}"',
+            "timestamp": datetime.datetime.now(datetime.timezone.utc)
+        }
+        return stored
+
+    def _returned(self, stored, select=None):
+        entity = TableEntity()
+        if select:
+            fields = select.split(",") if isinstance(select, str) else select
+            entity.update({field: copy.deepcopy(stored[field]) for field in fields if field in stored})
+        else:
+            entity.update(copy.deepcopy(dict(stored)))
+        entity._metadata = dict(stored.metadata)
+        return entity
+
+    def _put(self, key, entity):
+        if key not in self._entities:
+            insort(self._keys, key)
+        stored = self._stored(entity)
+        self._entities[key] = stored
+        return {"etag": stored.metadata["etag"]}
+
+    @staticmethod
+    def _key(entity):
+        return (entity["PartitionKey"], entity["RowKey"])
+
+    def _check_etag(self, key, etag, match_condition):
+        if match_condition == MatchConditions.IfNotModified and self._entities[key].metadata["etag"] != etag:
+            raise ResourceModifiedError("The update condition specified in the request was not satisfied.")
+
+    # Table operations
+
+    def create_table(self):
+        self.latency.charge()
+
+    def delete_table(self):
+        self.latency.charge()
+        with self._lock:
+            self._entities.clear()
+            self._keys.clear()
+
+    # Entity operations
+
+    def create_entity(self, entity):
+        self.latency.charge()
+        self._charge_partition(entity["PartitionKey"])
+        with self._lock:
+            key = self._key(entity)
+            if key in self._entities:
+                raise ResourceExistsError("The specified entity already exists.")
+            return self._put(key, entity)
+
+    def upsert_entity(self, entity, mode=UpdateMode.MERGE):
+        self.latency.charge()
+        self._charge_partition(entity["PartitionKey"])
+        with self._lock:
+            return self._upsert(entity, mode)
+
+    def _upsert(self, entity, mode):
+        key = self._key(entity)
+        if mode == UpdateMode.MERGE and key in self._entities:
+            merged = dict(self._entities[key])
+            merged.update(entity)
+            entity = merged
+        return self._put(key, entity)
+
+    def update_entity(self, entity, mode=UpdateMode.MERGE, *, etag=None, match_condition=None):
+        self.latency.charge()
+        self._charge_partition(entity["PartitionKey"])
+        with self._lock:
+            return self._update(entity, mode, etag, match_condition)
+
+    def _update(self, entity, mode, etag=None, match_condition=None):
+        key = self._key(entity)
+        if key not in self._entities:
+            raise ResourceNotFoundError("The specified resource does not exist.")
+        if match_condition and not etag and isinstance(entity, TableEntity):
+            etag = entity.metadata.get("etag")
+        self._check_etag(key, etag, match_condition)
+        return self._upsert(entity, mode)
+
+    def delete_entity(self, partition_key, row_key, **kwargs):
+        self.latency.charge()
+        self._charge_partition(partition_key)
+        with self._lock:
+            key = (partition_key, row_key)
+            if key in self._entities:
+                del self._entities[key]
+                self._keys.pop(bisect_left(self._keys, key))
+
+    def get_entity(self, partition_key, row_key, *, select=None):
+        self.latency.charge()
+        with self._lock:
+            stored = self._entities.get((partition_key, row_key))
+            if stored is None:
+                raise ResourceNotFoundError("The specified resource does not exist.")
+            return self._returned(stored, select)
+
+    def submit_transaction(self, operations):
+        self.latency.charge()
+        operations = list(operations)
+        if len(operations) > 100:
+            raise TableTransactionError(message="0:The batch request operation exceeds the maximum 100 changes per change set.")
+        if len({operation[1]["PartitionKey"] for operation in operations}) > 1:
+            raise TableTransactionError(message="0:All entities in a transaction must have the same PartitionKey.")
+        if len(json.dumps([dict(operation[1]) for operation in operations], default=str).encode("utf-8")) > MAX_TRANSACTION_PAYLOAD:
+            raise RequestTooLargeError(message="The request body is too large and exceeds the maximum permissible limit.")
+        if operations:
+            self._charge_partition(operations[0][1]["PartitionKey"], len(operations))
+
+        with self._lock:
+            snapshot = (dict(self._entities), list(self._keys))
+            results = []
+            try:
+                for operation in operations:
+                    action, entity = operation[0], operation[1]
+                    options = operation[2] if len(operation) > 2 else {}
+                    key = self._key(entity)
+                    if action == "create":
+                        if key in self._entities:
+                            raise ResourceExistsError("The specified entity already exists.")
+                        results.append(self._put(key, entity))
+                    elif action == "upsert":
+                        results.append(self._upsert(entity, options.get("mode", UpdateMode.MERGE)))
+                    elif action == "update":
+                        results.append(self._update(
+                            entity, options.get("mode", UpdateMode.MERGE),
+                            options.get("etag"), options.get("match_condition")))
+                    elif action == "delete":
+                        if key in self._entities:
+                            del self._entities[key]
+                            self._keys.pop(bisect_left(self._keys, key))
+                        results.append({})
+                    else:
+                        raise ValueError(f"Unsupported transaction action {action}")
+            except Exception as error:
+                self._entities, self._keys = snapshot
+                raise TableTransactionError(message=f"{len(results)}:{error}") from error
+            return results
+
+    # Queries
+
+    def query_entities(self, query_filter, *, results_per_page=None, select=None, parameters=None):
+        query_filter = _substitute_parameters(query_filter, parameters)
+        return self._paged(compile_filter(query_filter), results_per_page, select,
+                           _partition_bounds(query_filter), _row_low_bound(query_filter))
+
+    def list_entities(self, *, results_per_page=None, select=None):
+        return self._paged(lambda entity: True, results_per_page, select)
+
+    def _paged(self, predicate, results_per_page, select, bounds=(None, None), row_low=None):
+        page_size = min(results_per_page or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+        low, high = bounds
+
+        def get_next(continuation_token):
+            # Like the service, a query seeks to its lowest key, a page never spans
+            # partitions and scans at most one page worth of rows
+            self.latency.charge()
+            with self._lock:
+                start = bisect_left(self._keys, (low,) if row_low is None else (low, row_low)) if low is not None else 0
+                if continuation_token:
+                    start = bisect_left(self._keys, (continuation_token["PartitionKey"], continuation_token["RowKey"]))
+                page = []
+                position = start
+                partition = self._keys[start][0] if start < len(self._keys) else None
+                while position < len(self._keys) and len(page) < page_size:
+                    key = self._keys[position]
+                    if key[0] != partition:
+                        break
+                    stored = self._entities[key]
+                    if predicate(stored):
+                        page.append(self._returned(stored, select))
+                    position += 1
+                next_token = None
+                if position < len(self._keys) and (high is None or self._keys[position][0] <= high):
+                    next_key = self._keys[position]
+                    next_token = {"PartitionKey": next_key[0], "RowKey": next_key[1]}
+                return next_token, page
+
+        def extract_data(response):
+            next_token, page = response
+            return next_token, iter(page)
+
+        return ItemPaged(get_next, extract_data)
+
+    # Benchmark setup helpers
+
+    def repartition(self, partition_for):
+        """Move every entity to the PartitionKey returned by partition_for(entity)"""
+        with self._lock:
+            moved = {}
+            for (_, row_key), stored in self._entities.items():
+                stored["PartitionKey"] = partition_for(stored)
+                moved[(stored["PartitionKey"], row_key)] = stored
+            self._entities = moved
+            self._keys = sorted(moved)
+
+    def __len__(self):
+        return len(self._entities)
+
+
+class FakeTableServiceClient:
+    """Drop-in for TableServiceClient; tables are created on first use"""
+
+    def __init__(self, latency=None, partition_writes_per_second=None):
+        self.latency = latency or Latency()
+        self.partition_writes_per_second = partition_writes_per_second
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get_table_client(self, table_name):
+        with self._lock:
+            if table_name not in self._tables:
+                self._tables[table_name] = FakeTableClient(table_name, self.latency, self.partition_writes_per_second)
+            return self._tables[table_name]
+
+    def create_table_if_not_exists(self, table_name):
+        self.latency.charge()
+        return self.get_table_client(table_name)
+
+
+# --- Blob Storage -------------------------------------------------------------
+
+class FakeBlob:
+    def __init__(self, name, data, metadata, content_type, size=None):
+        self.name = name
+        self.data = data
+        self.metadata = dict(metadata or {})
+        self.content_type = content_type
+        self.size = len(data) if size is None else size
+
+
+class FakeDownload:
+    def __init__(self, data):
+        self._data = data
+
+    def readall(self):
+        return self._data
+
+    def chunks(self):
+        for start in range(0, len(self._data), 4 * 1024 * 1024):
+            yield self._data[start:start + 4 * 1024 * 1024]
+
+
+class FakeBlobClient:
+    def __init__(self, service, container, blob):
+        self._service = service
+        self.container_name = container
+        self.blob_name = blob
+        self.url = f"https://fake.blob.core.windows.net/{container}/{blob}"
+        self._staged = {}
+
+    @property
+    def _blobs(self):
+        return self._service.containers.setdefault(self.container_name, {})
+
+    def upload_blob(self, data, overwrite=False, metadata=None, content_type=None, content_settings=None, **kwargs):
+        self._service.latency.charge()
+        if hasattr(data, "read"):
+            data = data.read()
+        if not overwrite and self.blob_name in self._blobs:
+            raise ResourceExistsError("The specified blob already exists.")
+        if content_settings is not None:
+            content_type = content_settings.content_type
+        size = len(data)
+        data = b"" if self._service.discard_data else bytes(data)
+        self._blobs[self.blob_name] = FakeBlob(self.blob_name, data, metadata, content_type, size)
+        return {"etag": f'"{len(self._blobs)}"'}
+
+    def stage_block(self, block_id, data, length=None, **kwargs):
+        self._service.latency.charge()
+        if hasattr(data, "read"):
+            data = data.read()
+        self._staged[block_id] = (len(data), b"" if self._service.discard_data else bytes(data))
+
+    def commit_block_list(self, block_list, content_settings=None, metadata=None, **kwargs):
+        self._service.latency.charge()
+        ids = [getattr(block, "id", block) for block in block_list]
+        blocks = [self._staged.pop(block_id) for block_id in ids]
+        data = b"".join(block for _, block in blocks)
+        content_type = content_settings.content_type if content_settings is not None else None
+        self._blobs[self.blob_name] = FakeBlob(self.blob_name, data, metadata, content_type,
+                                               sum(size for size, _ in blocks))
+        return {"etag": f'"{len(self._blobs)}"'}
+
+    def _blob(self):
+        blob = self._blobs.get(self.blob_name)
+        if blob is None:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        return blob
+
+    def download_blob(self, offset=None, length=None, **kwargs):
+        self._service.latency.charge()
+        data = self._blob().data
+        if offset is not None:
+            data = data[offset:offset + length if length is not None else None]
+        return FakeDownload(data)
+
+    def get_blob_properties(self, **kwargs):
+        self._service.latency.charge()
+        return self._blob()
+
+    def set_blob_metadata(self, metadata=None, **kwargs):
+        self._service.latency.charge()
+        self._blob().metadata = dict(metadata or {})
+
+    def delete_blob(self, **kwargs):
+        self._service.latency.charge()
+        self._blobs.pop(self.blob_name, None)
+
+    def exists(self, **kwargs):
+        self._service.latency.charge()
+        return self.blob_name in self._blobs
+
+
+class FakeContainerClient:
+    def __init__(self, service, container):
+        self._service = service
+        self.container_name = container
+
+    def get_blob_client(self, blob):
+        return FakeBlobClient(self._service, self.container_name, blob)
+
+    def list_blobs(self, name_starts_with=None, include=None, **kwargs):
+        blobs = self._service.containers.get(self.container_name, {})
+        names = sorted(name for name in blobs if not name_starts_with or name.startswith(name_starts_with))
+        for start in range(0, len(names), 5000):
+            self._service.latency.charge()
+            for name in names[start:start + 5000]:
+                yield blobs[name]
+
+
+class FakeBlobServiceClient:
+    """
+    Drop-in for BlobServiceClient; blobs live in nested dicts
+    discard_data keeps only blob sizes, so memory benchmarks measure the app rather than the fake
+    """
+
+    def __init__(self, latency=None, discard_data=False):
+        self.latency = latency or Latency()
+        self.discard_data = discard_data
+        self.containers = {}
+
+    def create_container(self, name, **kwargs):
+        self.latency.charge()
+        if name in self.containers:
+            raise ResourceExistsError("The specified container already exists.")
+        self.containers[name] = {}
+
+    def get_container_client(self, container):
+        return FakeContainerClient(self, container)
+
+    def get_blob_client(self, container, blob):
+        return FakeBlobClient(self, container, blob)
+
+
+# --- Computer Vision ------------------------------------------------------------
+
+class FakeHttpResponse:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+        self.status_code = 200
+
+
+class FakeReadOperation:
+    def __init__(self, operation_id):
+        self.headers = {"Operation-Location": f"https://fake.cognitiveservices.azure.com/vision/v3.2/read/analyzeResults/{operation_id}"}
+
+
+class UnlimitedRateLimiter:
+    """Stand-in for the Computer Vision rate limiter in benchmarks that measure something else"""
+
+    def acquire(self):
+        return 0.0
+
+
+def throttled_error(retry_after):
+    """The exception ComputerVisionClient raises for an HTTP 429 response"""
+    import requests
+    from msrest import Deserializer
+    from azure.cognitiveservices.vision.computervision import models
+
+    response = requests.Response()
+    response.status_code = 429
+    response.reason = "Too Many Requests"
+    response.headers["Retry-After"] = f"{retry_after:.3f}"
+    response._content = b'{"error": {"code": "429", "message": "Rate limit is exceeded."}}'
+    deserialize = Deserializer({name: value for name, value in vars(models).items() if isinstance(value, type)})
+    return models.ComputerVisionErrorResponseException(deserialize, response)
+
+
+class FakeComputerVisionClient:
+    """
+    Stand-in for ComputerVisionClient returning SDK model objects
+    analyze_ms is the service time of analyze_image; ocr_ms is how long a read operation
+    stays "running" before get_read_result reports it succeeded; quota_tps rejects calls
+    beyond that many per second with the SDK's 429 error
+
+    Detected regions sit at fixed fractions of the image, so results for a resized copy
+    scale with it. Given blob_service, URLs are resolved to fake blobs; transfer_mbps
+    charges the time to fetch or receive the image bytes
+    """
+
+    def __init__(self, analyze_ms=300.0, ocr_ms=800.0, ocr_lines=5, objects=3, tags=8, retry_after=None, quota_tps=None,
+                 blob_service=None, transfer_mbps=None):
+        self.analyze_ms = analyze_ms
+        self.ocr_ms = ocr_ms
+        self.retry_after = retry_after
+        self.quota_tps = quota_tps
+        self.blob_service = blob_service
+        self.transfer_mbps = transfer_mbps
+        self.bytes_received = 0
+        self._recent_calls = collections.deque()
+        self.ocr_lines = ocr_lines
+        self.objects = objects
+        self.tags = tags
+        self.calls = collections.Counter()
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+            if self.quota_tps is None:
+                return
+            now = time.monotonic()
+            while self._recent_calls and self._recent_calls[0] <= now - 1.0:
+                self._recent_calls.popleft()
+            if len(self._recent_calls) >= self.quota_tps:
+                self.calls["throttled"] += 1
+                retry_after = max(0.0, self._recent_calls[0] + 1.0 - now)
+                raise throttled_error(retry_after)
+            self._recent_calls.append(now)
+
+    def _receive(self, source):
+        """Read the image behind a URL or stream, charging transfer time; returns its (width, height)"""
+        from PIL import Image
+
+        data = None
+        if hasattr(source, "read"):
+            data = source.read()
+        elif self.blob_service is not None:
+            container, _, blob = source.split(".blob.core.windows.net/", 1)[-1].partition("/")
+            stored = self.blob_service.containers.get(container, {}).get(blob)
+            data = stored.data if stored is not None else None
+        if not data:
+            return 640, 480
+        with self._lock:
+            self.bytes_received += len(data)
+        if self.transfer_mbps:
+            time.sleep(len(data) * 8 / (self.transfer_mbps * 1e6))
+        return Image.open(io.BytesIO(data)).size
+
+    def _image_analysis(self, visual_features, size=(640, 480)):
+        from azure.cognitiveservices.vision.computervision import models
+
+        width, height = size
+        requested = {getattr(feature, "value", feature) for feature in (visual_features or [])}
+        analysis = models.ImageAnalysis()
+        if "Objects" in requested:
+            analysis.objects = []
+            for index in range(self.objects):
+                detected = models.DetectedObject(object_property=f"object{index}", confidence=0.9)
+                detected.rectangle = models.BoundingRect(
+                    x=int(width * 0.05 * (index + 1)), y=int(height * 0.05 * (index + 1)),
+                    w=int(width * 0.25), h=int(height * 0.2))
+                analysis.objects.append(detected)
+        if "Faces" in requested:
+            analysis.faces = [models.FaceDescription(
+                age=30, gender=models.Gender.female,
+                face_rectangle=models.FaceRectangle(
+                    left=int(width * 0.4), top=int(height * 0.3), width=int(width * 0.1), height=int(height * 0.12)))]
+        if "Description" in requested:
+            analysis.description = models.ImageDescriptionDetails(
+                tags=["tag0"], captions=[models.ImageCaption(text="a fake image", confidence=0.87)])
+        if "Tags" in requested:
+            analysis.tags = [models.ImageTag(name=f"tag{index}", confidence=0.99 - index / 100) for index in range(self.tags)]
+        if "Categories" in requested:
+            analysis.categories = [models.Category(name="others_", score=0.5)]
+        if "Color" in requested:
+            analysis.color = models.ColorInfo(
+                dominant_color_foreground="Black", dominant_color_background="White",
+                dominant_colors=["Black", "White"], accent_color="1F5A8C", is_bw_img=False)
+        if "Adult" in requested:
+            analysis.adult = models.AdultInfo(
+                is_adult_content=False, is_racy_content=False, is_gory_content=False,
+                adult_score=0.01, racy_score=0.02, gore_score=0.0)
+        if "ImageType" in requested:
+            analysis.image_type = models.ImageType(clip_art_type=0, line_drawing_type=0)
+        return analysis
+
+    def analyze_image(self, url, visual_features=None, **kwargs):
+        self._count("analyze_image")
+        size = self._receive(url)
+        time.sleep(self.analyze_ms / 1000.0)
+        return self._image_analysis(visual_features, size)
+
+    def analyze_image_in_stream(self, image, visual_features=None, **kwargs):
+        self._count("analyze_image_in_stream")
+        size = self._receive(image)
+        time.sleep(self.analyze_ms / 1000.0)
+        return self._image_analysis(visual_features, size)
+
+    def _start_read(self, size):
+        with self._lock:
+            operation_id = f"op-{len(self._operations) + 1}"
+            self._operations[operation_id] = (time.monotonic() + self.ocr_ms / 1000.0, size)
+        return FakeReadOperation(operation_id)
+
+    def read(self, url, raw=False, **kwargs):
+        self._count("read")
+        return self._start_read(self._receive(url))
+
+    def read_in_stream(self, image, raw=False, **kwargs):
+        self._count("read_in_stream")
+        return self._start_read(self._receive(image))
+
+    def get_read_result(self, operation_id, raw=False, **kwargs):
+        from azure.cognitiveservices.vision.computervision import models
+
+        self._count("get_read_result")
+        ready_at, (width, height) = self._operations[operation_id]
+        if time.monotonic() < ready_at:
+            result = models.ReadOperationResult(status=models.OperationStatusCodes.running)
+        else:
+            lines = []
+            for index in range(self.ocr_lines):
+                left, right = round(width * 0.05, 1), round(width * 0.6, 1)
+                top, bottom = round(height * (0.05 + index * 0.04), 1), round(height * (0.08 + index * 0.04), 1)
+                lines.append(models.Line(text=f"line {index} of fake text",
+                                         bounding_box=[left, top, right, top, right, bottom, left, bottom], words=[]))
+            result = models.ReadOperationResult(
+                status=models.OperationStatusCodes.succeeded,
+                analyze_result=models.AnalyzeResults(version="3.2", model_version="2022-04-30", read_results=[
+                    models.ReadResult(page=1, angle=0, width=width, height=height, unit="pixel", lines=lines)]))
+        if raw:
+            from msrest.pipeline import ClientRawResponse
+            headers = {}
+            if self.retry_after is not None and result.status == models.OperationStatusCodes.running:
+                headers["Retry-After"] = str(self.retry_after)
+            return ClientRawResponse(result, FakeHttpResponse(headers))
+        return result
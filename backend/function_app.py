@@ -1,23 +1,313 @@
 import azure.functions as func
+import asyncio
+import base64
+import contextlib
 import datetime
+import functools
+import gzip
+import hashlib
+import importlib
+import itertools
 import json
 import logging
 import uuid
 import os
+import queue
+import random
+import re
+import sys
+import tempfile
+import threading
 import time
-from azure.storage.blob import BlobServiceClient
-from azure.data.tables import TableServiceClient, TableEntity
-from azure.identity import DefaultAzureCredential
-from msrest.authentication import CognitiveServicesCredentials
-from azure.cognitiveservices.vision.computervision import ComputerVisionClient
-from azure.cognitiveservices.vision.computervision.models import OperationStatusCodes, VisualFeatureTypes
-from PIL import Image
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
 import io
 
+try:
+    import fcntl
+except ImportError:
+    # Windows (local development): the colour index files are then guarded per process only
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    # Without it responses are encoded by the standard library, in the same compact form
+    orjson = None
+
+class LazyImport:
+    """
+    A module, or one attribute of it, imported on first use instead of at module load
+    Attribute access, calls and isinstance checks go to the real object. except clauses
+    need the class itself, so lazily imported exceptions are caught with .resolve()
+    """
+    
+    # Every lazy import, for warm_up
+    instances = []
+    
+    def __init__(self, module, attribute=None):
+        self.module_name = module
+        self.attribute_name = attribute
+        self._object = None
+        LazyImport.instances.append(self)
+    
+    def resolve(self):
+        """The imported module or attribute"""
+        if self._object is None:
+            loaded = self.module_name in sys.modules
+            started = time.perf_counter()
+            target = importlib.import_module(self.module_name)
+            if not loaded:
+                metrics.observe(f"imports.{self.module_name}", (time.perf_counter() - started) * 1000)
+            self._object = getattr(target, self.attribute_name) if self.attribute_name else target
+        return self._object
+    
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+    
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+    
+    def __instancecheck__(self, instance):
+        return isinstance(instance, self.resolve())
+    
+    def __repr__(self):
+        return f"<lazy {self.module_name}{'.' + self.attribute_name if self.attribute_name else ''}>"
+
+# SDKs and libraries that take most of a cold start to import; each route loads only what it
+# uses, so /api/health answers without any of them (WARMUP_ON_START loads them up front)
+BlobServiceClient = LazyImport("azure.storage.blob", "BlobServiceClient")
+ContentSettings = LazyImport("azure.storage.blob", "ContentSettings")
+TableServiceClient = LazyImport("azure.data.tables", "TableServiceClient")
+TableEntity = LazyImport("azure.data.tables", "TableEntity")
+TableTransactionError = LazyImport("azure.data.tables", "TableTransactionError")
+RequestTooLargeError = LazyImport("azure.data.tables", "RequestTooLargeError")
+UpdateMode = LazyImport("azure.data.tables", "UpdateMode")
+QueueClient = LazyImport("azure.storage.queue", "QueueClient")
+TextBase64EncodePolicy = LazyImport("azure.storage.queue", "TextBase64EncodePolicy")
+DefaultAzureCredential = LazyImport("azure.identity", "DefaultAzureCredential")
+CognitiveServicesCredentials = LazyImport("msrest.authentication", "CognitiveServicesCredentials")
+ComputerVisionClient = LazyImport("azure.cognitiveservices.vision.computervision", "ComputerVisionClient")
+OperationStatusCodes = LazyImport("azure.cognitiveservices.vision.computervision.models", "OperationStatusCodes")
+VisualFeatureTypes = LazyImport("azure.cognitiveservices.vision.computervision.models", "VisualFeatureTypes")
+Image = LazyImport("PIL.Image")
+ImageOps = LazyImport("PIL.ImageOps")
+np = LazyImport("numpy")
+
 app = func.FunctionApp()
 
+PROCESS_START_TIME = time.time()
+
+UPLOAD_CONTAINER = "images-upload"
+ANALYSIS_RESULTS_CONTAINER = "analysis-results"
+
+# Upload validation
+ALLOWED_IMAGE_FORMATS = ['jpeg', 'jpg', 'png']
+MAX_IMAGE_DIMENSION = 4000
+
+# Analysis lifecycle, tracked on the imageId-keyed "latest" row
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+class StatusConflictError(Exception):
+    """A conditional status update found the lookup row changed since its ETag was issued"""
+
+def days_between(start_date, end_date):
+    """Every day (YYYY-MM-DD) from start_date to end_date inclusive"""
+    return [(start_date.date() + datetime.timedelta(days=offset)).strftime("%Y-%m-%d")
+            for offset in range((end_date.date() - start_date.date()).days + 1)]
+
+def env_flag(name, default=False):
+    """Read a boolean app setting ("true"/"1"/"yes" are truthy)"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
+
+# Analysis history partitions: one per day and shard ("2025-08-06_03"), so a day's writes are
+# spread over RESULTS_PARTITION_SHARDS partitions instead of all landing on one
+RESULTS_PARTITION_SHARDS = max(1, int(os.environ.get("RESULTS_PARTITION_SHARDS", "4")))
+# Also read the unsharded "2025-08-06" partitions written before sharding (until reshard-results has run)
+RESULTS_READ_UNSHARDED = env_flag("RESULTS_READ_UNSHARDED", True)
+
+def partition_shard(image_id, shards=None):
+    """Shard an image's analyses are written to; stable across processes and restarts"""
+    shards = shards or RESULTS_PARTITION_SHARDS
+    return int(hashlib.sha256(image_id.encode("utf-8")).hexdigest()[:8], 16) % shards
+
+def results_partition_key(day, image_id, shards=None):
+    """PartitionKey of an analysis of image_id made on day (YYYY-MM-DD)"""
+    return f"{day}_{partition_shard(image_id, shards):02d}"
+
+def day_partitions(day):
+    """Every history partition that can hold analyses made on day, in key order"""
+    shards = [f"{day}_{shard:02d}" for shard in range(RESULTS_PARTITION_SHARDS)]
+    return [day] + shards if RESULTS_READ_UNSHARDED else shards
+
+# In-process metrics, exposed on GET /api/metrics
+class Metrics:
+    """Thread-safe counters and timing summaries for this worker process"""
+    
+    # Upper bounds (ms) of the timing histogram buckets
+    BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._timings = {}
+    
+    def increment(self, name, amount=1):
+        """Add to a named counter"""
+        with self._lock:
+            self._counters[name] += amount
+    
+    def observe(self, name, value_ms):
+        """Record one timing sample in milliseconds"""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = {
+                    "count": 0, "sum_ms": 0.0, "min_ms": value_ms, "max_ms": value_ms,
+                    "buckets": [0] * (len(self.BUCKETS_MS) + 1)
+                }
+            timing["count"] += 1
+            timing["sum_ms"] += value_ms
+            timing["min_ms"] = min(timing["min_ms"], value_ms)
+            timing["max_ms"] = max(timing["max_ms"], value_ms)
+            bucket = next((i for i, bound in enumerate(self.BUCKETS_MS) if value_ms <= bound), len(self.BUCKETS_MS))
+            timing["buckets"][bucket] += 1
+    
+    def snapshot(self):
+        """Copy of all counters and timing summaries"""
+        with self._lock:
+            timings = {}
+            for name, timing in self._timings.items():
+                labels = [f"le_{bound}" for bound in self.BUCKETS_MS] + ["le_inf"]
+                timings[name] = {
+                    "count": timing["count"],
+                    "avg_ms": round(timing["sum_ms"] / timing["count"], 3),
+                    "min_ms": round(timing["min_ms"], 3),
+                    "max_ms": round(timing["max_ms"], 3),
+                    "histogram": dict(zip(labels, timing["buckets"]))
+                }
+            return {"counters": dict(self._counters), "timings": timings}
+    
+    def average(self, name):
+        """Mean of a timing in milliseconds, or None before its first sample"""
+        with self._lock:
+            timing = self._timings.get(name)
+            return timing["sum_ms"] / timing["count"] if timing else None
+    
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+metrics = Metrics()
+
+class CachingCredential:
+    """
+    Wraps a token credential so every pooled client shares one token per scope
+    until it is close to expiry, instead of each client acquiring its own
+    """
+    
+    REFRESH_MARGIN_SECONDS = 300
+    
+    def __init__(self, credential):
+        self._credential = credential
+        self._tokens = {}
+        self._lock = threading.Lock()
+    
+    # get_token options that select a different token: each value gets its own cache entry
+    KEYED_OPTIONS = ("tenant_id", "enable_cae")
+    
+    def get_token(self, *scopes, **kwargs):
+        # A claims challenge (or an option not listed above) always goes to the real credential
+        cacheable = not kwargs.get("claims") and set(kwargs) <= {"claims", *self.KEYED_OPTIONS}
+        key = (scopes, *(kwargs.get(option) for option in self.KEYED_OPTIONS))
+        if cacheable:
+            token = self._tokens.get(key)
+            if token and token.expires_on - self.REFRESH_MARGIN_SECONDS > time.time():
+                metrics.increment("credential.token_cache_hits")
+                return token
+        else:
+            metrics.increment("credential.token_cache_bypasses")
+        
+        with self._lock:
+            token = self._credential.get_token(*scopes, **kwargs)
+            metrics.increment("credential.token_fetches")
+            if cacheable:
+                self._tokens[key] = token
+        return token
+    
+    def close(self):
+        self._credential.close()
+
+class ClientRegistry:
+    """
+    Lazily initialised SDK clients shared by every invocation in this worker process
+    Reusing a client reuses its HTTP connection pool; one-time setup (tables, containers) runs once
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._bootstrapped = set()
+    
+    def get(self, name, factory):
+        """Return the shared client called name, building it with factory() on first use"""
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = factory()
+                    self._clients[name] = client
+                    metrics.increment(f"clients.{name}.created")
+                    return client
+        metrics.increment(f"clients.{name}.reused")
+        return client
+    
+    def set(self, name, client):
+        """Install a client, e.g. a local stand-in for offline runs"""
+        with self._lock:
+            self._clients[name] = client
+    
+    def credential(self):
+        """Shared managed identity credential with token caching"""
+        return self.get("credential", lambda: CachingCredential(DefaultAzureCredential()))
+    
+    def ensure_once(self, key, action):
+        """Run a setup action once per process; failures are logged and retried on next use"""
+        if key in self._bootstrapped:
+            metrics.increment("bootstrap.skipped")
+            return
+        with self._lock:
+            if key in self._bootstrapped:
+                metrics.increment("bootstrap.skipped")
+                return
+            try:
+                action()
+                self._bootstrapped.add(key)
+                metrics.increment("bootstrap.runs")
+            except Exception as e:
+                logging.error(f"Setup step {key} failed: {str(e)}")
+    
+    def reset(self):
+        """Drop every shared client and forget completed setup"""
+        with self._lock:
+            self._clients.clear()
+            self._bootstrapped.clear()
+
+clients = ClientRegistry()
+
 # Initialize blob service client
-def get_blob_service_client():
+def _create_blob_service_client():
     """Initialize Azure Blob Storage client"""
     connection_string = os.environ.get("STORAGE_CONNECTION_STRING")
     if connection_string:
@@ -25,11 +315,14 @@ def get_blob_service_client():
     else:
         # Fallback to managed identity (for production)
         account_url = "https://stimagerecprod001.blob.core.windows.net"
-        credential = DefaultAzureCredential()
-        return BlobServiceClient(account_url=account_url, credential=credential)
+        return BlobServiceClient(account_url=account_url, credential=clients.credential())
+
+def get_blob_service_client():
+    """Shared Azure Blob Storage client for this worker process"""
+    return clients.get("blob", _create_blob_service_client)
 
 # Initialize Computer Vision client
-def get_computer_vision_client():
+def _create_computer_vision_client():
     """Initialize Azure Computer Vision client"""
     endpoint = os.environ.get("COMPUTER_VISION_ENDPOINT")
     key = os.environ.get("COMPUTER_VISION_KEY")
@@ -38,10 +331,15 @@ def get_computer_vision_client():
         raise Exception("COMPUTER_VISION_ENDPOINT and COMPUTER_VISION_KEY environment variables required")
     
     credentials = CognitiveServicesCredentials(key)
-    return ComputerVisionClient(endpoint, credentials)
+    # Entering the client keeps its requests session (and connection pool) open between calls
+    return ComputerVisionClient(endpoint, credentials).__enter__()
+
+def get_computer_vision_client():
+    """Shared Azure Computer Vision client for this worker process"""
+    return clients.get("computer_vision", _create_computer_vision_client)
 
 # Initialize Table Storage client
-def get_table_service_client():
+def _create_table_service_client():
     """Initialize Azure Table Storage client"""
     connection_string = os.environ.get("STORAGE_CONNECTION_STRING")
     if connection_string:
@@ -49,430 +347,4138 @@ def get_table_service_client():
     else:
         # Fallback to managed identity (for production)
         account_url = "https://stimagerecprod001.table.core.windows.net"
-        credential = DefaultAzureCredential()
-        return TableServiceClient(endpoint=account_url, credential=credential)
+        return TableServiceClient(endpoint=account_url, credential=clients.credential())
 
-# Data Access Layer for Image Analysis Results
-class ImageAnalysisRepository:
-    """Repository pattern for Table Storage operations"""
+def get_table_service_client():
+    """Shared Azure Table Storage client for this worker process"""
+    return clients.get("table", _create_table_service_client)
+
+def ensure_table(table_service, table_name):
+    """Create a table once per worker process"""
+    def create():
+        try:
+            table_service.get_table_client(table_name).create_table()
+            logging.info(f"Table {table_name} created")
+        except ResourceExistsError:
+            logging.info(f"Table {table_name} already exists")
     
-    def __init__(self):
-        self.table_service = get_table_service_client()
-        self.table_name = "ImageAnalysisResults"
-        self._ensure_table_exists()
+    clients.ensure_once(("table", table_name), create)
+
+def ensure_container(blob_service_client, container_name):
+    """Create a blob container once per worker process"""
+    def create():
+        try:
+            blob_service_client.create_container(container_name)
+            logging.info(f"Container {container_name} created")
+        except ResourceExistsError:
+            logging.info(f"Container {container_name} already exists")
     
+    clients.ensure_once(("container", container_name), create)
+
+# Data Access Layer for per-image lookup rows
+class ImageIndexRepository:
+    """
+    Per-image lookup rows in Table Storage, keyed by imageId
+    PartitionKey is the imageId, RowKey names the kind of row, so every lookup is a point read
+    """
+
+    BLOB_ROW_KEY = "blob"
+    LATEST_ROW_KEY = "latest"
+    CONTENT_ROW_KEY = "analysis"
+
+    def __init__(self, table_service=None):
+        self.table_service = table_service or get_table_service_client()
+        self.table_name = "ImageIndex"
+        self._ensure_table_exists()
+
     def _ensure_table_exists(self):
-        """Create table if it doesn't exist"""
+        """Create table if it doesn't exist (once per worker process)"""
+        ensure_table(self.table_service, self.table_name)
+
+    def save_blob_entry(self, image_id, blob_name, blob_metadata):
+        """Record which blob holds an image, along with its upload metadata"""
+        entity = TableEntity()
+        entity.update({
+            "PartitionKey": image_id,
+            "RowKey": self.BLOB_ROW_KEY,
+            "blobName": blob_name,
+            "originalName": blob_metadata.get("original_name", ""),
+            "uploadTime": blob_metadata.get("upload_time", ""),
+            "fileSize": int(blob_metadata.get("file_size", 0) or 0),
+            "dimensions": blob_metadata.get("dimensions", ""),
+            "format": blob_metadata.get("format", ""),
+            "contentHash": blob_metadata.get("content_sha256", ""),
+            "perceptualHash": blob_metadata.get("perceptual_hash", "")
+        })
+
+        table_client = self.table_service.get_table_client(self.table_name)
+        table_client.upsert_entity(entity, mode=UpdateMode.REPLACE)
+
+    def get_blob_entry(self, image_id):
+        """Resolve an imageId to its blob with a single point read, or None if it isn't indexed"""
+        table_client = self.table_service.get_table_client(self.table_name)
         try:
-            table_client = self.table_service.get_table_client(self.table_name)
-            table_client.create_table()
-            logging.info(f"Table {self.table_name} created or already exists")
-        except Exception as e:
-            if "already exists" not in str(e).lower():
-                logging.error(f"Error creating table: {str(e)}")
-    
-    def save_analysis_result(self, image_id, blob_name, analysis_data, upload_time, file_metadata):
-        """Save analysis results to Table Storage"""
-        try:
-            # Create partition key (date) and row key
-            analysis_time = datetime.datetime.utcnow()
-            partition_key = analysis_time.strftime("%Y-%m-%d")
-            row_key = f"{image_id}_{analysis_time.strftime('%Y%m%d_%H%M%S')}"
-            
-            # Extract key metrics for easy querying
-            objects = analysis_data.get("analysis", {}).get("objects", [])
-            faces = analysis_data.get("analysis", {}).get("faces", [])
-            descriptions = analysis_data.get("analysis", {}).get("descriptions", [])
-            tags = analysis_data.get("analysis", {}).get("tags", [])
-            text_result = analysis_data.get("analysis", {}).get("text", {})
-            
-            # Get primary description and confidence
-            primary_description = ""
-            max_confidence = 0.0
-            if descriptions:
-                primary_description = descriptions[0].get("text", "")
-                max_confidence = descriptions[0].get("confidence", 0.0)
-            
-            # Create tag string
-            tag_names = [tag.get("name", "") for tag in tags[:10]]  # Limit to 10 tags
-            tags_string = ",".join(tag_names)
-            
-            # Create entity
+            entity = table_client.get_entity(partition_key=image_id, row_key=self.BLOB_ROW_KEY)
+        except ResourceNotFoundError:
+            return None
+
+        return {
+            "blobName": entity["blobName"],
+            "originalName": entity.get("originalName", ""),
+            "uploadTime": entity.get("uploadTime", ""),
+            "fileSize": entity.get("fileSize", 0),
+            "dimensions": entity.get("dimensions", ""),
+            "format": entity.get("format", ""),
+            "contentHash": entity.get("contentHash", ""),
+            "perceptualHash": entity.get("perceptualHash", "")
+        }
+
+    def set_perceptual_hash(self, image_id, perceptual_hash):
+        """Record the perceptual hash of an already indexed image on its blob row"""
+        table_client = self.table_service.get_table_client(self.table_name)
+        table_client.upsert_entity(mode=UpdateMode.MERGE, entity={
+            "PartitionKey": image_id,
+            "RowKey": self.BLOB_ROW_KEY,
+            "perceptualHash": perceptual_hash
+        })
+
+    def save_latest_analysis(self, entity):
+        """Copy an analysis entity into the imageId-keyed "latest" row, remembering where the original lives"""
+        latest = TableEntity()
+        latest.update(entity)
+        latest.update({
+            "PartitionKey": entity["imageId"],
+            "RowKey": self.LATEST_ROW_KEY,
+            "resultPartitionKey": entity["PartitionKey"],
+            "resultRowKey": entity["RowKey"]
+        })
+
+        table_client = self.table_service.get_table_client(self.table_name)
+        table_client.upsert_entity(latest, mode=UpdateMode.REPLACE)
+
+    def get_latest_analysis(self, image_id, select=None):
+        """Point read of the latest analysis entity for an image, or None if it has none"""
+        table_client = self.table_service.get_table_client(self.table_name)
+        try:
+            return table_client.get_entity(partition_key=image_id, row_key=self.LATEST_ROW_KEY, select=select)
+        except ResourceNotFoundError:
+            return None
+
+    def save_content_entry(self, content_hash, image_id):
+        """Point a content digest at the image whose analysis identical uploads should reuse"""
+        entity = TableEntity()
+        entity.update({
+            "PartitionKey": f"sha256-{content_hash}",
+            "RowKey": self.CONTENT_ROW_KEY,
+            "imageId": image_id
+        })
+
+        table_client = self.table_service.get_table_client(self.table_name)
+        table_client.upsert_entity(entity, mode=UpdateMode.REPLACE)
+
+    def get_content_entry(self, content_hash):
+        """imageId whose analysis covers this content digest, or None"""
+        table_client = self.table_service.get_table_client(self.table_name)
+        try:
+            entity = table_client.get_entity(partition_key=f"sha256-{content_hash}", row_key=self.CONTENT_ROW_KEY)
+        except ResourceNotFoundError:
+            return None
+        return entity["imageId"]
+
+    def find_blob_by_scan(self, container_client, image_id):
+        """
+        Slow path for blobs uploaded before the index existed
+        Lists the container once and indexes the match so the next lookup is a point read
+        """
+        for blob in container_client.list_blobs(include=['metadata']):
+            if blob.metadata and blob.metadata.get('image_id') == image_id:
+                self.save_blob_entry(image_id, blob.name, blob.metadata)
+                return self.get_blob_entry(image_id)
+        return None
+
+    def backfill_blob_index(self, container_client):
+        """Index every existing blob that carries an image_id in its metadata"""
+        indexed = 0
+        skipped = 0
+        for blob in container_client.list_blobs(include=['metadata']):
+            image_id = (blob.metadata or {}).get('image_id')
+            if not image_id:
+                skipped += 1
+                continue
+            self.save_blob_entry(image_id, blob.name, blob.metadata)
+            indexed += 1
+
+        logging.info(f"Blob index backfill complete: {indexed} indexed, {skipped} skipped")
+        return {"indexed": indexed, "skipped": skipped}
+
+    def backfill_latest_analysis(self, results_table_client):
+        """
+        Build "latest" rows from an existing results table
+        First pass reads only keys and timestamps; second pass copies each winner with a point read
+        """
+        newest = {}
+        for entity in results_table_client.list_entities(select=["PartitionKey", "RowKey", "imageId", "analysisTime"]):
+            image_id = entity.get("imageId")
+            if not image_id:
+                continue
+            candidate = (entity.get("analysisTime", ""), entity["PartitionKey"], entity["RowKey"])
+            if image_id not in newest or candidate > newest[image_id]:
+                newest[image_id] = candidate
+
+        written = 0
+        current = 0
+        for image_id, (analysis_time, partition_key, row_key) in newest.items():
+            existing = self.get_latest_analysis(image_id)
+            if existing and existing.get("analysisTime", "") >= analysis_time:
+                current += 1
+                continue
+            self.save_latest_analysis(results_table_client.get_entity(partition_key=partition_key, row_key=row_key))
+            written += 1
+
+        logging.info(f"Latest analysis backfill complete: {written} written, {current} already current")
+        return {"written": written, "alreadyCurrent": current}
+
+# Perceptual hashes for near-duplicate detection
+def perceptual_hash(image):
+    """
+    64-bit difference hash (dHash) of a PIL image, as 16 hex digits
+    Each bit says whether a pixel of a 9x8 grayscale thumbnail is brighter than its right
+    neighbour, so re-encoding, resizing and small crops flip only a few bits
+    """
+    # JPEGs decode straight at reduced scale; the hash only needs a thumbnail
+    image.draft("L", (64, 64))
+    thumbnail = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(thumbnail.getdata())
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            bits = (bits << 1) | int(pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return f"{bits:016x}"
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two hex perceptual hashes"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+class ImageHashIndexRepository:
+    """
+    Perceptual hashes of uploaded images, indexed for Hamming-distance search (multi-index hashing)
+    Each 64-bit hash is stored once per 16-bit chunk, in the partition named by the chunk's
+    position and value. Hashes within distance d agree to within d // CHUNKS bits on at least
+    one chunk, so a search reads the partitions of every chunk value that close to the
+    query's and keeps the entries whose full hash is within d
+    """
+    
+    CHUNKS = 4
+    CHUNK_BITS = 16
+    # Distances up to 7 probe 4 x 17 partitions; 8 would take 4 x 137
+    MAX_SEARCH_DISTANCE = 7
+    
+    def __init__(self, table_service=None):
+        self.table_service = table_service or get_table_service_client()
+        self.table_name = "ImageHashIndex"
+        ensure_table(self.table_service, self.table_name)
+    
+    @classmethod
+    def chunks(cls, perceptual_hash):
+        """The hash's chunk values, most significant first"""
+        value = int(perceptual_hash, 16)
+        mask = (1 << cls.CHUNK_BITS) - 1
+        return [(value >> (cls.CHUNK_BITS * (cls.CHUNKS - 1 - index))) & mask for index in range(cls.CHUNKS)]
+    
+    @classmethod
+    def partition_key(cls, index, chunk):
+        return f"{index}-{chunk:0{cls.CHUNK_BITS // 4}x}"
+    
+    @classmethod
+    def probe_keys(cls, perceptual_hash, max_distance):
+        """Partitions a search within max_distance reads: chunk values within max_distance // CHUNKS bits"""
+        radius = max_distance // cls.CHUNKS
+        keys = []
+        for index, chunk in enumerate(cls.chunks(perceptual_hash)):
+            for flipped in range(radius + 1):
+                for bits in itertools.combinations(range(cls.CHUNK_BITS), flipped):
+                    keys.append(cls.partition_key(index, chunk ^ sum(1 << bit for bit in bits)))
+        return keys
+    
+    def save(self, image_id, perceptual_hash, blob_name="", upload_time=""):
+        """Index an image's hash under each of its chunks"""
+        table_client = self.table_service.get_table_client(self.table_name)
+        
+        def write(partition_key):
             entity = TableEntity()
             entity.update({
                 "PartitionKey": partition_key,
-                "RowKey": row_key,
-                "imageId": image_id,
+                "RowKey": image_id,
+                "perceptualHash": perceptual_hash,
                 "blobName": blob_name,
-                "status": "completed",
-                "uploadTime": upload_time,
-                "analysisTime": analysis_time.isoformat() + "Z",
-                "analysisResults": json.dumps(analysis_data),
-                "objectCount": len(objects),
-                "faceCount": len(faces),
-                "hasText": text_result.get("text_detected", False),
-                "tags": tags_string[:1000],  # Limit to 1000 chars
-                "primaryDescription": primary_description[:1000],  # Limit to 1000 chars
-                "confidence": round(max_confidence, 4),
-                "fileSize": int(file_metadata.get("fileSize", 0)),
-                "dimensions": file_metadata.get("dimensions", ""),
-                "format": file_metadata.get("format", "")
+                "uploadTime": upload_time
             })
+            table_client.upsert_entity(entity, mode=UpdateMode.REPLACE)
+        
+        partition_keys = [self.partition_key(index, chunk) for index, chunk in enumerate(self.chunks(perceptual_hash))]
+        with ThreadPoolExecutor(max_workers=self.CHUNKS, thread_name_prefix="hash-index") as executor:
+            list(executor.map(write, partition_keys))
+    
+    def find_similar(self, perceptual_hash, max_distance, exclude=None, max_results=None):
+        """Indexed images whose hash is within max_distance bits, nearest first"""
+        if not 0 <= max_distance <= self.MAX_SEARCH_DISTANCE:
+            raise ValueError(f"max_distance must be between 0 and {self.MAX_SEARCH_DISTANCE}")
+        table_client = self.table_service.get_table_client(self.table_name)
+        
+        def read(partition_key):
+            return list(table_client.query_entities(
+                "PartitionKey eq @partition_key", parameters={"partition_key": partition_key},
+                select=["RowKey", "perceptualHash", "blobName", "uploadTime"]
+            ))
+        
+        probes = self.probe_keys(perceptual_hash, max_distance)
+        matches = {}
+        with ThreadPoolExecutor(max_workers=min(16, len(probes)), thread_name_prefix="hash-search") as executor:
+            for entities in executor.map(read, probes):
+                for entity in entities:
+                    if entity["RowKey"] == exclude or entity["RowKey"] in matches:
+                        continue
+                    distance = hamming_distance(perceptual_hash, entity["perceptualHash"])
+                    if distance <= max_distance:
+                        matches[entity["RowKey"]] = {
+                            "imageId": entity["RowKey"],
+                            "blobName": entity.get("blobName", ""),
+                            "uploadTime": entity.get("uploadTime", ""),
+                            "perceptualHash": entity["perceptualHash"],
+                            "distance": distance
+                        }
+        
+        metrics.increment("hash_index.partitions_read", len(probes))
+        similar = sorted(matches.values(), key=lambda match: (match["distance"], match["imageId"]))
+        return similar[:max_results] if max_results else similar
+    
+    def backfill(self, container_client, image_index):
+        """Hash uploaded blobs whose lookup row has no perceptual hash yet, and (re)index every hash"""
+        hashed = 0
+        current = 0
+        skipped = 0
+        for blob in container_client.list_blobs(include=['metadata']):
+            image_id = (blob.metadata or {}).get('image_id')
+            entry = image_index.get_blob_entry(image_id) if image_id else None
+            if not entry:
+                skipped += 1
+                continue
+            if entry.get("perceptualHash"):
+                self.save(image_id, entry["perceptualHash"], blob.name, entry.get("uploadTime", ""))
+                current += 1
+                continue
+            blob_client = container_client.get_blob_client(blob.name)
+            try:
+                phash = perceptual_hash(Image.open(io.BytesIO(blob_client.download_blob().readall())))
+            except Exception as e:
+                logging.warning(f"Could not hash blob {blob.name}: {str(e)}")
+                skipped += 1
+                continue
+            # Blob metadata too, so backfill_blob_index keeps the hash when it rewrites the row
+            blob_client.set_blob_metadata({**blob.metadata, "perceptual_hash": phash})
+            image_index.set_perceptual_hash(image_id, phash)
+            self.save(image_id, phash, blob.name, entry.get("uploadTime", ""))
+            hashed += 1
+        
+        logging.info(f"Perceptual hash backfill complete: {hashed} hashed, {current} already hashed, {skipped} skipped")
+        return {"hashed": hashed, "alreadyHashed": current, "skipped": skipped}
+
+# JSON responses that embed stored documents without parsing them
+class RawJSON:
+    """
+    An already-serialized JSON value (UTF-8 bytes), written into dumps_json output as is
+    value parses it on first use, or returns the object it was encoded from
+    """
+    
+    __slots__ = ("data", "_value")
+    _UNPARSED = object()
+    
+    def __init__(self, data, value=_UNPARSED):
+        self.data = data
+        self._value = value
+    
+    @property
+    def value(self):
+        if self._value is RawJSON._UNPARSED:
+            self._value = orjson.loads(self.data) if orjson else json.loads(self.data)
+        return self._value
+
+# Placeholders stand in for RawJSON values while the rest of a document is encoded
+_RAW_JSON_PLACEHOLDER = f"raw-json-{uuid.uuid4().hex}-"
+
+def dumps_json(obj):
+    """
+    Compact UTF-8 JSON of obj, with orjson when it is installed
+    RawJSON values anywhere in obj are spliced in without being parsed or re-encoded
+    """
+    fragments = []
+    
+    def embed(value):
+        if isinstance(value, RawJSON):
+            fragments.append(value.data)
+            return f"{_RAW_JSON_PLACEHOLDER}{len(fragments) - 1}"
+        raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+    
+    if orjson:
+        data = orjson.dumps(obj, default=embed, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        data = json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=embed).encode("utf-8")
+    for i, fragment in enumerate(fragments):
+        data = data.replace(f'"{_RAW_JSON_PLACEHOLDER}{i}"'.encode(), fragment, 1)
+    return data
+
+def encode_document(document):
+    """The stored (and served) serialization of an analysis document, as RawJSON"""
+    return RawJSON(dumps_json(document), document)
+
+def splice_members(envelope, document):
+    """
+    JSON of {**envelope, **document.value}, built from document's bytes without parsing them
+    document must hold a JSON object; its members come last, so they win on a duplicate key
+    """
+    head = dumps_json(envelope)
+    members = document.data.strip()[1:]
+    if not members.lstrip().startswith(b"}") and len(head) > 2:
+        members = b"," + members
+    return head[:-1] + members
+
+# Full analysis documents, kept out of Table Storage
+class AnalysisDocumentStore:
+    """
+    Full analysis documents as gzip-compressed JSON blobs
+    Table entities carry only the summary fields and the blob name, which keeps them far
+    below the 64 KB property limit and keeps the payload off every summary query
+    """
+    
+    def __init__(self, blob_service=None):
+        self.blob_service = blob_service or get_blob_service_client()
+        self.container_name = ANALYSIS_RESULTS_CONTAINER
+        ensure_container(self.blob_service, self.container_name)
+    
+    @staticmethod
+    def blob_name(partition_key, row_key):
+        """Blob holding the document of the analysis entity with these keys"""
+        return f"{partition_key}/{row_key}.json.gz"
+    
+    def save(self, blob_name, analysis_data):
+        """Compress and store an analysis document (a dict, or its encode_document RawJSON); returns its stored size in bytes"""
+        raw = (analysis_data if isinstance(analysis_data, RawJSON) else encode_document(analysis_data)).data
+        compressed = gzip.compress(raw, compresslevel=6, mtime=0)
+        
+        blob_client = self.blob_service.get_blob_client(container=self.container_name, blob=blob_name)
+        blob_client.upload_blob(
+            compressed,
+            overwrite=True,
+            content_settings=ContentSettings(content_type="application/json", content_encoding="gzip")
+        )
+        
+        metrics.increment("analysis_documents.saved")
+        metrics.increment("analysis_documents.bytes_raw", len(raw))
+        metrics.increment("analysis_documents.bytes_stored", len(compressed))
+        return len(compressed)
+    
+    def load(self, blob_name):
+        """Read and decompress an analysis document"""
+        return self.load_raw(blob_name).value
+    
+    def load_raw(self, blob_name):
+        """Read and decompress an analysis document, left serialized (RawJSON)"""
+        started = time.perf_counter()
+        blob_client = self.blob_service.get_blob_client(container=self.container_name, blob=blob_name)
+        data = blob_client.download_blob().readall()
+        # The SDK hands back the stored bytes; tolerate a transport that already decoded them
+        document = RawJSON(gzip.decompress(data) if data[:2] == b"\x1f\x8b" else data)
+        
+        metrics.increment("analysis_documents.loaded")
+        metrics.observe("analysis_documents.load", (time.perf_counter() - started) * 1000)
+        return document
+
+# Per-day analysis statistics
+class AnalysisStatsRepository:
+    """
+    Running per-day totals of saved analyses in Table Storage
+    Each history partition (day and shard, see results_partition_key) has one totals row in the
+    partition of the same name, so saves to different shards never contend; reading a day is
+    one point read per shard. Every update is an ETag-guarded read-modify-write, so concurrent
+    savers never lose counts
+    """
+    
+    ROW_KEY = "totals"
+    COUNTERS = ("images", "imagesWithFaces", "imagesWithObjects", "imagesWithText",
+                "totalFaces", "totalObjects", "confidenceCount")
+    SUMS = ("confidenceSum",)
+    # Summary columns of an analysis entity that its contribution is computed from
+    SOURCE_COLUMNS = ["imageId", "analysisTime", "faceCount", "objectCount", "hasText", "confidence"]
+    MAX_CONFLICT_RETRIES = 10
+    
+    def __init__(self, table_service=None):
+        self.table_service = table_service or get_table_service_client()
+        self.table_name = "AnalysisDailyStats"
+        ensure_table(self.table_service, self.table_name)
+    
+    @staticmethod
+    def day_of(entity):
+        """Day an analysis entity counts towards"""
+        return entity["analysisTime"][:10]
+    
+    @classmethod
+    def partition_of(cls, entity):
+        """Partition of the totals row an analysis entity counts towards"""
+        return results_partition_key(cls.day_of(entity), entity["imageId"])
+    
+    @classmethod
+    def contribution(cls, entity):
+        """What one analysis entity adds to its day's totals"""
+        face_count = int(entity.get("faceCount", 0) or 0)
+        object_count = int(entity.get("objectCount", 0) or 0)
+        confidence = float(entity.get("confidence", 0.0) or 0.0)
+        return {
+            "images": 1,
+            "imagesWithFaces": int(face_count > 0),
+            "imagesWithObjects": int(object_count > 0),
+            "imagesWithText": int(bool(entity.get("hasText", False))),
+            "totalFaces": face_count,
+            "totalObjects": object_count,
+            "confidenceCount": int(confidence > 0),
+            "confidenceSum": confidence if confidence > 0 else 0.0
+        }
+    
+    @classmethod
+    def delta(cls, entity, previous=None):
+        """Change to a day's totals from saving entity, replacing previous (same row) if given"""
+        added = cls.contribution(entity)
+        if previous is None:
+            return added
+        removed = cls.contribution(previous)
+        return {field: added[field] - removed[field] for field in added}
+    
+    def apply(self, partition_key, delta):
+        """Add delta to the totals row of one day and shard"""
+        table_client = self.table_service.get_table_client(self.table_name)
+        for _ in range(self.MAX_CONFLICT_RETRIES):
+            try:
+                entity = table_client.get_entity(partition_key=partition_key, row_key=self.ROW_KEY)
+            except ResourceNotFoundError:
+                entity = TableEntity()
+                entity.update({"PartitionKey": partition_key, "RowKey": self.ROW_KEY})
+                entity.update({field: int(delta.get(field, 0)) for field in self.COUNTERS})
+                entity.update({field: float(delta.get(field, 0.0)) for field in self.SUMS})
+                try:
+                    table_client.create_entity(entity)
+                    return
+                except ResourceExistsError:
+                    metrics.increment("stats.rollup_conflicts")
+                    continue
             
-            # Save to table
-            table_client = self.table_service.get_table_client(self.table_name)
-            table_client.create_entity(entity)
-            
-            logging.info(f"Saved analysis results for image {image_id}")
-            return True
-            
-        except Exception as e:
-            logging.error(f"Error saving analysis results: {str(e)}")
-            return False
+            for field in self.COUNTERS:
+                entity[field] = int(entity.get(field, 0)) + int(delta.get(field, 0))
+            for field in self.SUMS:
+                entity[field] = float(entity.get(field, 0.0)) + float(delta.get(field, 0.0))
+            try:
+                table_client.update_entity(
+                    entity, mode=UpdateMode.REPLACE,
+                    etag=entity.metadata["etag"], match_condition=MatchConditions.IfNotModified
+                )
+                return
+            except ResourceModifiedError:
+                # Another save updated the day in between; re-read and try again
+                metrics.increment("stats.rollup_conflicts")
+        
+        raise RuntimeError(f"Stats rollup {partition_key} kept changing; gave up after {self.MAX_CONFLICT_RETRIES} attempts")
+    
+    def apply_entities(self, saved):
+        """Fold (entity, previous) pairs into their totals rows, one update per day and shard"""
+        by_partition = {}
+        for entity, previous in saved:
+            partition_delta = by_partition.setdefault(self.partition_of(entity), dict.fromkeys(self.COUNTERS + self.SUMS, 0))
+            for field, value in self.delta(entity, previous).items():
+                partition_delta[field] += value
+        
+        for partition_key, partition_delta in by_partition.items():
+            try:
+                self.apply(partition_key, partition_delta)
+            except Exception as e:
+                # The saved analyses stand; manage.py rebuild-stats repairs the totals
+                logging.error(f"Error updating stats rollup {partition_key}: {str(e)}")
+                metrics.increment("stats.rollup_failures")
+    
+    def get_days(self, days):
+        """Totals for each of the given days (days without analyses are omitted), read concurrently"""
+        table_client = self.table_service.get_table_client(self.table_name)
+        
+        def read(partition_key):
+            try:
+                return partition_key, table_client.get_entity(partition_key=partition_key, row_key=self.ROW_KEY)
+            except ResourceNotFoundError:
+                return partition_key, None
+        
+        # Totals rows share their history partition's name, so a day's rows are found the same way
+        partitions = {partition: day for day in days for partition in day_partitions(day)}
+        totals = {}
+        with ThreadPoolExecutor(max_workers=min(16, len(partitions) or 1), thread_name_prefix="stats-rollup") as executor:
+            for partition_key, entity in executor.map(read, partitions):
+                if entity is None:
+                    continue
+                day_totals = totals.setdefault(partitions[partition_key], dict.fromkeys(self.COUNTERS + self.SUMS, 0))
+                for field in self.COUNTERS + self.SUMS:
+                    day_totals[field] += entity.get(field, 0)
+        return totals
+    
+    def rebuild(self, results_table_client):
+        """Recompute every day's totals from the analysis history table"""
+        by_partition = {}
+        rows = 0
+        for entity in results_table_client.list_entities(select=self.SOURCE_COLUMNS):
+            if not entity.get("analysisTime"):
+                continue
+            partition_totals = by_partition.setdefault(self.partition_of(entity), dict.fromkeys(self.COUNTERS + self.SUMS, 0))
+            for field, value in self.contribution(entity).items():
+                partition_totals[field] += value
+            rows += 1
+        
+        table_client = self.table_service.get_table_client(self.table_name)
+        for partition_key, partition_totals in by_partition.items():
+            entity = TableEntity()
+            entity.update({"PartitionKey": partition_key, "RowKey": self.ROW_KEY, **partition_totals})
+            entity.update({field: float(entity[field]) for field in self.SUMS})
+            table_client.upsert_entity(entity, mode=UpdateMode.REPLACE)
+        
+        # Rows the history no longer accounts for (e.g. from before sharding) would be counted twice
+        stale = 0
+        for entity in table_client.list_entities(select=["PartitionKey", "RowKey"]):
+            if entity["PartitionKey"] not in by_partition or entity["RowKey"] != self.ROW_KEY:
+                table_client.delete_entity(partition_key=entity["PartitionKey"], row_key=entity["RowKey"])
+                stale += 1
+        
+        days = len({partition_key[:10] for partition_key in by_partition})
+        logging.info(f"Stats rebuild complete: {rows} analyses over {days} days, {stale} stale rows removed")
+        return {"analyses": rows, "days": days, "staleRowsRemoved": stale}
+
+# Search indexes over analysis content
+class TermPostings:
+    """
+    One index key's entries in imageId order, read a page at a time
+    seek() answers from the page in hand and otherwise starts a fresh query at the wanted
+    imageId, so runs of entries that cannot match are skipped rather than paged through
+    """
+    
+    def __init__(self, table_client, partition_key, select, since=None, page_size=1000):
+        self.table_client = table_client
+        self.partition_key = partition_key
+        self.select = select
+        self.since = since
+        self.page_size = page_size
+        self.entries = []
+        self.position = 0
+        self.exhausted = False
+        self.pages = 0
+    
+    def _query(self, row_key, inclusive):
+        clauses = ["PartitionKey eq @partition_key", f"RowKey {'ge' if inclusive else 'gt'} @row_key"]
+        parameters = {"partition_key": self.partition_key, "row_key": row_key}
+        if self.since:
+            clauses.append("analysisTime ge @since")
+            parameters["since"] = self.since
+        pager = self.table_client.query_entities(
+            " and ".join(clauses), parameters=parameters, select=self.select, results_per_page=self.page_size
+        ).by_page()
+        self.entries = []
+        self.position = 0
+        # With the since filter a page can come back empty while more entries follow
+        for page in pager:
+            self.pages += 1
+            self.entries = list(page)
+            if self.entries:
+                break
+        self.exhausted = not pager.continuation_token
+    
+    def seek(self, row_key, inclusive=True):
+        """First entry with RowKey >= row_key (> if not inclusive), or None once the key runs out"""
+        while True:
+            while self.position < len(self.entries) and (
+                    self.entries[self.position]["RowKey"] < row_key
+                    or (not inclusive and self.entries[self.position]["RowKey"] == row_key)):
+                self.position += 1
+            if self.position < len(self.entries):
+                return self.entries[self.position]
+            if self.exhausted:
+                return None
+            self._query(row_key, inclusive)
+
+def intersect_postings(postings, after=None):
+    """
+    Yield (imageId, [entry from each postings]) for every imageId in all of them, in order
+    Leapfrog: every key moves up to the candidate; the first that overshoots proposes the next one
+    """
+    head = postings[0].seek(after or "", inclusive=after is None)
+    candidate = head["RowKey"] if head else None
+    while candidate is not None:
+        for term in postings:
+            head = term.seek(candidate)
+            if head is None or head["RowKey"] != candidate:
+                candidate = head["RowKey"] if head else None
+                break
+        else:
+            yield candidate, [term.seek(candidate) for term in postings]
+            head = postings[0].seek(candidate, inclusive=False)
+            candidate = head["RowKey"] if head else None
+
+class InvertedIndexRepository:
+    """
+    Inverted index over analysis content in Table Storage
+    One entry per (key, image): PartitionKey is the index key, RowKey the imageId, so a key's
+    images are one partition read in imageId order and multi-key queries intersect sorted runs.
+    Analysis entities record the keys they are indexed under in COLUMN, which lets a
+    re-analysis delete the entries of keys the image no longer has
+    """
+    
+    TABLE_NAME = None
+    COLUMN = None
+    METRIC = None
+    MAX_QUERY_TERMS = 8
+    
+    def __init__(self, table_service=None):
+        self.table_service = table_service or get_table_service_client()
+        self.table_name = self.TABLE_NAME
+        ensure_table(self.table_service, self.table_name)
+    
+    @classmethod
+    def indexed_keys(cls, entity):
+        """Index keys recorded on an analysis entity, or none for a missing entity"""
+        return set(json.loads((entity or {}).get(cls.COLUMN) or "[]"))
+    
+    def entries(self, entity, analysis_data):
+        """Index entries of one analysis entity"""
+        raise NotImplementedError
+    
+    def operations(self, entity, analysis_data, previous=None):
+        """Transaction operations that bring an image's entries in line with its analysis, replacing previous"""
+        entries = self.entries(entity, analysis_data)
+        operations = [("upsert", entry, {"mode": UpdateMode.REPLACE}) for entry in entries]
+        for key in self.indexed_keys(previous) - {entry["PartitionKey"] for entry in entries}:
+            operations.append(("delete", {"PartitionKey": key, "RowKey": entity["imageId"]}))
+        return operations
+    
+    def _write(self, table_client, operation):
+        action, entry = operation[0], operation[1]
+        if action == "upsert":
+            table_client.upsert_entity(entry, mode=UpdateMode.REPLACE)
+        else:
+            try:
+                table_client.delete_entity(partition_key=entry["PartitionKey"], row_key=entry["RowKey"])
+            except ResourceNotFoundError:
+                pass
+    
+    def apply_entities(self, saved):
+        """Bring the index in line with saved (entity, analysis document, previous "latest" row or None) triples"""
+        operations = []
+        for entity, analysis_data, previous in saved:
+            operations.extend(self.operations(entity, analysis_data, previous))
+        self.apply_operations(operations)
+    
+    def apply_operations(self, operations):
+        """
+        Write index operations; those of one key share a partition, so a batch writes each key
+        in transactions, and different keys are written concurrently. Transactions are kept
+        under the service's operation and payload limits; one the service still finds too
+        large is split in half and retried
+        """
+        by_partition = defaultdict(list)
+        for operation in operations:
+            by_partition[operation[1]["PartitionKey"]].append(operation)
+        if not by_partition:
+            return
+        
+        table_client = self.table_service.get_table_client(self.table_name)
+        
+        def write(partition_operations):
+            chunks = deque(ImageAnalysisRepository.transaction_chunks(partition_operations, entity_of=lambda operation: operation[1]))
+            while chunks:
+                chunk = chunks.popleft()
+                if len(chunk) > 1:
+                    try:
+                        table_client.submit_transaction(chunk)
+                        metrics.increment("table.transactions")
+                        continue
+                    except RequestTooLargeError.resolve():
+                        metrics.increment(f"{self.METRIC}.transactions_split")
+                        half = len(chunk) // 2
+                        chunks.extendleft([chunk[half:], chunk[:half]])
+                        continue
+                    except TableTransactionError.resolve():
+                        # e.g. a delete of an entry that is already gone; one at a time tolerates it
+                        pass
+                for operation in chunk:
+                    self._write(table_client, operation)
+        
+        with ThreadPoolExecutor(max_workers=min(8, len(by_partition)), thread_name_prefix=self.METRIC) as executor:
+            futures = {executor.submit(write, partition): key for key, partition in by_partition.items()}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    # The saved analyses stand; the index's manage.py rebuild command repairs the entries
+                    logging.error(f"Error updating {self.table_name} entries for {futures[future]}: {str(e)}")
+                    metrics.increment(f"{self.METRIC}.failures")
+        
+        metrics.increment(f"{self.METRIC}.entries_written", sum(1 for operation in operations if operation[0] == "upsert"))
+        metrics.increment(f"{self.METRIC}.entries_deleted", sum(1 for operation in operations if operation[0] == "delete"))
+    
+    def prune(self, expected):
+        """Delete entries whose (PartitionKey, RowKey) is not in expected; returns how many"""
+        table_client = self.table_service.get_table_client(self.table_name)
+        stale = 0
+        for entry in table_client.list_entities(select=["PartitionKey", "RowKey"]):
+            if (entry["PartitionKey"], entry["RowKey"]) not in expected:
+                table_client.delete_entity(partition_key=entry["PartitionKey"], row_key=entry["RowKey"])
+                stale += 1
+        return stale
+    
+    @staticmethod
+    def encode_cursor(query, after):
+        """Opaque cursor resuming a search at `after` (an imageId or ranking offset)"""
+        state = json.dumps({"query": query, "after": after}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(state.encode("utf-8")).decode("ascii").rstrip("=")
+    
+    @staticmethod
+    def _cursor_state(cursor):
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if state["query"]["since"] is not None:
+            datetime.datetime.strptime(state["query"]["since"], "%Y-%m-%d")
+        return state
+
+class TermIndexRepository(InvertedIndexRepository):
+    """
+    Index of analysis tags and detected object names
+    Keys are the kind and normalized name ("tag:dog", "object:person"); searches return the
+    images carrying every given name in imageId order and page with the last imageId returned
+    """
+    
+    TABLE_NAME = "AnalysisTermIndex"
+    COLUMN = "indexTerms"
+    METRIC = "term_index"
+    KINDS = ("tag", "object")
+    # Columns of an index entry read back by searches
+    ENTRY_COLUMNS = ["RowKey", "blobName", "analysisTime", "confidence"]
+    MAX_TERM_LENGTH = 200
+    
+    @classmethod
+    def normalize(cls, value):
+        """Index form of a tag or object name: lower case, single spaces, none of the characters Table keys reject"""
+        cleaned = "".join(" " if char in "/\\#?" or ord(char) < 32 or 127 <= ord(char) < 160 else char for char in str(value))
+        return " ".join(cleaned.lower().split())[:cls.MAX_TERM_LENGTH]
+    
+    @classmethod
+    def key(cls, kind, name):
+        """Index key (entry PartitionKey) of a tag or object name"""
+        return f"{kind}:{cls.normalize(name)}"
+    
+    @classmethod
+    def terms_of(cls, analysis_data):
+        """{index key: highest confidence} for the tags and object names of an analysis document"""
+        analysis = analysis_data.get("analysis", {})
+        terms = {}
+        for kind, items in (("tag", analysis.get("tags") or []), ("object", analysis.get("objects") or [])):
+            for item in items:
+                if not cls.normalize(item.get("name", "")):
+                    continue
+                key = cls.key(kind, item["name"])
+                terms[key] = max(terms.get(key, 0.0), round(float(item.get("confidence", 0.0) or 0.0), 4))
+        return terms
+    
+    @classmethod
+    def column_value(cls, analysis_data):
+        """indexTerms column of an analysis entity: {index key: confidence} as JSON"""
+        return json.dumps(cls.terms_of(analysis_data), separators=(",", ":"))
+    
+    @classmethod
+    def needs_document(cls, entity):
+        """True if rebuilding this entity's entries needs its analysis document"""
+        return entity.get(cls.COLUMN) is None
+    
+    def entries(self, entity, analysis_data=None):
+        """One entry per tag and object name, taken from the entity's indexTerms column"""
+        entries = []
+        for key, confidence in json.loads(entity.get(self.COLUMN) or "{}").items():
+            entry = TableEntity()
+            entry.update({
+                "PartitionKey": key,
+                "RowKey": entity["imageId"],
+                "blobName": entity.get("blobName", ""),
+                "analysisTime": entity.get("analysisTime", ""),
+                "confidence": confidence
+            })
+            entries.append(entry)
+        return entries
+    
+    @classmethod
+    def decode_cursor(cls, cursor):
+        """Term query and resume imageId from a cursor; raises ValueError if it is not one of ours"""
+        try:
+            state = cls._cursor_state(cursor)
+            query = state["query"]
+            if not query["terms"] or not all(isinstance(key, str) and key.split(":", 1)[0] in cls.KINDS for key in query["terms"]):
+                raise ValueError("unknown term")
+            if not isinstance(state["after"], str):
+                raise ValueError("malformed position")
+            return query, state["after"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {str(e)}")
+    
+    def search(self, terms, since=None, max_results=50, cursor=None):
+        """
+        Images indexed under every one of terms (index keys), in imageId order
+        since ("YYYY-MM-DD") keeps images whose latest analysis is that recent; with a cursor,
+        its query replaces terms and since. Returns (matches, cursor for the next page or None);
+        the last page can come back empty
+        """
+        if cursor:
+            query, after = self.decode_cursor(cursor)
+        else:
+            query = {"terms": sorted(set(terms)), "since": since}
+            after = None
+        if not query["terms"]:
+            raise ValueError("At least one tag or object is required")
+        if len(query["terms"]) > self.MAX_QUERY_TERMS:
+            raise ValueError(f"At most {self.MAX_QUERY_TERMS} tags and objects can be combined")
+        
+        table_client = self.table_service.get_table_client(self.table_name)
+        # A single term is read straight through; intersections seek, so larger pages skip more per round trip
+        page_size = min(max_results + 1, 1000) if len(query["terms"]) == 1 else 1000
+        postings = [TermPostings(table_client, key, self.ENTRY_COLUMNS, query["since"], page_size) for key in query["terms"]]
+        
+        matches = []
+        for image_id, entries in intersect_postings(postings, after):
+            matches.append({
+                "imageId": image_id,
+                "blobName": entries[0].get("blobName", ""),
+                "analysisTime": entries[0].get("analysisTime", ""),
+                "matches": {key: entry.get("confidence", 0.0) for key, entry in zip(query["terms"], entries)}
+            })
+            if len(matches) >= max_results:
+                break
+        
+        more = len(matches) >= max_results and postings[0].seek(matches[-1]["imageId"], inclusive=False) is not None
+        metrics.increment("term_index.pages_read", sum(term.pages for term in postings))
+        return matches, self.encode_cursor(query, matches[-1]["imageId"]) if more else None
+
+# Most OCR matches a text search ranks; each needs its index entries read
+TEXT_SEARCH_MAX_CANDIDATES = int(os.environ.get("TEXT_SEARCH_MAX_CANDIDATES", "1000"))
+
+class TextIndexRepository(InvertedIndexRepository):
+    """
+    Full-text index of the OCR lines of each image's analysis
+    Keys are word tokens. An entry records where its token occurs (line and word position)
+    and the text and bounding box of those lines, so a search answers phrase matches and
+    hit locations from the index without opening analysis documents
+    """
+    
+    TABLE_NAME = "AnalysisTextIndex"
+    COLUMN = "textTerms"
+    METRIC = "text_index"
+    ENTRY_COLUMNS = ["RowKey", "blobName", "analysisTime", "occurrences", "tokenCount", "positions", "lines"]
+    MAX_TOKEN_LENGTH = 100
+    # Distinct tokens indexed per image
+    MAX_IMAGE_TOKENS = 2000
+    # Characters of the textTerms column (ASCII JSON): string properties hold at most 32K UTF-16 characters (64 KiB)
+    MAX_COLUMN_JSON = 30000
+    # Characters of positions, and of line details, kept on one entry
+    MAX_ENTRY_JSON = 30000
+    MAX_HITS = 5
+    # BM25 term-frequency saturation and length normalisation (average OCR words per image)
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+    AVERAGE_TOKENS = 100
+    
+    @classmethod
+    def tokenize(cls, text):
+        """Word tokens of a line or query: case-folded runs of letters and digits, accents removed"""
+        decomposed = unicodedata.normalize("NFKD", str(text).casefold())
+        folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+        return [token[:cls.MAX_TOKEN_LENGTH] for token in re.findall(r"\w+", folded)]
+    
+    @staticmethod
+    def ocr_lines(analysis_data):
+        """OCR lines of an analysis document"""
+        return ((analysis_data or {}).get("analysis", {}).get("text") or {}).get("extracted_text") or []
+    
+    @classmethod
+    def postings(cls, lines):
+        """
+        ({token: {line number: [word positions]}}, total words) for the first tokens, up to
+        MAX_IMAGE_TOKENS of them and as many as the textTerms column fits in MAX_COLUMN_JSON
+        """
+        postings = {}
+        words = 0
+        column_size = 2
+        for line_number, line in enumerate(lines):
+            for position, token in enumerate(cls.tokenize(line.get("text", ""))):
+                words += 1
+                if token not in postings:
+                    token_size = len(json.dumps(token)) + 1
+                    if len(postings) >= cls.MAX_IMAGE_TOKENS or column_size + token_size > cls.MAX_COLUMN_JSON:
+                        continue
+                    column_size += token_size
+                postings.setdefault(token, {}).setdefault(line_number, []).append(position)
+        return postings, words
+    
+    @classmethod
+    def column_value(cls, analysis_data):
+        """textTerms column of an analysis entity: its indexed tokens as JSON"""
+        postings, _ = cls.postings(cls.ocr_lines(analysis_data))
+        return json.dumps(list(postings), separators=(",", ":"))
+    
+    @staticmethod
+    def needs_document(entity):
+        """True if rebuilding this entity's entries needs its analysis document"""
+        return bool(entity.get("hasText"))
+    
+    @classmethod
+    def _capped_json(cls, items):
+        """JSON object of (key, value) items, dropping later ones past MAX_ENTRY_JSON characters"""
+        kept = {}
+        size = 2
+        for key, value in items:
+            size += len(json.dumps({key: value}, separators=(",", ":")))
+            if size > cls.MAX_ENTRY_JSON:
+                break
+            kept[key] = value
+        return json.dumps(kept, separators=(",", ":"))
+    
+    def entries(self, entity, analysis_data):
+        """One entry per token of the document's OCR lines"""
+        lines = self.ocr_lines(analysis_data)
+        postings, words = self.postings(lines)
+        entries = []
+        for token, occurrences in postings.items():
+            entry = TableEntity()
+            entry.update({
+                "PartitionKey": token,
+                "RowKey": entity["imageId"],
+                "blobName": entity.get("blobName", ""),
+                "analysisTime": entity.get("analysisTime", ""),
+                "occurrences": sum(len(positions) for positions in occurrences.values()),
+                "tokenCount": words,
+                "positions": self._capped_json((str(line), positions) for line, positions in occurrences.items()),
+                "lines": self._capped_json(
+                    (str(line), {"text": lines[line].get("text", ""), "bounding_box": lines[line].get("bounding_box")})
+                    for line in occurrences
+                )
+            })
+            entries.append(entry)
+        return entries
+    
+    @classmethod
+    def decode_cursor(cls, cursor):
+        """Text query and ranking offset from a cursor; raises ValueError if it is not one of ours"""
+        try:
+            state = cls._cursor_state(cursor)
+            query = state["query"]
+            if not isinstance(query["q"], str) or not cls.tokenize(query["q"]):
+                raise ValueError("missing query")
+            if not isinstance(state["after"], int) or state["after"] < 0:
+                raise ValueError("malformed position")
+            return query, state["after"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {str(e)}")
+    
+    def _score(self, words, entries):
+        """Ranked result for one image from the entries of each distinct query word"""
+        by_token = dict(zip(sorted(set(words)), entries))
+        positions = {token: json.loads(entry.get("positions") or "{}") for token, entry in by_token.items()}
+        
+        # Lines holding the words as a phrase, with how many times
+        phrase_lines = {}
+        for line in set.intersection(*(set(line_positions) for line_positions in positions.values())):
+            starts = set(positions[words[0]][line])
+            for offset, word in enumerate(words[1:], 1):
+                starts &= {position - offset for position in positions[word][line]}
+            if starts:
+                phrase_lines[line] = len(starts)
+        
+        score = 0.0
+        for entry in by_token.values():
+            frequency = entry.get("occurrences", 0)
+            length = 1 - self.BM25_B + self.BM25_B * entry.get("tokenCount", 0) / self.AVERAGE_TOKENS
+            score += frequency * (self.BM25_K1 + 1) / (frequency + self.BM25_K1 * length)
+        if len(words) > 1:
+            score += sum(phrase_lines.values())
+        
+        hit_lines = sorted(phrase_lines or {line for line_positions in positions.values() for line in line_positions}, key=int)
+        details = {}
+        for entry in by_token.values():
+            details.update(json.loads(entry.get("lines") or "{}"))
+        first = entries[0]
+        return {
+            "imageId": first["RowKey"],
+            "blobName": first.get("blobName", ""),
+            "analysisTime": first.get("analysisTime", ""),
+            "score": round(score, 4),
+            "phrase_matches": sum(phrase_lines.values()),
+            "hit_count": len(hit_lines),
+            "hits": [{"line": int(line), **details.get(line, {})} for line in hit_lines[:self.MAX_HITS]]
+        }
+    
+    def search(self, text, since=None, max_results=20, cursor=None):
+        """
+        Images whose OCR text contains every word of text, best first
+        The score adds the BM25 term-frequency weight of each word (IDF is left out, since every
+        match holds every word) and one per occurrence of the words as a phrase within a line.
+        Ranking needs all matches, so at most TEXT_SEARCH_MAX_CANDIDATES are read, in imageId
+        order; pages are offsets into the ranking and each one re-runs it
+        Returns (results, cursor for the next page or None, whether candidates were cut off)
+        """
+        if cursor:
+            query, offset = self.decode_cursor(cursor)
+        else:
+            query = {"q": text or "", "since": since}
+            offset = 0
+        words = self.tokenize(query["q"])
+        if not words:
+            raise ValueError("q must contain at least one word")
+        if len(set(words)) > self.MAX_QUERY_TERMS:
+            raise ValueError(f"At most {self.MAX_QUERY_TERMS} distinct words can be searched")
+        
+        table_client = self.table_service.get_table_client(self.table_name)
+        postings = [TermPostings(table_client, token, self.ENTRY_COLUMNS, query["since"]) for token in sorted(set(words))]
+        matches = intersect_postings(postings)
+        ranked = [self._score(words, entries) for _, entries in itertools.islice(matches, TEXT_SEARCH_MAX_CANDIDATES)]
+        truncated = len(ranked) >= TEXT_SEARCH_MAX_CANDIDATES and next(matches, None) is not None
+        ranked.sort(key=lambda result: (-result["score"], result["imageId"]))
+        
+        metrics.increment("text_index.pages_read", sum(term.pages for term in postings))
+        if truncated:
+            metrics.increment("text_index.searches_truncated")
+        page = ranked[offset:offset + max_results]
+        more = offset + max_results < len(ranked)
+        return page, self.encode_cursor(query, offset + max_results) if more else None, truncated
+
+# Colour-similarity search: a feature matrix of every image's stored colours, memory-mapped
+# from local disk and compared against a query with vectorised NumPy arithmetic
+COLOR_NAMES = ("black", "blue", "brown", "gray", "green", "orange", "pink", "purple", "red", "teal", "white", "yellow")
+COLOR_ALIASES = {"grey": "gray"}
+COLOR_INDEX_PATH = os.environ.get("COLOR_INDEX_PATH", os.path.join(tempfile.gettempdir(), "color-index"))
+COLOR_INDEX_REFRESH_SECONDS = float(os.environ.get("COLOR_INDEX_REFRESH_SECONDS", "60"))
+COLOR_INDEX_REBUILD_HOURS = float(os.environ.get("COLOR_INDEX_REBUILD_HOURS", "24"))
+
+class ColorFeatureIndex:
+    """
+    Nearest-palette search over the latest analysis of every image with colour results
+    Each image is a float32 row: its dominant colours as a unit-length vector over COLOR_NAMES,
+    its accent colour as scaled RGB, and a black-and-white flag. Rows, squared norms and
+    imageIds live in .npy files under COLOR_INDEX_PATH, opened as memory maps, so a restarted
+    worker reopens the matrix instead of rereading Table Storage, and worker processes on one
+    host share it (writers hold an exclusive file lock)
+
+    The matrix is built from the colorFeatures column of the "latest" rows (COLOR_INDEX_REBUILD_HOURS
+    apart), and refreshed in between from the history partitions of days since the last refresh
+    """
+
+    COLUMN = "colorFeatures"
+    DIMENSIONS = len(COLOR_NAMES) + 4
+    ACCENT_WEIGHT = 0.5
+    BW_WEIGHT = 0.5
+    # imageIds are UUIDs; the ids file holds them as fixed-width ASCII, so anything else is left out
+    ID_BYTES = 36
+    ID_PATTERN = re.compile(r"[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}")
+    # Analyses saved within this long before a refresh started are read again by the next one,
+    # so clock skew between workers cannot hide a save
+    REFRESH_OVERLAP = datetime.timedelta(minutes=5)
+    SCAN_RANGES = "0123456789abcdefg"
+    FORMAT_VERSION = 1
+
+    def __init__(self, repository=None, path=None):
+        self._repository = repository
+        self.path = path or COLOR_INDEX_PATH
+        self._lock = threading.Lock()
+        self._meta = None
+        self._arrays = None
+        self._rows = {}
+        self._refreshed = 0.0
+
+    @property
+    def repository(self):
+        if self._repository is None:
+            self._repository = ImageAnalysisRepository()
+        return self._repository
+
+    @staticmethod
+    def colors_of(analysis_data):
+        """Stored colour results of an analysis document, or None if colour was not analyzed"""
+        if "color" not in stored_features(analysis_data):
+            return None
+        metadata = analysis_data.get("analysis", {}).get("metadata", {})
+        if "dominant_colors" not in metadata:
+            return None
+        return {
+            "dominant": list(metadata.get("dominant_colors") or []),
+            "accent": metadata.get("accent_color") or "",
+            "bw": bool(metadata.get("is_bw_image"))
+        }
+
+    @classmethod
+    def column_value(cls, analysis_data):
+        """colorFeatures column of an analysis entity: its colours as JSON, empty without colour results"""
+        colors = cls.colors_of(analysis_data)
+        return json.dumps(colors, separators=(",", ":")) if colors else ""
+
+    @classmethod
+    def parse_query(cls, colors="", accent="", bw=False):
+        """Colours from query parameters; raises ValueError for unknown names or a malformed accent"""
+        names = [name.strip().lower() for name in colors.split(",") if name.strip()]
+        unknown = sorted({name for name in names if COLOR_ALIASES.get(name, name) not in COLOR_NAMES})
+        if unknown:
+            raise ValueError(f"Unknown color(s): {', '.join(unknown)}. Valid: {', '.join(COLOR_NAMES)}")
+        accent = accent.strip().lstrip("#")
+        if accent and not re.fullmatch(r"[0-9A-Fa-f]{6}", accent):
+            raise ValueError("accent must be a 6-digit hex RGB color, e.g. 4F94CD")
+        if not names and not accent:
+            raise ValueError("Give an imageId, or colors and/or accent")
+        return {"dominant": names, "accent": accent.upper(), "bw": bw}
+
+    @classmethod
+    def vector(cls, colors):
+        """Feature row of a colours dict (see colors_of)"""
+        vector = np.zeros(cls.DIMENSIONS, dtype=np.float32)
+        names = {COLOR_ALIASES.get(name.lower(), name.lower()) for name in colors.get("dominant", [])}
+        names &= set(COLOR_NAMES)
+        for name in names:
+            vector[COLOR_NAMES.index(name)] = len(names) ** -0.5
+        accent = colors.get("accent") or ""
+        if re.fullmatch(r"[0-9A-Fa-f]{6}", accent):
+            vector[len(COLOR_NAMES):len(COLOR_NAMES) + 3] = [
+                int(accent[i:i + 2], 16) / 255 * cls.ACCENT_WEIGHT for i in (0, 2, 4)
+            ]
+        vector[-1] = cls.BW_WEIGHT if colors.get("bw") else 0.0
+        return vector
+
+    @classmethod
+    def decode(cls, vector):
+        """Colours dict of a feature row, for reporting matches"""
+        rgb = vector[len(COLOR_NAMES):len(COLOR_NAMES) + 3] / cls.ACCENT_WEIGHT
+        return {
+            "dominantColors": [name for name, weight in zip(COLOR_NAMES, vector) if weight > 0],
+            "accentColor": "".join(f"{int(round(float(channel) * 255)):02X}" for channel in rgb) if rgb.any() else None,
+            "isBwImage": bool(vector[-1] > 0)
+        }
+
+    @classmethod
+    def _key(cls, image_id):
+        """Stored id bytes of an imageId, or None if it is not a UUID and so cannot be indexed"""
+        if not isinstance(image_id, str) or not cls.ID_PATTERN.fullmatch(image_id):
+            return None
+        return image_id.encode("ascii")
+
+    @classmethod
+    def _indexable(cls, entries):
+        """entries ({imageId: value}) without the imageIds that are not UUIDs, which are logged and counted"""
+        skipped = [image_id for image_id in entries if cls._key(image_id) is None]
+        if skipped:
+            logging.warning(f"Color index: skipping {len(skipped)} non-UUID imageId(s), e.g. {skipped[0]!r}")
+            metrics.increment("color_index.skipped_ids", len(skipped))
+        return {image_id: value for image_id, value in entries.items() if cls._key(image_id) is not None}
+
+    # --- local files -------------------------------------------------------------------------
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Exclusive lock over the index files against other worker processes on this host"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file("lock"), "a") as handle:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        try:
+            with open(self._file("meta.json")) as handle:
+                meta = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == self.FORMAT_VERSION else None
+
+    def _write_meta(self, meta):
+        temporary = self._file("meta.json.tmp")
+        with open(temporary, "w") as handle:
+            json.dump(meta, handle)
+        os.replace(temporary, self._file("meta.json"))
+
+    def _create_arrays(self, capacity, suffix=""):
+        """New ids, features and norms files holding capacity rows (deleted rows have an infinite norm)"""
+        ids = np.lib.format.open_memmap(self._file(f"ids.npy{suffix}"), mode="w+", dtype=f"S{self.ID_BYTES}", shape=(capacity,))
+        features = np.lib.format.open_memmap(self._file(f"features.npy{suffix}"), mode="w+", dtype=np.float32,
+                                             shape=(capacity, self.DIMENSIONS))
+        norms = np.lib.format.open_memmap(self._file(f"norms.npy{suffix}"), mode="w+", dtype=np.float32, shape=(capacity,))
+        return ids, features, norms
+
+    def _publish(self, arrays, suffix):
+        """Flush arrays written under suffix and move them into place"""
+        for name, array in zip(("ids", "features", "norms"), arrays):
+            array.flush()
+            if suffix:
+                os.replace(self._file(f"{name}.npy{suffix}"), self._file(f"{name}.npy"))
+
+    def _open_arrays(self):
+        return tuple(np.load(self._file(f"{name}.npy"), mmap_mode="r+") for name in ("ids", "features", "norms"))
+
+    def _load(self, meta):
+        """Map the files described by meta; the imageId -> row map only grows while the build is the same"""
+        same_build = self._meta is not None and self._meta["buildId"] == meta["buildId"]
+        start = self._meta["count"] if same_build else 0
+        arrays = self._open_arrays()
+        rows = self._rows if same_build else {}
+        # Keyed by the stored id bytes: building the map for a million rows stays one C-level pass
+        rows.update(zip(arrays[0][start:meta["count"]].tolist(), range(start, meta["count"])))
+        self._arrays, self._rows, self._meta = arrays, rows, meta
+
+    # --- building and refreshing --------------------------------------------------------------
+
+    def _scan_latest(self):
+        """(imageId, analysisTime, colorFeatures) of every latest row, read as 16 concurrent key ranges"""
+        index_client = self.repository.table_service.get_table_client(self.repository.index.table_name)
+
+        def scan(bounds):
+            return [(entity["PartitionKey"], entity.get("analysisTime", ""), entity.get(self.COLUMN))
+                    for entity in index_client.query_entities(
+                        "PartitionKey ge @low and PartitionKey lt @high and RowKey eq @row_key",
+                        parameters={"low": bounds[0], "high": bounds[1], "row_key": self.repository.index.LATEST_ROW_KEY},
+                        select=["PartitionKey", "analysisTime", self.COLUMN]
+                    )]
+
+        ranges = list(zip(self.SCAN_RANGES, self.SCAN_RANGES[1:]))
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="color-scan") as executor:
+            return [row for rows in executor.map(scan, ranges) for row in rows]
+
+    def _changes_since(self, since):
+        """(imageId, analysisTime, colorFeatures) of analyses saved since `since`, from the history partitions"""
+        table_client = self.repository.table_service.get_table_client(self.repository.table_name)
+        since_time = since.isoformat() + "Z"
+        partitions = [partition for day in days_between(since, datetime.datetime.utcnow()) for partition in day_partitions(day)]
+
+        def read(partition_key):
+            return [(entity["imageId"], entity.get("analysisTime", ""), entity.get(self.COLUMN))
+                    for entity in table_client.query_entities(
+                        "PartitionKey eq @partition_key and analysisTime ge @since",
+                        parameters={"partition_key": partition_key, "since": since_time},
+                        select=["imageId", "analysisTime", self.COLUMN]
+                    )]
+
+        with ThreadPoolExecutor(max_workers=min(RESULTS_QUERY_CONCURRENCY, len(partitions)),
+                                thread_name_prefix="color-refresh") as executor:
+            return [row for rows in executor.map(read, partitions) for row in rows]
+
+    @staticmethod
+    def _newest(rows):
+        """Each image's newest colorFeatures value (rows without the column are skipped)"""
+        newest = {}
+        for image_id, analysis_time, value in sorted(rows, key=lambda row: row[1]):
+            if value is not None:
+                newest[image_id] = value
+        return newest
+
+    def _build(self):
+        """Write a new matrix from the latest rows and map it"""
+        started = datetime.datetime.utcnow()
+        newest = {image_id: json.loads(value)
+                  for image_id, value in self._indexable(self._newest(self._scan_latest())).items() if value}
+        arrays = self._create_arrays(max(1024, len(newest)), suffix=".tmp")
+        ids, features, norms = arrays
+        for row, (image_id, colors) in enumerate(newest.items()):
+            ids[row] = self._key(image_id)
+            features[row] = self.vector(colors)
+        norms[:len(newest)] = np.einsum("ij,ij->i", features[:len(newest)], features[:len(newest)])
+        self._publish(arrays, ".tmp")
+
+        meta = {"version": self.FORMAT_VERSION, "buildId": str(uuid.uuid4()), "builtAt": started.isoformat() + "Z",
+                "watermark": started.isoformat() + "Z", "count": len(newest)}
+        self._write_meta(meta)
+        self._load(meta)
+        metrics.increment("color_index.builds")
+        logging.info(f"Color index built: {len(newest)} images in {(datetime.datetime.utcnow() - started).total_seconds():.1f}s")
+
+    def _grow(self, capacity):
+        """Copy the matrix into files with room for capacity rows"""
+        count = self._meta["count"]
+        arrays = self._create_arrays(capacity, suffix=".tmp")
+        for source, target in zip(self._arrays, arrays):
+            target[:count] = source[:count]
+        self._publish(arrays, ".tmp")
+        self._arrays = self._open_arrays()
+
+    def apply(self, changes):
+        """
+        Write {imageId: colours dict or None} into the matrix: update rows in place, append new
+        images, and blank images whose colours went away. Call with the file lock held
+        """
+        changes = self._indexable(changes)
+        ids, features, norms = self._arrays
+        count = self._meta["count"]
+        appended = [image_id for image_id, colors in changes.items()
+                    if colors and self._key(image_id) not in self._rows]
+        if count + len(appended) > len(ids):
+            self._grow(max(2 * len(ids), count + len(appended)))
+            ids, features, norms = self._arrays
+
+        for row, image_id in enumerate(appended, start=count):
+            ids[row] = self._key(image_id)
+            self._rows[self._key(image_id)] = row
+        for image_id, colors in changes.items():
+            row = self._rows.get(self._key(image_id))
+            if row is None:
+                continue
+            vector = self.vector(colors) if colors else np.zeros(self.DIMENSIONS, dtype=np.float32)
+            features[row] = vector
+            norms[row] = float(vector @ vector) if colors else np.inf
+        self._publish(self._arrays, "")
+
+        self._meta = {**self._meta, "count": count + len(appended)}
+        return len(changes)
+
+    @staticmethod
+    def _parse_time(value):
+        return datetime.datetime.fromisoformat(value.rstrip("Z"))
+
+    def refresh(self, force_rebuild=False):
+        """Bring the matrix up to date: reopen what other processes wrote, then read newer analyses"""
+        with self._file_lock():
+            meta = self._read_meta()
+            started = datetime.datetime.utcnow()
+            if force_rebuild or not meta or started - self._parse_time(meta["builtAt"]) > \
+                    datetime.timedelta(hours=COLOR_INDEX_REBUILD_HOURS):
+                self._build()
+                return
+
+            self._load(meta)
+            since = self._parse_time(meta["watermark"]) - self.REFRESH_OVERLAP
+            changes = {image_id: json.loads(value) if value else None
+                       for image_id, value in self._newest(self._changes_since(since)).items()}
+            updated = self.apply(changes)
+            self._meta["watermark"] = started.isoformat() + "Z"
+            self._write_meta(self._meta)
+            metrics.increment("color_index.refreshes")
+            metrics.increment("color_index.rows_updated", updated)
+
+    def ensure_fresh(self):
+        """
+        Refresh if the last refresh is older than COLOR_INDEX_REFRESH_SECONDS
+        Only the first use waits; while one request refreshes, others search the current matrix
+        """
+        if self._arrays is not None and time.time() - self._refreshed < COLOR_INDEX_REFRESH_SECONDS:
+            return
+        if not self._lock.acquire(blocking=self._arrays is None):
+            return
+        try:
+            if self._arrays is None or time.time() - self._refreshed >= COLOR_INDEX_REFRESH_SECONDS:
+                self.refresh()
+                self._refreshed = time.time()
+        finally:
+            self._lock.release()
+
+    # --- queries ------------------------------------------------------------------------------
+
+    def __len__(self):
+        return self._meta["count"] if self._meta else 0
+
+    def vector_of(self, image_id):
+        """Feature row of an indexed image, or None"""
+        row = self._rows.get(self._key(image_id))
+        if row is None or row >= len(self) or not np.isfinite(self._arrays[2][row]):
+            return None
+        return np.array(self._arrays[1][row])
+
+    def nearest(self, vector, max_results=20, exclude=None):
+        """
+        Images whose colours are closest to vector (squared Euclidean distance), nearest first
+        One matrix-vector product over every row; argpartition keeps the ranking O(n)
+        """
+        count = len(self)
+        if not count:
+            return []
+        ids, features, norms = self._arrays
+        distances = norms[:count] - 2.0 * (features[:count] @ vector) + float(vector @ vector)
+        excluded = self._rows.get(self._key(exclude)) if exclude else None
+        if excluded is not None and excluded < count:
+            distances[excluded] = np.inf
+        k = min(max_results, count)
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [{
+            "imageId": ids[row].decode("ascii"),
+            "distance": round(max(float(distances[row]), 0.0), 4),
+            **self.decode(features[row])
+        } for row in top if np.isfinite(distances[row])]
+
+def get_color_index():
+    """Colour feature matrix shared by every invocation in this worker process"""
+    return clients.get("color_index", ColorFeatureIndex)
+
+# Serialized GET /images/{imageId}/results responses, cached per worker process
+RESULTS_CACHE_TTL_SECONDS = float(os.environ.get("RESULTS_CACHE_TTL_SECONDS", "30"))
+RESULTS_CACHE_MAX_ENTRIES = int(os.environ.get("RESULTS_CACHE_MAX_ENTRIES", "2000"))
+RESULTS_CACHE_MAX_MB = float(os.environ.get("RESULTS_CACHE_MAX_MB", "64"))
+
+class ResponseCache:
+    """
+    Bounded LRU cache of response bodies with a time-to-live
+    Least recently used entries are evicted past max_entries or max_bytes, and an entry older
+    than ttl_seconds counts as a miss. invalidate() drops an entry this process has made stale;
+    other processes serve theirs until it expires
+    """
+    
+    # Rough per-entry cost of the key, ETag, tuple and dict slot, on top of the body
+    ENTRY_OVERHEAD_BYTES = 256
+    
+    def __init__(self, max_entries, max_bytes, ttl_seconds, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Bumped by every invalidation; a fill that read its data before the key's last
+        # invalidation is not stored. Past a size bound the per-key record collapses to a floor
+        self._generation = 0
+        self._invalidated = {}
+        self._floor = 0
+        self._counts = Counter()
+    
+    @property
+    def generation(self):
+        return self._generation
+    
+    def _size(self, key, etag, body):
+        return len(body) + len(key) + len(etag) + self.ENTRY_OVERHEAD_BYTES
+    
+    def _remove(self, key):
+        etag, body, _ = self._entries.pop(key)
+        self._bytes -= self._size(key, etag, body)
+    
+    def get(self, key):
+        """(etag, body) of a live entry, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= self._clock():
+                self._remove(key)
+                self._counts["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._counts["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counts["hits"] += 1
+            return entry[0], entry[1]
+    
+    def put(self, key, etag, body, generation=None):
+        """Store a body; skipped if key was invalidated after generation was read"""
+        size = self._size(key, etag, body)
+        if self.ttl_seconds <= 0 or self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and (generation < self._floor or
+                                           generation < self._invalidated.get(key, 0)):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (etag, body, self._clock() + self.ttl_seconds)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counts["evictions"] += 1
+    
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._invalidated[key] = self._generation
+            if len(self._invalidated) > 4 * max(self.max_entries, 1):
+                self._invalidated.clear()
+                self._floor = self._generation
+            if key in self._entries:
+                self._remove(key)
+                self._counts["invalidations"] += 1
+    
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._floor = self._generation
+            self._invalidated.clear()
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self):
+        """Size, limits and hit/eviction counts, for GET /api/metrics"""
+        with self._lock:
+            lookups = self._counts["hits"] + self._counts["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "ttlSeconds": self.ttl_seconds,
+                "hitRatio": round(self._counts["hits"] / lookups, 4) if lookups else None,
+                **{name: self._counts[name] for name in ("hits", "misses", "evictions", "expirations", "invalidations")}
+            }
+
+results_cache = ResponseCache(
+    RESULTS_CACHE_MAX_ENTRIES, int(RESULTS_CACHE_MAX_MB * 1024 * 1024), RESULTS_CACHE_TTL_SECONDS
+)
+
+# Part of every results ETag; bump it when the response body format changes
+RESULT_FORMAT_VERSION = 2
+
+def result_etag(row_etag):
+    """
+    Strong ETag of a results response, derived from the ETag of the lookup row it was built from
+    Every instance builds the same body from the same row, so clients can revalidate against any of them
+    """
+    digest = hashlib.sha256(f"{RESULT_FORMAT_VERSION}:{row_etag}".encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header lists etag (weak comparison, as RFC 9110 requires for it)"""
+    if not if_none_match or not etag:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+# History partitions queried at once by result searches and date-range listings (and colour index refreshes)
+RESULTS_QUERY_CONCURRENCY = int(os.environ.get("RESULTS_QUERY_CONCURRENCY", "16"))
+
+# Data Access Layer for Image Analysis Results
+class ImageAnalysisRepository:
+    """
+    Repository pattern for Table Storage operations
+    Entities hold summary fields only; full documents live in the AnalysisDocumentStore
+    """
+    
+    def __init__(self, table_service=None, blob_service=None):
+        self.table_service = table_service or get_table_service_client()
+        self.table_name = "ImageAnalysisResults"
+        self._ensure_table_exists()
+        self.index = ImageIndexRepository(self.table_service)
+        self.stats = AnalysisStatsRepository(self.table_service)
+        self.terms = TermIndexRepository(self.table_service)
+        self.text = TextIndexRepository(self.table_service)
+        self._blob_service = blob_service
+        self._documents = None
+    
+    def _ensure_table_exists(self):
+        """Create table if it doesn't exist (once per worker process)"""
+        ensure_table(self.table_service, self.table_name)
+    
+    @property
+    def documents(self):
+        """Document store, created on first use so summary-only paths never touch Blob Storage"""
+        if self._documents is None:
+            self._documents = AnalysisDocumentStore(self._blob_service)
+        return self._documents
+    
+    # Table transactions are limited to 100 operations and 4 MB of payload
+    MAX_TRANSACTION_OPERATIONS = 100
+    MAX_TRANSACTION_BYTES = 3 * 1024 * 1024
+    
+    def _build_entity(self, image_id, blob_name, analysis_data, upload_time, file_metadata):
+        """Build the date-partitioned analysis entity"""
+        # Create partition key (date and shard) and row key
+        analysis_time = datetime.datetime.utcnow()
+        partition_key = results_partition_key(analysis_time.strftime("%Y-%m-%d"), image_id)
+        row_key = f"{image_id}_{analysis_time.strftime('%Y%m%d_%H%M%S')}"
+        
+        # Extract key metrics for easy querying
+        objects = analysis_data.get("analysis", {}).get("objects", [])
+        faces = analysis_data.get("analysis", {}).get("faces", [])
+        descriptions = analysis_data.get("analysis", {}).get("descriptions", [])
+        tags = analysis_data.get("analysis", {}).get("tags", [])
+        text_result = analysis_data.get("analysis", {}).get("text") or {}
+        
+        # Get primary description and confidence
+        primary_description = ""
+        max_confidence = 0.0
+        if descriptions:
+            primary_description = descriptions[0].get("text", "")
+            max_confidence = descriptions[0].get("confidence", 0.0)
+        
+        # Create tag string
+        tag_names = [tag.get("name", "") for tag in tags[:10]]  # Limit to 10 tags
+        tags_string = ",".join(tag_names)
+        
+        # Create entity
+        entity = TableEntity()
+        entity.update({
+            "PartitionKey": partition_key,
+            "RowKey": row_key,
+            "imageId": image_id,
+            "blobName": blob_name,
+            "status": STATUS_COMPLETED,
+            "uploadTime": upload_time,
+            "analysisTime": analysis_time.isoformat() + "Z",
+            "analysisBlob": AnalysisDocumentStore.blob_name(partition_key, row_key),
+            "objectCount": len(objects),
+            "faceCount": len(faces),
+            "hasText": text_result.get("text_detected", False),
+            "tags": tags_string[:1000],  # Limit to 1000 chars
+            "indexTerms": TermIndexRepository.column_value(analysis_data),
+            "textTerms": TextIndexRepository.column_value(analysis_data),
+            "colorFeatures": ColorFeatureIndex.column_value(analysis_data),
+            "primaryDescription": primary_description[:1000],  # Limit to 1000 chars
+            "confidence": round(max_confidence, 4),
+            "fileSize": int(file_metadata.get("fileSize", 0)),
+            "dimensions": file_metadata.get("dimensions", ""),
+            "format": file_metadata.get("format", "")
+        })
+        
+        return entity
+    
+    def save_analysis_result(self, image_id, blob_name, analysis_data, upload_time, file_metadata, encoded=None):
+        """
+        Save analysis results to Table Storage
+        encoded is analysis_data's encode_document form, if the caller already has it
+        """
+        try:
+            entity = self._build_entity(image_id, blob_name, analysis_data, upload_time, file_metadata)
+            
+            # The document goes first, so an entity never points at a missing blob
+            self.documents.save(entity["analysisBlob"], encoded or analysis_data)
+            
+            # Save to table; a re-save within the same second (e.g. adding features) replaces that row
+            table_client = self.table_service.get_table_client(self.table_name)
+            previous = self._write_history(table_client, entity)
+            
+            # Keep the imageId-keyed lookup row pointing at the newest analysis
+            previous_rows = self._previous_index_rows([image_id])
+            self.index.save_latest_analysis(entity)
+            results_cache.invalidate(image_id)
+            
+            self.stats.apply_entities([(entity, previous)])
+            self._update_search_indexes([(entity, analysis_data, previous_rows[image_id])])
+            
+            logging.info(f"Saved analysis results for image {image_id}")
+            return True
+            
+        except Exception as e:
+            logging.error(f"Error saving analysis results: {str(e)}")
+            return False
+    
+    def save_analysis_results(self, items):
+        """
+        Save many analyses at once
+        items are dicts of save_analysis_result arguments; history rows are written in
+        per-partition table transactions, falling back to single writes if a transaction fails
+        Returns {image_id: saved}
+        """
+        saved = {}
+        by_partition = defaultdict(list)
+        
+        documents = {}
+        
+        def prepare(item):
+            entity = self._build_entity(**item)
+            self.documents.save(entity["analysisBlob"], item["analysis_data"])
+            documents[entity["analysisBlob"]] = item["analysis_data"]
+            return entity
+        
+        # Document uploads are independent round trips, so they run side by side
+        with ThreadPoolExecutor(max_workers=8, thread_name_prefix="analysis-documents") as executor:
+            futures = {executor.submit(prepare, item): item for item in items}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    entity = future.result()
+                    by_partition[entity["PartitionKey"]].append(entity)
+                except Exception as e:
+                    logging.error(f"Error preparing analysis results for image {item.get('image_id')}: {str(e)}")
+                    saved[item.get("image_id")] = False
+        
+        table_client = self.table_service.get_table_client(self.table_name)
+        stats_updates = []
+        index_updates = []
+        for partition_entities in by_partition.values():
+            for chunk in self.transaction_chunks(partition_entities):
+                try:
+                    # Creates fail the transaction if a row already exists, so replaced rows take the single-write path
+                    table_client.submit_transaction([("create", entity) for entity in chunk])
+                    written = [(entity, None) for entity in chunk]
+                    metrics.increment("table.transactions")
+                except TableTransactionError.resolve() as e:
+                    logging.warning(f"Transaction of {len(chunk)} analyses failed, writing individually: {str(e)}")
+                    written = []
+                    for entity in chunk:
+                        try:
+                            written.append((entity, self._write_history(table_client, entity)))
+                        except Exception as create_error:
+                            logging.error(f"Error saving analysis results for image {entity['imageId']}: {str(create_error)}")
+                            saved[entity["imageId"]] = False
+                
+                stats_updates.extend(written)
+                previous_rows = self._previous_index_rows([entity["imageId"] for entity, _ in written])
+                # Lookup rows live in one partition per image, so they cannot share a transaction
+                for entity, _ in written:
+                    try:
+                        self.index.save_latest_analysis(entity)
+                        results_cache.invalidate(entity["imageId"])
+                        index_updates.append((entity, documents[entity["analysisBlob"]], previous_rows[entity["imageId"]]))
+                        saved[entity["imageId"]] = True
+                    except Exception as index_error:
+                        logging.error(f"Error updating lookup row for image {entity['imageId']}: {str(index_error)}")
+                        saved[entity["imageId"]] = False
+        
+        self.stats.apply_entities(stats_updates)
+        self._update_search_indexes(index_updates)
+        
+        logging.info(f"Saved {sum(saved.values())} of {len(saved)} analysis results")
+        return saved
+    
+    def _write_history(self, table_client, entity):
+        """
+        Write a history row, replacing the one saved for the same image within the same second
+        Returns the summary columns of the replaced row (so its stats can be backed out), or None
+        """
+        try:
+            table_client.create_entity(entity)
+            return None
+        except ResourceExistsError:
+            previous = table_client.get_entity(
+                partition_key=entity["PartitionKey"], row_key=entity["RowKey"], select=self.stats.SOURCE_COLUMNS
+            )
+            table_client.upsert_entity(entity, mode=UpdateMode.REPLACE)
+            return previous
+    
+    def _previous_index_rows(self, image_ids):
+        """
+        Index key columns of each image's "latest" row (or None), read before the row is replaced
+        so entries for tags, objects and words an image no longer has can be deleted
+        """
+        def read(image_id):
+            try:
+                return image_id, self.index.get_latest_analysis(
+                    image_id, select=[TermIndexRepository.COLUMN, TextIndexRepository.COLUMN]
+                )
+            except Exception as e:
+                # Stale entries are left for the rebuild commands rather than failing the save
+                logging.error(f"Error reading indexed terms of image {image_id}: {str(e)}")
+                metrics.increment("term_index.failures")
+                return image_id, None
+        
+        if len(image_ids) <= 1:
+            return dict(map(read, image_ids))
+        with ThreadPoolExecutor(max_workers=min(8, len(image_ids)), thread_name_prefix="index-terms") as executor:
+            return dict(executor.map(read, image_ids))
+    
+    def _update_search_indexes(self, saved):
+        """Bring the tag/object and OCR text indexes in line with saved (entity, document, previous row) triples"""
+        self.terms.apply_entities(saved)
+        self.text.apply_entities(saved)
+    
+    @classmethod
+    def transaction_chunks(cls, items, entity_of=None):
+        """Split same-partition entities (or operations, with entity_of) into transaction-sized groups"""
+        chunk = []
+        chunk_bytes = 0
+        for item in items:
+            entity = entity_of(item) if entity_of else item
+            entity_bytes = len(json.dumps(dict(entity), default=str).encode("utf-8")) + 1024
+            if chunk and (len(chunk) >= cls.MAX_TRANSACTION_OPERATIONS or chunk_bytes + entity_bytes > cls.MAX_TRANSACTION_BYTES):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(item)
+            chunk_bytes += entity_bytes
+        if chunk:
+            yield chunk
+    
+    def get_analysis_result(self, image_id, raw=False):
+        """
+        Get the latest analysis result by image ID (point read on the lookup row)
+        With raw, analysisResults is the stored document as RawJSON, for responses that embed it
+        """
+        return self.get_analysis_result_with_etag(image_id, raw)[0]
+    
+    def get_analysis_result_with_etag(self, image_id, raw=False):
+        """
+        The latest analysis result and the ETag of the lookup row it was read from, or (None, None)
+        The row changes whenever the result does (saves replace it, status updates merge into it)
+        """
+        try:
+            entity = self.index.get_latest_analysis(image_id)
+            
+            if entity is None and env_flag("RESULTS_INDEX_SCAN_FALLBACK"):
+                entity = self._find_latest_by_scan(image_id)
+            
+            # Status-only rows exist while the first analysis of an image is queued
+            if entity is None or not self.has_document(entity):
+                return None, None
+            
+            return self._entity_to_result(entity, self.load_document(entity, raw)), entity.metadata.get("etag")
+            
+        except Exception as e:
+            logging.error(f"Error retrieving analysis result: {str(e)}")
+            return None, None
+    
+    def get_result_etag(self, image_id):
+        """ETag of an image's lookup row if it holds a result, without loading the document"""
+        entity = self.index.get_latest_analysis(image_id, select=["analysisBlob"])
+        if entity is None or not entity.get("analysisBlob"):
+            return None
+        return entity.metadata.get("etag")
+    
+    def find_analysis_by_content(self, content_hash):
+        """Latest completed analysis of an image with the same content digest, or None"""
+        image_id = self.index.get_content_entry(content_hash)
+        if not image_id:
+            return None
+        
+        return self.get_analysis_result(image_id)
+    
+    def _find_latest_by_scan(self, image_id):
+        """Slow path for analyses saved before the lookup row existed; repairs the lookup row"""
+        table_client = self.table_service.get_table_client(self.table_name)
+        entities = table_client.query_entities(
+            query_filter="imageId eq @image_id",
+            parameters={"image_id": image_id}
+        )
+        latest = max(entities, key=lambda entity: entity.get("analysisTime", ""), default=None)
+        if latest is not None:
+            logging.warning(f"Analysis for image {image_id} found by scan; repairing lookup row")
+            self.index.save_latest_analysis(latest)
+        return latest
+    
+    @staticmethod
+    def has_document(entity):
+        """True if an entity records a completed analysis (offloaded or, for older rows, inline)"""
+        return bool(entity.get("analysisBlob") or entity.get("analysisResults"))
+    
+    def load_document(self, entity, raw=False):
+        """
+        Full analysis document of an entity, fetched from its blob (or parsed from older inline rows)
+        raw leaves it serialized, as RawJSON
+        """
+        if entity.get("analysisBlob"):
+            document = self.documents.load_raw(entity["analysisBlob"])
+        else:
+            document = RawJSON(entity["analysisResults"].encode("utf-8"))
+        return document if raw else document.value
+    
+    @staticmethod
+    def _entity_to_result(entity, document):
+        """Shape an analysis entity and its document as the API's result document"""
+        return {
+            "imageId": entity["imageId"],
+            "blobName": entity["blobName"],
+            "status": entity["status"],
+            "uploadTime": entity["uploadTime"],
+            "analysisTime": entity["analysisTime"],
+            "analysisResults": document,
+            "metadata": {
+                "objectCount": entity.get("objectCount", 0),
+                "faceCount": entity.get("faceCount", 0),
+                "hasText": entity.get("hasText", False),
+                "tags": entity.get("tags", ""),
+                "primaryDescription": entity.get("primaryDescription", ""),
+                "confidence": entity.get("confidence", 0.0),
+                "fileSize": entity.get("fileSize", 0),
+                "dimensions": entity.get("dimensions", ""),
+                "format": entity.get("format", "")
+            }
+        }
+    
+    # Columns of the result summaries returned by date-range queries and search
+    SUMMARY_COLUMNS = ["imageId", "blobName", "status", "uploadTime", "analysisTime",
+                       "objectCount", "faceCount", "hasText", "tags", "primaryDescription",
+                       "confidence", "fileSize", "dimensions", "format"]
+    
+    # OData clause for each search filter
+    SEARCH_FILTERS = {
+        "has_faces": "faceCount gt 0",
+        "has_objects": "objectCount gt 0",
+        "has_text": "hasText eq true"
+    }
+    
+    @staticmethod
+    def _entity_to_summary(entity):
+        """Shape an analysis entity as a search/list result summary"""
+        return {
+            "imageId": entity["imageId"],
+            "blobName": entity["blobName"],
+            "status": entity["status"],
+            "uploadTime": entity["uploadTime"],
+            "analysisTime": entity["analysisTime"],
+            "summary": {
+                "objectCount": entity.get("objectCount", 0),
+                "faceCount": entity.get("faceCount", 0),
+                "hasText": entity.get("hasText", False),
+                "primaryDescription": entity.get("primaryDescription", ""),
+                "confidence": entity.get("confidence", 0.0)
+            }
+        }
+    
+    def _query_partition(self, partition_key, clauses, limit, row_start="", token=None):
+        """
+        One page of up to limit rows of a history partition matching clauses, from row_start on
+        Returns (entities, continuation token within the partition or None)
+        """
+        table_client = self.table_service.get_table_client(self.table_name)
+        pager = table_client.query_entities(
+            " and ".join(["PartitionKey eq @partition_key", "RowKey ge @row_start"] + list(clauses)),
+            parameters={"partition_key": partition_key, "row_start": row_start},
+            select=["PartitionKey", "RowKey"] + self.SUMMARY_COLUMNS,
+            results_per_page=min(limit, 1000)
+        ).by_page(continuation_token=token)
+        return list(next(pager, None) or []), pager.continuation_token
+    
+    def get_results_by_date_range(self, start_date, end_date, max_results=50, concurrency=None):
+        """Get up to max_results results within date range, in (PartitionKey, RowKey) order (see search_results)"""
+        try:
+            return self.search_results(start_date, end_date, max_results=max_results, max_pages=None,
+                                       concurrency=concurrency)[0]
+        except Exception as e:
+            logging.error(f"Error querying by date range: {str(e)}")
+            return []
+    
+    @staticmethod
+    def encode_cursor(query, continuation_token):
+        """Opaque cursor resuming a search query where its last page ended"""
+        state = json.dumps({"query": query, "token": continuation_token}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(state.encode("utf-8")).decode("ascii").rstrip("=")
+    
+    @classmethod
+    def decode_cursor(cls, cursor):
+        """Search query and continuation token from a cursor; raises ValueError if it is not one of ours"""
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            query = state["query"]
+            for key in ("start", "end"):
+                datetime.datetime.strptime(query[key], "%Y-%m-%d")
+            if not set(query["filters"]) <= set(cls.SEARCH_FILTERS):
+                raise ValueError("unknown filter")
+            token = state["token"]
+            if not (isinstance(token, dict) and all(isinstance(value, str) for value in token.values())):
+                raise ValueError("malformed continuation token")
+            return query, token
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {str(e)}")
+    
+    def search_results(self, start_date, end_date, filters=(), max_results=50, cursor=None, max_pages=10, concurrency=None):
+        """
+        Page through result summaries in a date range matching every named filter (see SEARCH_FILTERS)
+        Filters run in the Table query, so only matching rows are read. Each partition of each
+        day (see day_partitions) is queried on its own, up to `concurrency` at a time, instead
+        of one range query whose continuation tokens walk the partitions one after another.
+        Partitions do not overlap, so merging their pages in key order is concatenating them;
+        each wave of queries asks every partition only for the rows still needed. A page request
+        reads at most max_pages Table pages (None for no limit); with a cursor, its query replaces
+        the given dates and filters. Returns (results, cursor for the next page or None)
+        """
+        if cursor:
+            query, token = self.decode_cursor(cursor)
+        else:
+            query = {
+                "start": start_date.strftime("%Y-%m-%d"),
+                "end": end_date.strftime("%Y-%m-%d"),
+                "filters": sorted(set(filters))
+            }
+            token = None
+        
+        clauses = [self.SEARCH_FILTERS[name] for name in query["filters"]]
+        days = days_between(datetime.datetime.strptime(query["start"], "%Y-%m-%d"),
+                            datetime.datetime.strptime(query["end"], "%Y-%m-%d"))
+        partitions = [partition for day in days for partition in day_partitions(day)]
+        # Resume at the cursor's row: (PartitionKey, RowKey) of the next row to read
+        resume = (token["PartitionKey"], token.get("RowKey") or "") if token else ("", "")
+        partitions = [partition for partition in partitions if partition >= resume[0]]
+        concurrency = concurrency or RESULTS_QUERY_CONCURRENCY
+        
+        results = []
+        pages = 0
+        next_row = None
+        position = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(partitions))), thread_name_prefix="search") as executor:
+            while position < len(partitions) and len(results) < max_results and next_row is None:
+                wave = partitions[position:position + concurrency]
+                if max_pages is not None:
+                    if pages >= max_pages:
+                        break
+                    wave = wave[:max_pages - pages]
+                budget = max_results - len(results)
+                futures = [executor.submit(self._query_partition, partition, clauses, budget,
+                                           resume[1] if partition == resume[0] else "") for partition in wave]
+                pages += len(futures)
+                
+                for offset, (partition, future) in enumerate(zip(wave, futures)):
+                    page, page_token = future.result()
+                    position += 1
+                    # A filtered page can hold fewer rows than asked for and still continue
+                    while page_token and len(page) < max_results - len(results) and (max_pages is None or pages < max_pages):
+                        more, page_token = self._query_partition(
+                            partition, clauses, max_results - len(results) - len(page), token=page_token)
+                        page.extend(more)
+                        pages += 1
+                    taken = page[:max_results - len(results)]
+                    results.extend(self._entity_to_summary(entity) for entity in taken)
+                    if len(taken) < len(page):
+                        next_row = (partition, page[len(taken)]["RowKey"])
+                    elif page_token:
+                        next_row = (partition, page_token.get("RowKey") or "")
+                    if next_row or len(results) >= max_results:
+                        for later in futures[offset + 1:]:
+                            later.cancel()
+                        break
+        
+        if next_row is None and position < len(partitions):
+            next_row = (partitions[position], "")
+        metrics.increment("search.pages_read", pages)
+        metrics.increment("results.partition_queries", position)
+        metrics.increment("results.partition_queries_skipped", len(partitions) - position)
+        next_cursor = self.encode_cursor(query, {"PartitionKey": next_row[0], "RowKey": next_row[1]}) if next_row else None
+        return results, next_cursor
+    
+    def offload_inline_documents(self):
+        """
+        Move analysis documents stored inline (analysisResults) into blobs
+        A history row and the "latest" row copied from it share one blob
+        """
+        moved = 0
+        current = 0
+        changed = 0
+        written = set()
+        
+        tables = (
+            (self.table_name, None, lambda entity: (entity["PartitionKey"], entity["RowKey"])),
+            (self.index.table_name, f"RowKey eq '{self.index.LATEST_ROW_KEY}'",
+             lambda entity: (entity["resultPartitionKey"], entity["resultRowKey"]))
+        )
+        for table_name, query_filter, result_keys in tables:
+            table_client = self.table_service.get_table_client(table_name)
+            entities = table_client.query_entities(query_filter) if query_filter else table_client.list_entities()
+            for entity in entities:
+                if not entity.get("analysisResults"):
+                    current += 1 if entity.get("analysisBlob") else 0
+                    continue
+                
+                blob_name = AnalysisDocumentStore.blob_name(*result_keys(entity))
+                if blob_name not in written:
+                    self.documents.save(blob_name, json.loads(entity["analysisResults"]))
+                    written.add(blob_name)
+                
+                slim = TableEntity()
+                slim.update({key: value for key, value in entity.items() if key != "analysisResults"})
+                slim["analysisBlob"] = blob_name
+                try:
+                    table_client.update_entity(
+                        slim, mode=UpdateMode.REPLACE,
+                        etag=entity.metadata["etag"], match_condition=MatchConditions.IfNotModified
+                    )
+                    moved += 1
+                except ResourceModifiedError:
+                    # Rewritten since it was read, so it no longer holds the old inline document
+                    changed += 1
+        
+        logging.info(f"Analysis document offload complete: {moved} moved, {current} already offloaded, {changed} changed meanwhile")
+        return {"moved": moved, "alreadyOffloaded": current, "changedMeanwhile": changed}
+    
+    def reshard_results(self):
+        """
+        Move history rows into the partitions of the current shard scheme
+        Covers rows written before sharding and rows written with another RESULTS_PARTITION_SHARDS;
+        the "latest" lookup row is repointed before the old row is deleted
+        """
+        table_client = self.table_service.get_table_client(self.table_name)
+        index_client = self.table_service.get_table_client(self.index.table_name)
+        
+        # Collect first: moved rows sort after their old partition and would be listed again
+        moves = []
+        current = 0
+        for entity in table_client.list_entities(select=["PartitionKey", "RowKey", "imageId", "analysisTime"]):
+            if not entity.get("imageId") or not entity.get("analysisTime"):
+                continue
+            target = results_partition_key(entity["analysisTime"][:10], entity["imageId"])
+            if target == entity["PartitionKey"]:
+                current += 1
+            else:
+                moves.append((entity["PartitionKey"], entity["RowKey"], target))
+        
+        moved = 0
+        for partition_key, row_key, target in moves:
+            entity = table_client.get_entity(partition_key=partition_key, row_key=row_key)
+            relocated = TableEntity()
+            relocated.update(entity)
+            relocated["PartitionKey"] = target
+            table_client.upsert_entity(relocated, mode=UpdateMode.REPLACE)
+            
+            latest = self.index.get_latest_analysis(entity["imageId"], select=["resultPartitionKey", "resultRowKey"])
+            if latest and latest.get("resultPartitionKey") == partition_key and latest.get("resultRowKey") == row_key:
+                index_client.upsert_entity(mode=UpdateMode.MERGE, entity={
+                    "PartitionKey": entity["imageId"],
+                    "RowKey": self.index.LATEST_ROW_KEY,
+                    "resultPartitionKey": target
+                })
+            
+            table_client.delete_entity(partition_key=partition_key, row_key=row_key)
+            moved += 1
+        
+        logging.info(f"Reshard complete: {moved} moved, {current} already in place")
+        return {"moved": moved, "alreadyInPlace": current, "shards": RESULTS_PARTITION_SHARDS}
+    
+    def rebuild_term_index(self):
+        """Re-derive the tag and object index; rows saved before it existed get indexTerms from their documents"""
+        return self._rebuild_search_index(self.terms)
+    
+    def rebuild_text_index(self):
+        """Re-derive the OCR text index from the documents of every image with text"""
+        return self._rebuild_search_index(self.text)
+    
+    def backfill_color_features(self):
+        """
+        Add the colorFeatures column to "latest" rows saved before it existed, from their documents
+        Worker processes pick the images up at their next full colour index build
+        """
+        index_client = self.table_service.get_table_client(self.index.table_name)
+        backfilled = 0
+        current = 0
+        for latest in index_client.query_entities(f"RowKey eq '{self.index.LATEST_ROW_KEY}'"):
+            if not self.has_document(latest):
+                continue
+            if latest.get(ColorFeatureIndex.COLUMN) is not None:
+                current += 1
+                continue
+            index_client.upsert_entity(mode=UpdateMode.MERGE, entity={
+                "PartitionKey": latest["PartitionKey"],
+                "RowKey": latest["RowKey"],
+                ColorFeatureIndex.COLUMN: ColorFeatureIndex.column_value(self.load_document(latest))
+            })
+            backfilled += 1
+        
+        logging.info(f"Color feature backfill complete: {backfilled} backfilled, {current} already current")
+        return {"backfilled": backfilled, "alreadyCurrent": current}
+    
+    def _rebuild_search_index(self, search_index, batch_size=500):
+        """
+        Rewrite an inverted index from the "latest" rows and delete entries no image accounts for
+        Documents are read only for rows the index needs them for (see needs_document)
+        """
+        index_client = self.table_service.get_table_client(self.index.table_name)
+        expected = set()
+        images = 0
+        backfilled = 0
+        batch = []
+        for latest in index_client.query_entities(f"RowKey eq '{self.index.LATEST_ROW_KEY}'"):
+            if not self.has_document(latest):
+                continue
+            document = self.load_document(latest) if search_index.needs_document(latest) else None
+            if latest.get(search_index.COLUMN) is None:
+                latest[search_index.COLUMN] = search_index.column_value(document or {})
+                index_client.upsert_entity(mode=UpdateMode.MERGE, entity={
+                    "PartitionKey": latest["PartitionKey"],
+                    "RowKey": latest["RowKey"],
+                    search_index.COLUMN: latest[search_index.COLUMN]
+                })
+                backfilled += 1
+            
+            operations = search_index.operations(latest, document)
+            expected.update((operation[1]["PartitionKey"], operation[1]["RowKey"]) for operation in operations)
+            batch.extend(operations)
+            images += 1
+            if len(batch) >= batch_size:
+                search_index.apply_operations(batch)
+                batch = []
+        search_index.apply_operations(batch)
+        
+        stale = search_index.prune(expected)
+        logging.info(f"{search_index.table_name} rebuild complete: {images} images, {len(expected)} entries, "
+                     f"{backfilled} backfilled from documents, {stale} stale entries removed")
+        return {"images": images, "entries": len(expected), "backfilled": backfilled, "staleEntriesRemoved": stale}
+    
+    def _status_entity(self, image_id, status, error=None, job=None):
+        entity = {
+            "PartitionKey": image_id,
+            "RowKey": self.index.LATEST_ROW_KEY,
+            "imageId": image_id,
+            "status": status,
+            "statusTime": datetime.datetime.utcnow().isoformat() + "Z",
+            "statusError": (error or "")[:1000]
+        }
+        if job:
+            entity["statusJob"] = json.dumps({key: job[key] for key in self.STATUS_JOB_FIELDS}, separators=(",", ":"))
+        return entity
+    
+    # What the status row records of the job most recently queued for the image
+    STATUS_JOB_FIELDS = ("jobId", "features", "force", "reuse_similar")
+    
+    def update_status(self, image_id, status, error=None, etag=None, job=None):
+        """
+        Update the analysis status of an image on its lookup row with a single MERGE request
+        Creates a status-only row for images that have not been analyzed yet. With etag (from an
+        earlier update_status), the update only applies if the row has not changed since, and
+        StatusConflictError is raised otherwise, so a stale writer cannot overwrite a newer status
+        job (a queued job, see new_analysis_job) is recorded as the image's latest job
+        Returns the row's new ETag, or None if the update failed
+        """
+        index_client = self.table_service.get_table_client(self.index.table_name)
+        entity = self._status_entity(image_id, status, error, job)
+        try:
+            if etag:
+                written = index_client.update_entity(
+                    entity, mode=UpdateMode.MERGE, etag=etag, match_condition=MatchConditions.IfNotModified
+                )
+            else:
+                written = index_client.upsert_entity(entity, mode=UpdateMode.MERGE)
+        except ResourceModifiedError:
+            metrics.increment("status.conflicts")
+            raise StatusConflictError(f"Status of image {image_id} changed before it could be set to {status}")
+        except Exception as e:
+            logging.error(f"Error updating status: {str(e)}")
+            return None
+        
+        results_cache.invalidate(image_id)
+        metrics.increment("status.updates")
+        logging.info(f"Updated status for image {image_id} to {status}")
+        return (written or {}).get("etag")
+    
+    def update_statuses(self, image_ids, status, error=None, etags=None, job=None):
+        """
+        Set the same status on many images' lookup rows
+        Lookup rows are partitioned by imageId, so each row is its own MERGE request (as in
+        update_status) and the requests are sent concurrently. etags ({imageId: ETag}) make those
+        images' updates conditional; a conflicting image is left unchanged
+        Returns {imageId: new ETag, or None if its status was not updated}
+        """
+        etags = etags or {}
+        image_ids = list(dict.fromkeys(image_ids))
+        if not image_ids:
+            return {}
+        
+        def write_one(image_id):
+            try:
+                return image_id, self.update_status(image_id, status, error, etag=etags.get(image_id), job=job)
+            except StatusConflictError:
+                return image_id, None
+        
+        with ThreadPoolExecutor(max_workers=min(16, len(image_ids)), thread_name_prefix="status") as executor:
+            updated = dict(executor.map(write_one, image_ids))
+        
+        logging.info(f"Updated status of {sum(1 for etag in updated.values() if etag)} of {len(updated)} images to {status}")
+        return updated
+    
+    def get_status_job(self, image_id):
+        """
+        The latest job recorded for an image (or None) and the ETag of its lookup row (None without a row)
+        Saving an analysis replaces the row, so a job recorded before the last save is forgotten
+        """
+        entity = self.index.get_latest_analysis(image_id, select=["statusJob"])
+        if entity is None:
+            return None, None
+        return json.loads(entity.get("statusJob") or "null"), entity.metadata.get("etag")
+    
+    def get_status(self, image_id):
+        """Current analysis status of an image, or None if it was never analyzed or queued"""
+        entity = self.index.get_latest_analysis(
+            image_id, select=["status", "statusTime", "statusError", "analysisTime"]
+        )
+        if entity is None:
+            return None
+        
+        return {
+            "imageId": image_id,
+            "status": entity.get("status", ""),
+            "statusTime": entity.get("statusTime") or entity.get("analysisTime", ""),
+            "error": entity.get("statusError") or None,
+            "analysisTime": entity.get("analysisTime")
+        }
+
+@app.route(route="health", auth_level=func.AuthLevel.ANONYMOUS)
+def health(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Health check endpoint for the Image Recognition Service
+    Returns JSON with service status and timestamp
+    """
+    logging.info('Health check endpoint called')
+    
+    try:
+        # Create health response
+        health_data = {
+            "status": "healthy",
+            "service": "Image Recognition Service",
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "version": "1.0.0"
+        }
+        
+        return func.HttpResponse(
+            json.dumps(health_data),
+            status_code=200,
+            mimetype="application/json"
+        )
+        
+    except Exception as e:
+        logging.error(f"Health check failed: {str(e)}")
+        
+        error_response = {
+            "status": "unhealthy",
+            "service": "Image Recognition Service", 
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "error": str(e)
+        }
+        
+        return func.HttpResponse(
+            json.dumps(error_response),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+@app.route(route="metrics", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
+def get_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    In-process metrics for the worker that serves the request
+    Counters and timing summaries accumulate from process start
+    """
+    logging.info('Metrics endpoint called')
+    
+    try:
+        return func.HttpResponse(
+            json.dumps({
+                "success": True,
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+                "process": {
+                    "pid": os.getpid(),
+                    "uptime_seconds": round(time.time() - PROCESS_START_TIME, 1)
+                },
+                **metrics.snapshot(),
+                "caches": {
+                    "results": results_cache.stats()
+                }
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+        
+    except Exception as e:
+        logging.error(f"Metrics function error: {str(e)}")
+        return func.HttpResponse(
+            json.dumps({
+                "success": False,
+                "error": f"Metrics error: {str(e)}",
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+@app.route(route="images/upload", auth_level=func.AuthLevel.ANONYMOUS, methods=["POST"])
+def upload_image(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Upload image endpoint
+    Accepts multipart/form-data with image file
+    Validates and stores in Azure Blob Storage
+    """
+    logging.info('Image upload endpoint called')
+    
+    try:
+        # Check if request has files
+        if not hasattr(req, 'files') or not req.files:
+            return func.HttpResponse(
+                json.dumps({
+                    "success": False,
+                    "error": "No file provided. Please upload an image file.",
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=400,
+                mimetype="application/json"
+            )
+        
+        # Get the uploaded file
+        file_data = None
+        original_filename = None
+        
+        # Handle different ways files might be sent
+        for field_name in req.files:
+            file_data = req.files[field_name]
+            original_filename = getattr(file_data, 'filename', 'upload.jpg')
+            break
+        
+        if not file_data:
+            return func.HttpResponse(
+                json.dumps({
+                    "success": False,
+                    "error": "No valid file found in request",
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=400,
+                mimetype="application/json"
+            )
+        
+        # Read file content
+        file_content = file_data.read()
+        file_size = len(file_content)
+        
+        # Validate file size (4MB limit)
+        max_size = 4 * 1024 * 1024  # 4MB in bytes
+        if file_size > max_size:
+            return func.HttpResponse(
+                json.dumps({
+                    "success": False,
+                    "error": f"File too large. Maximum size is 4MB, got {file_size / (1024*1024):.2f}MB",
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=400,
+                mimetype="application/json"
+            )
+        
+        # Validate file format using PIL
+        try:
+            image = Image.open(io.BytesIO(file_content))
+            image_format = image.format.lower() if image.format else None
+            
+            # Check allowed formats
+            if image_format not in ALLOWED_IMAGE_FORMATS:
+                return func.HttpResponse(
+                    json.dumps({
+                        "success": False,
+                        "error": f"Unsupported format '{image_format}'. Allowed: JPEG, PNG",
+                        "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                    }),
+                    status_code=400,
+                    mimetype="application/json"
+                )
+            
+            # Check image dimensions
+            width, height = image.size
+            if width > MAX_IMAGE_DIMENSION or height > MAX_IMAGE_DIMENSION:
+                return func.HttpResponse(
+                    json.dumps({
+                        "success": False,
+                        "error": f"Image too large. Max dimensions: {MAX_IMAGE_DIMENSION}x{MAX_IMAGE_DIMENSION}, got {width}x{height}",
+                        "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                    }),
+                    status_code=400,
+                    mimetype="application/json"
+                )
+            
+        except Exception as img_error:
+            return func.HttpResponse(
+                json.dumps({
+                    "success": False,
+                    "error": f"Invalid image file: {str(img_error)}",
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=400,
+                mimetype="application/json"
+            )
+        
+        # Content digest lets analysis reuse results for byte-identical uploads
+        content_hash = hashlib.sha256(file_content).hexdigest()
+        
+        # Perceptual hash finds near-duplicates: re-encoded, resized or slightly cropped copies
+        try:
+            phash = perceptual_hash(Image.open(io.BytesIO(file_content)))
+        except Exception as hash_error:
+            logging.warning(f"Could not compute perceptual hash: {str(hash_error)}")
+            phash = ""
+        
+        # Generate unique filename
+        image_id = str(uuid.uuid4())
+        timestamp = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        file_extension = image_format if image_format == 'png' else 'jpg'
+        blob_name = f"{timestamp}_{image_id}.{file_extension}"
+        
+        # Upload to Azure Blob Storage
+        try:
+            blob_service_client = get_blob_service_client()
+            container_name = UPLOAD_CONTAINER
+            ensure_container(blob_service_client, container_name)
+            
+            # Get blob client
+            blob_client = blob_service_client.get_blob_client(
+                container=container_name, 
+                blob=blob_name
+            )
+            
+            # Upload with metadata
+            metadata = {
+                "image_id": image_id,
+                "original_name": original_filename,
+                "upload_time": datetime.datetime.utcnow().isoformat() + "Z",
+                "file_size": str(file_size),
+                "dimensions": f"{width}x{height}",
+                "format": image_format,
+                "content_sha256": content_hash,
+                "perceptual_hash": phash
+            }
+            
+            # Reset file pointer and upload
+            blob_client.upload_blob(
+                file_content, 
+                overwrite=True, 
+                metadata=metadata,
+                content_type=f"image/{image_format}"
+            )
+            
+            # Index imageId -> blob so analysis can resolve it with a point read
+            ImageIndexRepository().save_blob_entry(image_id, blob_name, metadata)
+            if phash:
+                try:
+                    ImageHashIndexRepository().save(image_id, phash, blob_name, metadata["upload_time"])
+                except Exception as hash_index_error:
+                    # Only similarity lookups miss the image; manage.py backfill-perceptual-hashes adds it
+                    logging.warning(f"Could not index perceptual hash of image {image_id}: {str(hash_index_error)}")
+            
+            # Generate blob URL
+            blob_url = blob_client.url
+            
+            logging.info(f"Successfully uploaded image: {blob_name}")
+            
+            # Return success response
+            response_data = {
+                "success": True,
+                "imageId": image_id,
+                "blobName": blob_name,
+                "uploadUrl": blob_url,
+                "message": "Image uploaded successfully",
+                "metadata": {
+                    "originalName": original_filename,
+                    "fileSize": file_size,
+                    "dimensions": f"{width}x{height}",
+                    "format": image_format,
+                    "contentHash": content_hash,
+                    "perceptualHash": phash or None,
+                    "uploadTime": datetime.datetime.utcnow().isoformat() + "Z"
+                }
+            }
+            
+            return func.HttpResponse(
+                json.dumps(response_data),
+                status_code=200,
+                mimetype="application/json"
+            )
+            
+        except Exception as storage_error:
+            logging.error(f"Blob storage error: {str(storage_error)}")
+            return func.HttpResponse(
+                json.dumps({
+                    "success": False,
+                    "error": f"Storage error: {str(storage_error)}",
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=500,
+                mimetype="application/json"
+            )
+            
+    except Exception as e:
+        logging.error(f"Upload function error: {str(e)}")
+        return func.HttpResponse(
+            json.dumps({
+                "success": False,
+                "error": f"Server error: {str(e)}",
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+
+# Chunked uploads
+STREAM_CHUNK_BYTES = max(64, int(os.environ.get("UPLOAD_CHUNK_KB", "1024"))) * 1024
+STREAM_UPLOAD_MAX_BYTES = int(os.environ.get("STREAM_UPLOAD_MAX_MB", "64")) * 1024 * 1024
+
+class UploadRejected(Exception):
+    """An upload failed validation; status_code is the HTTP status to answer with"""
+    
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _block_id(index):
+    """Fixed-length base64 block ID, as Put Block requires"""
+    return base64.b64encode(f"{index:08d}".encode()).decode()
+
+def _inspect_image_header(chunk):
+    """Format and dimensions from the start of an image file; PIL reads the header without decoding pixels"""
+    try:
+        image = Image.open(io.BytesIO(chunk))
+        image_format = image.format.lower() if image.format else None
+        width, height = image.size
+    except Exception as img_error:
+        raise UploadRejected(f"Invalid image file: {str(img_error)}")
+    
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        raise UploadRejected(f"Unsupported format '{image_format}'. Allowed: JPEG, PNG")
+    if width > MAX_IMAGE_DIMENSION or height > MAX_IMAGE_DIMENSION:
+        raise UploadRejected(
+            f"Image too large. Max dimensions: {MAX_IMAGE_DIMENSION}x{MAX_IMAGE_DIMENSION}, got {width}x{height}"
+        )
+    return image_format, width, height
+
+def stream_image_to_blob(stream, original_filename):
+    """
+    Validate and store an image read from a file-like stream, one chunk at a time
+    The header is checked on the first chunk before anything is written; every chunk is
+    then hashed and staged as a block, and the block list is committed at the end, so no
+    copy of the whole file is made on top of the stream. A seekable stream is read once more
+    for the perceptual hash, decoded at reduced scale where the format allows it
+    Returns (image_id, blob_name, blob_url, metadata); raises UploadRejected for invalid input
+    """
+    chunk = stream.read(STREAM_CHUNK_BYTES)
+    if not chunk:
+        raise UploadRejected("No file provided. Please upload an image file.")
+    image_format, width, height = _inspect_image_header(chunk)
+    
+    image_id = str(uuid.uuid4())
+    timestamp = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    file_extension = image_format if image_format == 'png' else 'jpg'
+    blob_name = f"{timestamp}_{image_id}.{file_extension}"
+    
+    blob_service_client = get_blob_service_client()
+    ensure_container(blob_service_client, UPLOAD_CONTAINER)
+    blob_client = blob_service_client.get_blob_client(container=UPLOAD_CONTAINER, blob=blob_name)
+    
+    digest = hashlib.sha256()
+    block_ids = []
+    file_size = 0
+    while chunk:
+        file_size += len(chunk)
+        if file_size > STREAM_UPLOAD_MAX_BYTES:
+            # Blocks that are never committed are discarded by the service
+            raise UploadRejected(
+                f"File too large. Maximum size is {STREAM_UPLOAD_MAX_BYTES // (1024 * 1024)}MB", status_code=413
+            )
+        digest.update(chunk)
+        block_id = _block_id(len(block_ids))
+        blob_client.stage_block(block_id, chunk, length=len(chunk))
+        block_ids.append(block_id)
+        chunk = stream.read(STREAM_CHUNK_BYTES)
+    
+    phash = ""
+    if stream.seekable():
+        try:
+            stream.seek(0)
+            phash = perceptual_hash(Image.open(stream))
+        except Exception as hash_error:
+            logging.warning(f"Could not compute perceptual hash: {str(hash_error)}")
+    
+    metadata = {
+        "image_id": image_id,
+        "original_name": original_filename,
+        "upload_time": datetime.datetime.utcnow().isoformat() + "Z",
+        "file_size": str(file_size),
+        "dimensions": f"{width}x{height}",
+        "format": image_format,
+        "content_sha256": digest.hexdigest(),
+        "perceptual_hash": phash
+    }
+    blob_client.commit_block_list(
+        block_ids, metadata=metadata, content_settings=ContentSettings(content_type=f"image/{image_format}")
+    )
+    
+    # Index imageId -> blob so analysis can resolve it with a point read
+    ImageIndexRepository().save_blob_entry(image_id, blob_name, metadata)
+    if phash:
+        try:
+            ImageHashIndexRepository().save(image_id, phash, blob_name, metadata["upload_time"])
+        except Exception as hash_index_error:
+            # Only similarity lookups miss the image; manage.py backfill-perceptual-hashes adds it
+            logging.warning(f"Could not index perceptual hash of image {image_id}: {str(hash_index_error)}")
+    metrics.increment("uploads.streamed")
+    metrics.increment("uploads.streamed_blocks", len(block_ids))
+    
+    return image_id, blob_name, blob_client.url, metadata
+
+@app.route(route="images/upload/stream", auth_level=func.AuthLevel.ANONYMOUS, methods=["POST"])
+def upload_image_stream(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Chunked upload endpoint for large files
+    Accepts multipart/form-data or a raw image body (Content-Type image/jpeg or image/png)
+    Writes the file to Blob Storage as staged blocks, so files over 4MB are accepted. The
+    Functions host passes the worker the whole request, so the body itself is still held
+    in memory (multipart files are spooled to disk by the parser); only further copies are avoided
+    """
+    logging.info('Streaming image upload endpoint called')
+    
+    try:
+        content_type = req.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            # Large multipart files are spooled to a temporary file, so this reads from disk
+            file_data = next(iter(req.files.values()), None) if req.files else None
+            if not file_data:
+                return func.HttpResponse(
+                    json.dumps({
+                        "success": False,
+                        "error": "No file provided. Please upload an image file.",
+                        "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                    }),
+                    status_code=400,
+                    mimetype="application/json"
+                )
+            stream = file_data.stream
+            original_filename = file_data.filename or 'upload.jpg'
+        else:
+            # BytesIO shares the body's buffer rather than copying it
+            stream = io.BytesIO(req.get_body())
+            original_filename = req.headers.get("X-File-Name") or req.params.get("filename") or 'upload.jpg'
+        
+        image_id, blob_name, blob_url, metadata = stream_image_to_blob(stream, original_filename)
+        
+        logging.info(f"Successfully uploaded image in blocks: {blob_name}")
+        
+        return func.HttpResponse(
+            json.dumps({
+                "success": True,
+                "imageId": image_id,
+                "blobName": blob_name,
+                "uploadUrl": blob_url,
+                "message": "Image uploaded successfully",
+                "metadata": {
+                    "originalName": original_filename,
+                    "fileSize": int(metadata["file_size"]),
+                    "dimensions": metadata["dimensions"],
+                    "format": metadata["format"],
+                    "contentHash": metadata["content_sha256"],
+                    "perceptualHash": metadata["perceptual_hash"] or None,
+                    "uploadTime": metadata["upload_time"]
+                }
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+        
+    except UploadRejected as e:
+        return func.HttpResponse(
+            json.dumps({
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+            }),
+            status_code=e.status_code,
+            mimetype="application/json"
+        )
+        
+    except Exception as e:
+        logging.error(f"Streaming upload error: {str(e)}")
+        return func.HttpResponse(
+            json.dumps({
+                "success": False,
+                "error": f"Storage error: {str(e)}",
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+
+# Computer Vision rate limiting
+# Transactions per second allowed by each Computer Vision pricing tier
+CV_TIER_RATE_LIMITS = {"F0": 20 / 60, "S1": 10.0}
+CV_RATE_LIMIT_TABLE = "RateLimits"
+CV_MAX_RETRIES = int(os.environ.get("CV_MAX_RETRIES", "4"))
+CV_RETRY_BASE_SECONDS = float(os.environ.get("CV_RETRY_BASE_MS", "500")) / 1000
+CV_RETRY_MAX_SECONDS = float(os.environ.get("CV_RETRY_MAX_SECONDS", "30"))
+
+class ComputerVisionThrottledError(Exception):
+    """Computer Vision kept answering 429 after every retry"""
+    
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class InMemoryTokenBucketStore:
+    """Token buckets held in this process only (local development and benchmarks)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+    
+    def take(self, name, rate, burst, now):
+        """Take one token from bucket name; returns 0 if granted, else seconds until one is available"""
+        with self._lock:
+            tokens, updated = self._buckets.get(name, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[name] = (tokens - 1, now)
+                return 0.0
+            self._buckets[name] = (tokens, now)
+            return (1 - tokens) / rate
+
+class TableTokenBucketStore:
+    """
+    Token buckets in Table Storage, shared by every function instance
+    A take is one read plus an ETag-guarded write; an empty bucket costs only the read
+    """
+    
+    MAX_CONFLICT_RETRIES = 5
+    ROW_KEY = "bucket"
+    
+    def __init__(self, table_service=None):
+        self.table_service = table_service or get_table_service_client()
+        self.table_name = CV_RATE_LIMIT_TABLE
+        ensure_table(self.table_service, self.table_name)
+        self.table_client = self.table_service.get_table_client(self.table_name)
+    
+    def take(self, name, rate, burst, now):
+        """Take one token from bucket name; returns 0 if granted, else seconds until one is available"""
+        for _ in range(self.MAX_CONFLICT_RETRIES):
+            try:
+                entity = self.table_client.get_entity(partition_key=name, row_key=self.ROW_KEY)
+            except ResourceNotFoundError:
+                try:
+                    self.table_client.create_entity({
+                        "PartitionKey": name,
+                        "RowKey": self.ROW_KEY,
+                        "tokens": float(burst - 1),
+                        "updated": now
+                    })
+                    return 0.0
+                except ResourceExistsError:
+                    metrics.increment("cv.rate_limit.conflicts")
+                    continue
+            
+            tokens = min(burst, float(entity["tokens"]) + max(0.0, now - float(entity["updated"])) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            
+            entity["tokens"] = tokens - 1
+            entity["updated"] = now
+            try:
+                self.table_client.update_entity(
+                    entity, mode=UpdateMode.REPLACE,
+                    etag=entity.metadata["etag"], match_condition=MatchConditions.IfNotModified
+                )
+                return 0.0
+            except ResourceModifiedError:
+                # Another instance took a token in between; re-read and try again
+                metrics.increment("cv.rate_limit.conflicts")
+        
+        # Heavy contention means the bucket is being drained; back off for one token's worth
+        return 1 / rate
+
+class RateLimiter:
+    """Token bucket limiter whose state lives in a (possibly shared) bucket store"""
+    
+    def __init__(self, store, name, rate, burst=None):
+        self.store = store
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self._fallback = None
+    
+    def _take(self):
+        try:
+            return self.store.take(self.name, self.rate, self.burst, time.time())
+        except Exception as e:
+            # Keep limiting per process rather than failing the call or running unthrottled
+            logging.warning(f"Rate limit store unavailable, limiting locally: {str(e)}")
+            metrics.increment("cv.rate_limit.store_errors")
+            if self._fallback is None:
+                self._fallback = InMemoryTokenBucketStore()
+            return self._fallback.take(self.name, self.rate, self.burst, time.time())
+    
+    def acquire(self):
+        """Block until a token is granted; returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+            waited += wait
+        
+        if waited:
+            metrics.increment("cv.rate_limit.throttled")
+            metrics.observe("cv.throttle_wait.limiter", waited * 1000)
+        return waited
+
+def _create_cv_rate_limiter():
+    """
+    Limiter sized by CV_RATE_LIMIT_TPS, or by the CV_PRICING_TIER quota when unset
+    State is shared through Table Storage unless CV_RATE_LIMIT_BACKEND is "memory"
+    """
+    tier = os.environ.get("CV_PRICING_TIER", "S1").upper()
+    rate = float(os.environ.get("CV_RATE_LIMIT_TPS", CV_TIER_RATE_LIMITS.get(tier, CV_TIER_RATE_LIMITS["S1"])))
+    burst = float(os.environ.get("CV_RATE_LIMIT_BURST", max(1.0, rate)))
+    
+    backend = os.environ.get("CV_RATE_LIMIT_BACKEND", "table").lower()
+    store = InMemoryTokenBucketStore() if backend == "memory" else TableTokenBucketStore()
+    return RateLimiter(store, "computer-vision", rate, burst)
+
+def get_cv_rate_limiter():
+    """Shared Computer Vision rate limiter for this worker process"""
+    return clients.get("cv_rate_limiter", _create_cv_rate_limiter)
+
+def _is_throttled(error):
+    """True for an SDK error carrying an HTTP 429 response"""
+    return getattr(getattr(error, "response", None), "status_code", None) == 429
+
+def call_computer_vision(operation, fn, *args, **kwargs):
+    """
+    Call the Computer Vision API through the shared rate limiter
+    429 responses are retried up to CV_MAX_RETRIES times, waiting for Retry-After
+    (or exponential backoff when absent) plus random jitter
+    """
+    limiter = get_cv_rate_limiter()
+    attempt = 0
+    while True:
+        limiter.acquire()
+        metrics.increment(f"cv.calls.{operation}")
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not _is_throttled(e):
+                raise
+            metrics.increment(f"cv.throttled.{operation}")
+            retry_after = _retry_after_seconds(e)
+            if attempt >= CV_MAX_RETRIES:
+                raise ComputerVisionThrottledError(
+                    f"Computer Vision {operation} throttled after {attempt + 1} attempts", retry_after
+                ) from e
+        
+        backoff = min(CV_RETRY_MAX_SECONDS, CV_RETRY_BASE_SECONDS * 2 ** attempt)
+        # Jitter spreads out instances that were throttled at the same moment
+        delay = retry_after + random.uniform(0, CV_RETRY_BASE_SECONDS) if retry_after is not None else random.uniform(0, backoff)
+        logging.warning(f"Computer Vision {operation} throttled (429), retrying in {delay:.2f}s")
+        metrics.increment(f"cv.retries.{operation}")
+        metrics.observe("cv.throttle_wait.retry", delay * 1000)
+        time.sleep(delay)
+        attempt += 1
+
+# Computer Vision analysis
+_cv_executor = None
+_cv_executor_lock = threading.Lock()
+
+def get_cv_executor():
+    """
+    Bounded thread pool for Computer Vision calls, shared by all invocations in this process
+    Sized by CV_MAX_CONCURRENCY (default 16 concurrent remote operations)
+    """
+    global _cv_executor
+    if _cv_executor is None:
+        with _cv_executor_lock:
+            if _cv_executor is None:
+                _cv_executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("CV_MAX_CONCURRENCY", "16")),
+                    thread_name_prefix="computer-vision"
+                )
+    return _cv_executor
+
+def _timed(stage, timings, fn, *args):
+    """Run fn(*args), recording its duration under stage in timings and in metrics"""
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        timings[stage] = round(elapsed_ms, 1)
+        metrics.observe(f"analysis.stage.{stage}", elapsed_ms)
+
+async def _timed_async(stage, timings, coroutine):
+    """Await coroutine, recording its duration under stage in timings and in metrics"""
+    started = time.perf_counter()
+    try:
+        return await coroutine
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        timings[stage] = round(elapsed_ms, 1)
+        metrics.observe(f"analysis.stage.{stage}", elapsed_ms)
+
+# Preprocessing for Computer Vision
+CV_MAX_IMAGE_BYTES = 4 * 1024 * 1024  # Computer Vision rejects larger images
+CV_ANALYZE_MAX_SIDE = int(os.environ.get("CV_ANALYZE_MAX_SIDE", "1024"))
+CV_OCR_MAX_SIDE = int(os.environ.get("CV_OCR_MAX_SIDE", "2000"))
+CV_ANALYZE_JPEG_QUALITY = 80
+CV_OCR_JPEG_QUALITY = 90  # small text suffers first from compression artefacts
+
+class CVImage:
+    """
+    What Computer Vision is asked to look at: a blob URL, or image bytes sent with the request
+    scale_x and scale_y map coordinates in the sent image back to the original upload
+    """
+    
+    def __init__(self, url=None, data=None, scale_x=1.0, scale_y=1.0):
+        self.url = url
+        self.data = data
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+    
+    def analyze(self, cv_client, visual_features):
+        if self.data is None:
+            return call_computer_vision(
+                "analyze_image", cv_client.analyze_image, self.url, visual_features=visual_features
+            )
+        # A fresh stream per attempt, so a retried call re-sends the whole image
+        return call_computer_vision(
+            "analyze_image_in_stream",
+            lambda: cv_client.analyze_image_in_stream(io.BytesIO(self.data), visual_features=visual_features)
+        )
+    
+    def read(self, cv_client):
+        if self.data is None:
+            return call_computer_vision("read", cv_client.read, self.url, raw=True)
+        return call_computer_vision("read_in_stream", lambda: cv_client.read_in_stream(io.BytesIO(self.data), raw=True))
+    
+    def box(self, left, top, width, height):
+        """Rectangle in original image coordinates"""
+        return (round(left * self.scale_x), round(top * self.scale_y),
+                round(width * self.scale_x), round(height * self.scale_y))
+    
+    def polygon(self, points):
+        """Flat [x1, y1, x2, y2, ...] list in original image coordinates"""
+        if self.scale_x == 1.0 and self.scale_y == 1.0:
+            return points
+        return [round(value * (self.scale_x if index % 2 == 0 else self.scale_y), 1) for index, value in enumerate(points)]
+
+def _as_cv_image(image):
+    return image if isinstance(image, CVImage) else CVImage(url=image)
+
+def preprocess_for_cv(data, max_side, quality):
+    """
+    Copy of an uploaded image sized for one Computer Vision call, as a CVImage
+    An original within max_side pixels per side and the service's size limit is sent unchanged;
+    otherwise it is decoded (JPEGs directly at 1/2, 1/4 or 1/8 scale where that still covers
+    max_side), resized and recompressed as JPEG
+    """
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    if max(width, height) <= max_side and len(data) <= CV_MAX_IMAGE_BYTES:
+        return CVImage(data=data)
+    
+    # EXIF orientation is kept so Computer Vision sees the copy the way it sees the original
+    exif = image.info.get("exif", b"")
+    ratio = min(1.0, max_side / max(width, height))
+    image.draft("RGB", (int(width * ratio), int(height * ratio)))
+    resized = image.convert("RGB")
+    # Within 10% of the target (e.g. after a reduced-scale decode) resampling is not worth its cost
+    if max(resized.size) > max_side * 1.1:
+        resized.thumbnail((max_side, max_side), Image.BILINEAR, reducing_gap=2.0)
+    
+    buffer = io.BytesIO()
+    resized.save(buffer, "JPEG", quality=quality, exif=exif)
+    return CVImage(data=buffer.getvalue(), scale_x=width / resized.width, scale_y=height / resized.height)
+
+def _cv_image_for(feature, data, blob_url, timings):
+    """
+    Preprocessed copy of data for one feature ("analyze" or "ocr"), timed as preprocess_<feature>
+    Falls back to the blob URL when there is no data or it cannot be processed
+    """
+    if data is None:
+        return CVImage(url=blob_url)
+    max_side, quality = {
+        "analyze": (CV_ANALYZE_MAX_SIDE, CV_ANALYZE_JPEG_QUALITY),
+        "ocr": (CV_OCR_MAX_SIDE, CV_OCR_JPEG_QUALITY)
+    }[feature]
+    try:
+        image = _timed(f"preprocess_{feature}", timings, preprocess_for_cv, data, max_side, quality)
+    except Exception as preprocess_error:
+        logging.warning(f"Preprocessing for {feature} failed, sending the blob URL: {str(preprocess_error)}")
+        metrics.increment("preprocess.failures")
+        return CVImage(url=blob_url)
+    metrics.increment("preprocess.bytes_original", len(data))
+    metrics.increment("preprocess.bytes_sent", len(image.data))
+    return image
+
+# Analysis features: API name -> Computer Vision visual feature, as a VisualFeatureTypes member
+# name so the SDK is not imported at load ("text" is OCR via the Read API)
+ANALYSIS_FEATURES = {
+    "categories": "categories",
+    "description": "description",
+    "faces": "faces",
+    "objects": "objects",
+    "tags": "tags",
+    "adult": "adult",
+    "color": "color",
+    "image_type": "image_type",
+    "text": None
+}
+ALL_FEATURES = frozenset(ANALYSIS_FEATURES)
+
+# Where each feature's output lives in the analysis document
+FEATURE_FIELDS = {
+    "categories": [("categories",)],
+    "description": [("descriptions",)],
+    "faces": [("faces",)],
+    "objects": [("objects",)],
+    "tags": [("tags",)],
+    "adult": [("metadata", "adult_content")],
+    "color": [("metadata", "dominant_colors"), ("metadata", "accent_color"), ("metadata", "is_bw_image")],
+    "image_type": [("metadata", "image_type")],
+    "text": [("text",)]
+}
+
+def parse_features(value):
+    """
+    Feature set from a comma-separated features= value; empty or "all" means every feature
+    Raises ValueError naming any unknown feature
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        names = {str(name).strip().lower() for name in value}
+    else:
+        names = {name.strip().lower() for name in (value or "").split(",")}
+    names.discard("")
+    if not names or "all" in names:
+        return ALL_FEATURES
+    
+    unknown = names - ALL_FEATURES
+    if unknown:
+        raise ValueError(
+            f"Unknown feature(s): {', '.join(sorted(unknown))}. Valid: {', '.join(sorted(ALL_FEATURES))}, all"
+        )
+    return frozenset(names)
+
+def body_flag(body, name, default=False):
+    """
+    A boolean field of a JSON request body: true/false, or "true"/"false" as in query parameters
+    A missing field gives default; raises ValueError for anything else
+    """
+    value = body.get(name, default)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise ValueError(f"{name} must be true or false, got {json.dumps(value)}")
+
+def stored_features(analysis_data):
+    """Features present in a stored analysis document (documents saved before features were tracked have all)"""
+    return frozenset(analysis_data.get("features", ALL_FEATURES))
+
+def merge_features(analysis, update, features):
+    """Copy the fields of the given features from one analysis dict into another (in place)"""
+    for feature in FEATURE_FIELDS:
+        if feature not in features:
+            continue
+        for path in FEATURE_FIELDS[feature]:
+            source, target = update, analysis
+            for key in path[:-1]:
+                source = source.get(key, {})
+                target = target.setdefault(key, {})
+            if path[-1] in source:
+                target[path[-1]] = source[path[-1]]
+    return analysis
+
+def describe_image(cv_client, image, features=ALL_FEATURES):
+    """
+    Run the Computer Vision image analysis call and flatten its result
+    image is a CVImage or a blob URL; regions are reported in original image coordinates.
+    Only the requested features are asked for and returned
+    """
+    image = _as_cv_image(image)
+    # Visual features to extract
+    visual_features = [
+        getattr(VisualFeatureTypes, visual_feature) for feature, visual_feature in ANALYSIS_FEATURES.items()
+        if visual_feature is not None and feature in features
+    ]
+    
+    # Call Computer Vision API
+    analysis_result = image.analyze(cv_client, visual_features)
+    
+    # Extract objects
+    objects = []
+    if analysis_result.objects:
+        for obj in analysis_result.objects:
+            x, y, w, h = image.box(obj.rectangle.x, obj.rectangle.y, obj.rectangle.w, obj.rectangle.h)
+            objects.append({
+                "name": obj.object_property,
+                "confidence": round(obj.confidence, 4),
+                "rectangle": {
+                    "x": x,
+                    "y": y,
+                    "w": w,
+                    "h": h
+                }
+            })
+    
+    # Extract faces
+    faces = []
+    if analysis_result.faces:
+        for face in analysis_result.faces:
+            rectangle = face.face_rectangle
+            left, top, width, height = image.box(rectangle.left, rectangle.top, rectangle.width, rectangle.height)
+            faces.append({
+                "age": face.age,
+                "gender": face.gender.value if face.gender else None,
+                "rectangle": {
+                    "left": left,
+                    "top": top,
+                    "width": width,
+                    "height": height
+                }
+            })
+    
+    # Extract descriptions
+    descriptions = []
+    if analysis_result.description and analysis_result.description.captions:
+        for caption in analysis_result.description.captions:
+            descriptions.append({
+                "text": caption.text,
+                "confidence": round(caption.confidence, 4)
+            })
+    
+    # Extract tags
+    tags = []
+    if analysis_result.tags:
+        for tag in analysis_result.tags:
+            tags.append({
+                "name": tag.name,
+                "confidence": round(tag.confidence, 4)
+            })
+    
+    # Extract categories
+    categories = []
+    if analysis_result.categories:
+        for category in analysis_result.categories:
+            categories.append({
+                "name": category.name,
+                "score": round(category.score, 4)
+            })
+    
+    full_result = {
+        "objects": objects,
+        "faces": faces,
+        "descriptions": descriptions,
+        "tags": tags,
+        "categories": categories,
+        "metadata": {
+            "dominant_colors": list(analysis_result.color.dominant_colors) if analysis_result.color else [],
+            "accent_color": analysis_result.color.accent_color if analysis_result.color else None,
+            "is_bw_image": analysis_result.color.is_bw_img if analysis_result.color else False,
+            "adult_content": {
+                "is_adult": analysis_result.adult.is_adult_content if analysis_result.adult else False,
+                "adult_score": round(analysis_result.adult.adult_score, 4) if analysis_result.adult else 0,
+                "is_racy": analysis_result.adult.is_racy_content if analysis_result.adult else False,
+                "racy_score": round(analysis_result.adult.racy_score, 4) if analysis_result.adult else 0
+            },
+            "image_type": {
+                "clip_art_type": analysis_result.image_type.clip_art_type if analysis_result.image_type else 0,
+                "line_drawing_type": analysis_result.image_type.line_drawing_type if analysis_result.image_type else 0
+            }
+        }
+    }
+    
+    # Keep only what was asked for, so absent fields mean "not analyzed" rather than "nothing found"
+    return merge_features({}, full_result, features - {"text"})
+
+# Adaptive OCR polling
+OCR_POLL_INITIAL_SECONDS = float(os.environ.get("OCR_POLL_INITIAL_MS", "100")) / 1000
+OCR_POLL_MAX_SECONDS = float(os.environ.get("OCR_POLL_MAX_MS", "2000")) / 1000
+OCR_DEADLINE_SECONDS = float(os.environ.get("OCR_DEADLINE_SECONDS", "15"))
+
+_poll_loop = None
+_poll_loop_lock = threading.Lock()
+
+def get_poll_loop():
+    """
+    Shared asyncio event loop on a daemon thread
+    OCR waits are scheduled here, so waiting between polls holds no worker thread
+    """
+    global _poll_loop
+    if _poll_loop is None:
+        with _poll_loop_lock:
+            if _poll_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ocr-poller", daemon=True).start()
+                _poll_loop = loop
+    return _poll_loop
+
+def _retry_after_seconds(raw_response):
+    """Retry-After header of a raw SDK response in seconds, or None"""
+    response = getattr(raw_response, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+async def _wait_for_read_result(cv_client, operation_id):
+    """
+    Poll a Read operation until it finishes or OCR_DEADLINE_SECONDS passes
+    Honours Retry-After; otherwise starts at OCR_POLL_INITIAL_MS and doubles up to OCR_POLL_MAX_MS
+    Returns (read_result or None on timeout, number of polls)
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + OCR_DEADLINE_SECONDS
+    interval = OCR_POLL_INITIAL_SECONDS
+    polls = 0
+    
+    while True:
+        raw_result = await loop.run_in_executor(
+            get_cv_executor(),
+            functools.partial(call_computer_vision, "get_read_result", cv_client.get_read_result, operation_id, raw=True)
+        )
+        polls += 1
+        read_result = raw_result.output
+        if read_result.status not in (OperationStatusCodes.not_started, OperationStatusCodes.running):
+            return read_result, polls
+        
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None, polls
+        
+        retry_after = _retry_after_seconds(raw_result)
+        await asyncio.sleep(min(retry_after if retry_after is not None else interval, remaining))
+        interval = min(interval * 2, OCR_POLL_MAX_SECONDS)
+
+async def extract_text(cv_client, image):
+    """
+    Run OCR (Read API) on a CVImage or blob URL; OCR problems are reported in the result, not raised
+    Line bounding boxes are reported in original image coordinates
+    """
+    image = _as_cv_image(image)
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        read_operation = await loop.run_in_executor(get_cv_executor(), image.read, cv_client)
+        operation_id = read_operation.headers["Operation-Location"].split("/")[-1]
+        
+        # Wait for OCR to complete
+        read_result, polls = await _wait_for_read_result(cv_client, operation_id)
+        wait_ms = (time.perf_counter() - started) * 1000
+        metrics.observe("ocr.wait", wait_ms)
+        metrics.increment("ocr.polls", polls)
+        
+        if read_result is None:
+            logging.warning(f"OCR did not finish within {OCR_DEADLINE_SECONDS}s")
+            metrics.increment("ocr.timeouts")
+            return {
+                "text_detected": False,
+                "status": "timeout",
+                "error": f"OCR did not finish within {OCR_DEADLINE_SECONDS:g} seconds"
+            }
+        
+        if read_result.status != OperationStatusCodes.succeeded:
+            logging.warning("OCR operation failed")
+            metrics.increment("ocr.failures")
+            return {
+                "text_detected": False,
+                "status": "failed",
+                "error": "OCR operation failed"
+            }
+        
+        # Extract text
+        extracted_text = []
+        for page in read_result.analyze_result.read_results:
+            for line in page.lines:
+                extracted_text.append({
+                    "text": line.text,
+                    "bounding_box": image.polygon(line.bounding_box)
+                })
+        
+        return {
+            "text_detected": len(extracted_text) > 0,
+            "status": "succeeded",
+            "total_lines": len(extracted_text),
+            # Documents live in blobs (no property size limit), so every line is kept for the text index
+            "extracted_text": extracted_text
+        }
+    
+    except Exception as ocr_error:
+        logging.warning(f"OCR failed: {str(ocr_error)}")
+        metrics.increment("ocr.failures")
+        return {
+            "text_detected": False,
+            "status": "error",
+            "error": str(ocr_error)
+        }
+
+def analyze_blob(image_id, blob_name, features=ALL_FEATURES):
+    """
+    Run Computer Vision analysis and OCR on an uploaded blob
+    The two remote operations are independent, so they run concurrently and the
+    wall time is roughly that of the slower one; OCR waits on the shared poll loop.
+    Each is sent a copy of the image sized for it (see preprocess_for_cv).
+    Only the requested features are computed: OCR is skipped without "text", and the
+    image analysis call when no visual feature is requested
+    Returns the analysis document stored in Table Storage and returned by the API
+    """
+    # Get blob URL for Computer Vision API
+    blob_service_client = get_blob_service_client()
+    blob_client = blob_service_client.get_blob_client(
+        container=UPLOAD_CONTAINER, 
+        blob=blob_name
+    )
+    blob_url = blob_client.url
+    
+    # Initialize Computer Vision client
+    cv_client = get_computer_vision_client()
+    
+    # Perform comprehensive analysis
+    logging.info(f"Analyzing image: {blob_url}")
+    
+    timings = {}
+    started = time.perf_counter()
+    
+    # Download once and send right-sized copies, instead of Computer Vision fetching the full original twice
+    data = None
+    if env_flag("CV_PREPROCESS", True):
+        try:
+            data = _timed("download", timings, lambda: blob_client.download_blob().readall())
+        except Exception as download_error:
+            logging.warning(f"Could not download {blob_name} for preprocessing, sending the blob URL: {str(download_error)}")
+            metrics.increment("preprocess.failures")
+    
+    # Each feature's copy is built on its own path, so preprocessing overlaps across features
+    async def ocr_stage():
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(executor, _cv_image_for, "ocr", data, blob_url, timings)
+        return await extract_text(cv_client, image)
+    
+    def analyze_stage():
+        return describe_image(cv_client, _cv_image_for("analyze", data, blob_url, timings), features)
+    
+    executor = get_cv_executor()
+    ocr_future = image_future = None
+    if "text" in features:
+        ocr_future = asyncio.run_coroutine_threadsafe(_timed_async("ocr", timings, ocr_stage()), get_poll_loop())
+    if features - {"text"}:
+        image_future = executor.submit(_timed, "analyze_image", timings, analyze_stage)
+    
+    analysis = image_future.result() if image_future else {}
+    if ocr_future:
+        analysis["text"] = ocr_future.result()
+    
+    wall_ms = (time.perf_counter() - started) * 1000
+    timings["wall"] = round(wall_ms, 1)
+    metrics.observe("analysis.wall", wall_ms)
+    
+    # Compile comprehensive analysis results
+    analysis_data = {
+        "imageId": image_id,
+        "blobName": blob_name,
+        "analysis": analysis,
+        "features": sorted(features),
+        "timings_ms": timings,
+        "analysis_timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+    }
+    
+    logging.info(f"Analysis completed for image {image_id} in {timings['wall']} ms "
+                 f"(analyze_image {timings.get('analyze_image', '-')} ms, ocr {timings.get('ocr', '-')} ms)")
+    
+    return analysis_data
+
+def resolve_blob_entry(image_id):
+    """Find the blob for an imageId via the lookup index (optionally falling back to a container scan)"""
+    index_repository = ImageIndexRepository()
+    blob_entry = index_repository.get_blob_entry(image_id)
+    
+    if not blob_entry and env_flag("BLOB_INDEX_SCAN_FALLBACK"):
+        logging.warning(f"Image {image_id} not in blob index, falling back to container scan")
+        container_client = get_blob_service_client().get_container_client(UPLOAD_CONTAINER)
+        blob_entry = index_repository.find_blob_by_scan(container_client, image_id)
+    
+    return blob_entry
+
+def _record_feature_savings(requested, computed):
+    """
+    Count what feature selection and reuse saved against analyzing everything every time:
+    Computer Vision stages not run, and their average latency in this process
+    """
+    metrics.increment("features.requested", len(requested))
+    metrics.increment("features.computed", len(computed))
+    metrics.increment("features.reused", len(requested - computed))
+    for stage, ran in (("analyze_image", bool(computed - {"text"})), ("ocr", "text" in computed)):
+        if ran:
+            continue
+        metrics.increment(f"cv.calls_saved.{stage}")
+        average_ms = metrics.average(f"analysis.stage.{stage}")
+        if average_ms is not None:
+            metrics.increment("cv.latency_saved_ms", round(average_ms))
+
+# Near-duplicate reuse: features whose output has no pixel coordinates, so a resized or
+# cropped copy's results stand in for the image's own
+NEAR_DUPLICATE_FEATURES = frozenset({"categories", "description", "tags", "adult", "color", "image_type"})
+NEAR_DUPLICATE_REUSE = env_flag("NEAR_DUPLICATE_REUSE")
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_MAX_DISTANCE", "4"))
+NEAR_DUPLICATE_CANDIDATES = 3
+
+def find_near_duplicate_analysis(image_id, phash, repository, features):
+    """
+    Stored analysis of the nearest near-duplicate (within NEAR_DUPLICATE_MAX_DISTANCE bits)
+    that has any of features, as (result, distance), or None
+    """
+    candidates = ImageHashIndexRepository(repository.table_service).find_similar(
+        phash, NEAR_DUPLICATE_MAX_DISTANCE, exclude=image_id, max_results=NEAR_DUPLICATE_CANDIDATES
+    )
+    for candidate in candidates:
+        result = repository.get_analysis_result(candidate["imageId"])
+        if result and features & stored_features(result["analysisResults"]):
+            return result, candidate["distance"]
+    return None
+
+def prepare_analysis(image_id, blob_entry, force=False, repository=None, features=ALL_FEATURES, reuse_similar=False):
+    """
+    Produce the analysis document for an image without saving it
+    Requested features already in the image's stored analysis, or (unless force is set) in
+    the analysis of byte-identical content, are reused; only the missing ones are computed
+    and merged into the stored record. With reuse_similar, coordinate-free features
+    (NEAR_DUPLICATE_FEATURES) are also taken from a near-duplicate's analysis.
+    force recomputes every requested feature
+    Returns the analysis document, the imageId features were reused from (or None),
+    and the set of features computed. When nothing needs saving the document is the
+    stored one, still serialized (RawJSON)
+    """
+    blob_name = blob_entry["blobName"]
+    repository = repository or ImageAnalysisRepository()
+    content_hash = blob_entry.get("contentHash", "")
+    reused_from = None
+    reused_distance = None
+    
+    own = repository.get_analysis_result(image_id, raw=True)
+    own_raw = own["analysisResults"] if own else None
+    own_document = own_raw.value if own_raw else None
+    analysis = own_document.get("analysis", {}) if own_document else {}
+    available = set(stored_features(own_document)) if own_document else set()
+    
+    if force:
+        metrics.increment("dedup.forced")
+        to_compute = set(features)
+    else:
+        missing = features - available
+        if missing and content_hash:
+            previous = None
+            try:
+                previous = repository.find_analysis_by_content(content_hash)
+            except Exception as lookup_error:
+                logging.warning(f"Content hash lookup failed, analyzing instead: {str(lookup_error)}")
+            
+            reusable = missing & stored_features(previous["analysisResults"]) if previous else set()
+            if reusable:
+                merge_features(analysis, previous["analysisResults"].get("analysis", {}), reusable)
+                available |= reusable
+                reused_from = previous["imageId"]
+                metrics.increment("dedup.hits")
+                logging.info(f"Reusing {', '.join(sorted(reusable))} of identical image {reused_from} for image {image_id}")
+            else:
+                metrics.increment("dedup.misses")
+        
+        similar_missing = (features - available) & NEAR_DUPLICATE_FEATURES
+        if reuse_similar and similar_missing and blob_entry.get("perceptualHash"):
+            near = None
+            try:
+                near = find_near_duplicate_analysis(image_id, blob_entry["perceptualHash"], repository, similar_missing)
+            except Exception as lookup_error:
+                logging.warning(f"Near-duplicate lookup failed, analyzing instead: {str(lookup_error)}")
+            
+            if near:
+                similar, reused_distance = near
+                reusable = similar_missing & stored_features(similar["analysisResults"])
+                merge_features(analysis, similar["analysisResults"].get("analysis", {}), reusable)
+                available |= reusable
+                reused_from = reused_from or similar["imageId"]
+                metrics.increment("dedup.near_hits")
+                logging.info(f"Reusing {', '.join(sorted(reusable))} of near-duplicate {similar['imageId']} "
+                             f"({reused_distance} bits apart) for image {image_id}")
+            else:
+                metrics.increment("dedup.near_misses")
+        to_compute = features - available
+    
+    _record_feature_savings(features, to_compute)
+    
+    if not to_compute and reused_from is None:
+        # Everything requested is already stored for this image
+        return own_raw, None, set()
+    
+    analysis_data = {
+        "imageId": image_id,
+        "blobName": blob_name,
+        "analysis": analysis,
+        "features": sorted(available | to_compute),
+        "analysis_timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+    }
+    if to_compute:
+        fresh = analyze_blob(image_id, blob_name, to_compute)
+        merge_features(analysis, fresh["analysis"], to_compute)
+        analysis_data["timings_ms"] = fresh["timings_ms"]
+    if reused_from:
+        analysis_data["reused_from"] = reused_from
+    if reused_distance is not None:
+        analysis_data["reused_distance"] = reused_distance
+    
+    return analysis_data, reused_from, to_compute
+
+def _save_arguments(image_id, blob_entry, analysis_data):
+    """save_analysis_result arguments for an analyzed blob"""
+    return {
+        "image_id": image_id,
+        "blob_name": blob_entry["blobName"],
+        "analysis_data": analysis_data,
+        "upload_time": blob_entry["uploadTime"],
+        "file_metadata": {
+            "fileSize": blob_entry["fileSize"],
+            "dimensions": blob_entry["dimensions"],
+            "format": blob_entry["format"]
+        }
+    }
+
+def mark_completed(repository, image_id, status_etag=None):
+    """
+    Set "completed" on an image whose stored analysis already covered a request, so nothing was saved
+    Saving is what normally sets it; without a save a queued job's "running", or an earlier
+    "pending" or "failed", would stay. With status_etag (the job's own status write) the update
+    is conditional, and a status changed by someone else since is left alone
+    """
+    if status_etag is None:
+        status = repository.get_status(image_id)
+        if status and status["status"] == STATUS_COMPLETED:
+            return
+    try:
+        repository.update_status(image_id, STATUS_COMPLETED, etag=status_etag)
+    except StatusConflictError:
+        logging.info(f"Status of image {image_id} changed meanwhile; not marking it completed")
+
+def run_analysis(image_id, blob_entry, force=False, features=ALL_FEATURES, reuse_similar=False, status_etag=None):
+    """
+    Analyze an image (or reuse stored and identical-content results) and save the merged result
+    Shared by the synchronous route and the queue worker, which passes the ETag of its
+    "running" status so a request that saves nothing only completes its own status
+    Returns the analysis document as stored (RawJSON, serialized once for storage and
+    response), whether it is in storage, the imageId results were reused from, and the
+    features computed
+    """
+    repository = ImageAnalysisRepository()
+    analysis_data, reused_from, computed = prepare_analysis(image_id, blob_entry, force, repository, features, reuse_similar)
+    
+    if not computed and reused_from is None:
+        logging.info(f"All requested features already stored for image {image_id}")
+        mark_completed(repository, image_id, status_etag)
+        return analysis_data, True, None, computed
     
-    def get_analysis_result(self, image_id):
-        """Get analysis result by image ID"""
-        try:
-            table_client = self.table_service.get_table_client(self.table_name)
-            
-            # Query by imageId (need to scan since it's not the key)
-            filter_query = f"imageId eq '{image_id}'"
-            entities = table_client.query_entities(query_filter=filter_query, select=None)
-            
-            for entity in entities:
-                return {
-                    "imageId": entity["imageId"],
-                    "blobName": entity["blobName"],
-                    "status": entity["status"],
-                    "uploadTime": entity["uploadTime"],
-                    "analysisTime": entity["analysisTime"],
-                    "analysisResults": json.loads(entity["analysisResults"]),
-                    "metadata": {
-                        "objectCount": entity.get("objectCount", 0),
-                        "faceCount": entity.get("faceCount", 0),
-                        "hasText": entity.get("hasText", False),
-                        "tags": entity.get("tags", ""),
-                        "primaryDescription": entity.get("primaryDescription", ""),
-                        "confidence": entity.get("confidence", 0.0),
-                        "fileSize": entity.get("fileSize", 0),
-                        "dimensions": entity.get("dimensions", ""),
-                        "format": entity.get("format", "")
-                    }
-                }
-            
-            return None
-            
-        except Exception as e:
-            logging.error(f"Error retrieving analysis result: {str(e)}")
-            return None
+    document = encode_document(analysis_data)
     
-    def get_results_by_date_range(self, start_date, end_date, max_results=50):
-        """Get results within date range"""
-        try:
-            table_client = self.table_service.get_table_client(self.table_name)
+    # 🔥 SAVE RESULTS TO TABLE STORAGE
+    saved_to_storage = False
+    try:
+        saved = repository.save_analysis_result(**_save_arguments(image_id, blob_entry, analysis_data), encoded=document)
+        
+        if saved:
+            logging.info(f"✅ Analysis results saved to Table Storage for image {image_id}")
+            saved_to_storage = True
             
-            # Create date range filter
-            start_str = start_date.strftime("%Y-%m-%d")
-            end_str = end_date.strftime("%Y-%m-%d")
-            filter_query = f"PartitionKey ge '{start_str}' and PartitionKey le '{end_str}'"
+            # Fresh analyses become the one reused for identical uploads
+            content_hash = blob_entry.get("contentHash", "")
+            if content_hash and computed:
+                repository.index.save_content_entry(content_hash, image_id)
+        else:
+            logging.warning(f"❌ Failed to save analysis results for image {image_id}")
             
-            entities = table_client.query_entities(
-                query_filter=filter_query,
-                select=["imageId", "blobName", "status", "uploadTime", "analysisTime", 
-                       "objectCount", "faceCount", "hasText", "tags", "primaryDescription", 
-                       "confidence", "fileSize", "dimensions", "format"]
+    except Exception as save_error:
+        logging.error(f"💥 Error saving to Table Storage: {str(save_error)}")
+        # Don't fail the request if saving fails
+    
+    return document, saved_to_storage, reused_from, computed
+
+def run_batch_analysis(image_ids, force=False, concurrency=8, features=ALL_FEATURES, reuse_similar=False):
+    """
+    Analyze many images with at most `concurrency` in flight, then save them together
+    Returns one outcome dict per imageId, in input order
+    """
+    repository = ImageAnalysisRepository()
+    outcomes = {
+        image_id: {
+            "imageId": image_id, "status": STATUS_PENDING, "saved_to_storage": False, "deduplicated": False,
+            "features_computed": [], "error": None
+        }
+        for image_id in image_ids
+    }
+    prepared = {}
+    
+    def analyze_one(image_id):
+        blob_entry = resolve_blob_entry(image_id)
+        if not blob_entry:
+            return image_id, None, None, None, None
+        analysis_data, reused_from, computed = prepare_analysis(image_id, blob_entry, force, repository, features, reuse_similar)
+        if not computed and reused_from is None:
+            mark_completed(repository, image_id)
+        return image_id, blob_entry, analysis_data, reused_from, computed
+    
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-analysis") as executor:
+        futures = {executor.submit(analyze_one, image_id): image_id for image_id in image_ids}
+        for future in as_completed(futures):
+            image_id = futures[future]
+            try:
+                _, blob_entry, analysis_data, reused_from, computed = future.result()
+            except Exception as e:
+                logging.error(f"Batch analysis of image {image_id} failed: {str(e)}")
+                outcomes[image_id].update({"status": STATUS_FAILED, "error": str(e)})
+                continue
+            if blob_entry is None:
+                outcomes[image_id].update({"status": "not_found", "error": f"Image with ID {image_id} not found"})
+                continue
+            if not computed and reused_from is None:
+                # Already stored with every requested feature; nothing to write
+                outcomes[image_id].update({"status": STATUS_COMPLETED, "saved_to_storage": True})
+                continue
+            prepared[image_id] = (blob_entry, analysis_data, reused_from, computed)
+    
+    saved = repository.save_analysis_results([
+        _save_arguments(image_id, blob_entry, analysis_data)
+        for image_id, (blob_entry, analysis_data, _, _) in prepared.items()
+    ])
+    
+    for image_id, (blob_entry, analysis_data, reused_from, computed) in prepared.items():
+        saved_to_storage = saved.get(image_id, False)
+        outcomes[image_id].update({
+            "status": STATUS_COMPLETED if saved_to_storage else STATUS_FAILED,
+            "saved_to_storage": saved_to_storage,
+            "deduplicated": reused_from is not None,
+            "features_computed": sorted(computed)
+        })
+        if not saved_to_storage:
+            outcomes[image_id]["error"] = "Analysis results could not be saved"
+        elif blob_entry.get("contentHash") and computed:
+            try:
+                repository.index.save_content_entry(blob_entry["contentHash"], image_id)
+            except Exception as index_error:
+                logging.warning(f"Could not record content hash for image {image_id}: {str(index_error)}")
+    
+    return [outcomes[image_id] for image_id in image_ids]
+
+# Analysis job queue
+ANALYSIS_QUEUE_NAME = "analysis-jobs"
+# Tries at setting a job's "running" status while other writers keep changing the row
+JOB_STATUS_ATTEMPTS = 5
+
+class StorageAnalysisQueue:
+    """Azure Storage queue drained by the process_analysis_job queue trigger"""
+    
+    def __init__(self):
+        # The trigger listens on the AzureWebJobsStorage account, so jobs must be sent there
+        connection_string = os.environ.get("AzureWebJobsStorage")
+        encode_policy = TextBase64EncodePolicy()  # the Functions host expects base64 messages
+        if connection_string:
+            self.queue_client = QueueClient.from_connection_string(
+                connection_string, ANALYSIS_QUEUE_NAME, message_encode_policy=encode_policy
             )
-            
-            results = []
-            count = 0
-            for entity in entities:
-                if count >= max_results:
-                    break
-                    
-                results.append({
-                    "imageId": entity["imageId"],
-                    "blobName": entity["blobName"],
-                    "status": entity["status"],
-                    "uploadTime": entity["uploadTime"],
-                    "analysisTime": entity["analysisTime"],
-                    "summary": {
-                        "objectCount": entity.get("objectCount", 0),
-                        "faceCount": entity.get("faceCount", 0),
-                        "hasText": entity.get("hasText", False),
-                        "primaryDescription": entity.get("primaryDescription", ""),
-                        "confidence": entity.get("confidence", 0.0)
-                    }
-                })
-                count += 1
-            
-            return results
-            
-        except Exception as e:
-            logging.error(f"Error querying by date range: {str(e)}")
-            return []
+        else:
+            # Identity-based AzureWebJobsStorage connection (for production)
+            self.queue_client = QueueClient(
+                account_url=os.environ["AzureWebJobsStorage__queueServiceUri"],
+                queue_name=ANALYSIS_QUEUE_NAME,
+                credential=clients.credential(),
+                message_encode_policy=encode_policy
+            )
+    
+    def send(self, job):
+        self.queue_client.send_message(json.dumps(job))
     
-    def update_status(self, image_id, status):
-        """Update the status of an analysis"""
+    def ensure_exists(self):
         try:
-            # First find the entity
-            result = self.get_analysis_result(image_id)
-            if not result:
-                return False
-            
-            # Update status
-            table_client = self.table_service.get_table_client(self.table_name)
-            
-            # Get the entity to update
-            filter_query = f"imageId eq '{image_id}'"
-            entities = table_client.query_entities(query_filter=filter_query)
-            
-            for entity in entities:
-                entity["status"] = status
-                table_client.update_entity(mode="replace", entity=entity)
-                logging.info(f"Updated status for image {image_id} to {status}")
-                return True
-            
-            return False
-            
-        except Exception as e:
-            logging.error(f"Error updating status: {str(e)}")
-            return False
+            self.queue_client.create_queue()
+        except ResourceExistsError:
+            pass
 
-@app.route(route="health", auth_level=func.AuthLevel.ANONYMOUS)
-def health(req: func.HttpRequest) -> func.HttpResponse:
+class InMemoryAnalysisQueue:
     """
-    Health check endpoint for the Image Recognition Service
-    Returns JSON with service status and timestamp
+    Local stand-in for the storage queue: jobs are handled by worker threads in this process
+    Used for offline development and throughput testing (ANALYSIS_QUEUE_BACKEND=memory)
     """
-    logging.info('Health check endpoint called')
+    
+    def __init__(self, handler, workers=4):
+        self.handler = handler
+        self.workers = workers
+        self._jobs = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+    
+    def _start_workers(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"analysis-worker-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+    
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                self.handler(job)
+            except Exception as e:
+                logging.error(f"In-memory analysis job failed: {str(e)}")
+            finally:
+                self._jobs.task_done()
+    
+    def send(self, job):
+        self._start_workers()
+        self._jobs.put(json.loads(json.dumps(job)))
+    
+    def ensure_exists(self):
+        pass
+    
+    def join(self):
+        """Block until every queued job has been handled"""
+        self._jobs.join()
+
+def _create_analysis_queue():
+    """Queue backend chosen by ANALYSIS_QUEUE_BACKEND ("storage" or "memory")"""
+    backend = os.environ.get("ANALYSIS_QUEUE_BACKEND", "storage").lower()
+    if backend == "memory":
+        return InMemoryAnalysisQueue(handle_analysis_job, workers=int(os.environ.get("ANALYSIS_QUEUE_WORKERS", "4")))
+    return StorageAnalysisQueue()
+
+def get_analysis_queue():
+    """Shared analysis job queue for this worker process"""
+    analysis_queue = clients.get("analysis_queue", _create_analysis_queue)
+    clients.ensure_once(("queue", ANALYSIS_QUEUE_NAME), analysis_queue.ensure_exists)
+    return analysis_queue
+
+def new_analysis_job(image_id, force, features, reuse_similar):
+    """A queue message for analyzing an image, with an id its status row records while it is the latest"""
+    return {"imageId": image_id, "jobId": uuid.uuid4().hex, "force": force, "features": sorted(features),
+            "reuse_similar": reuse_similar}
+
+def job_superseded(job, latest):
+    """
+    True if latest, a job queued after job, does everything job would: it computes at least
+    the same features, recomputes them if job forces it, and reuses near-duplicates only if job does
+    """
+    if not latest or not job.get("jobId") or latest["jobId"] == job["jobId"]:
+        return False
+    return (set(parse_features(latest["features"])) >= set(parse_features(job.get("features")))
+            and (latest["force"] or not job.get("force", False))
+            and (job.get("reuse_similar", False) or not latest["reuse_similar"]))
+
+def handle_analysis_job(job):
+    """
+    Run one queued analysis, moving its status from running to completed or failed
+    A job is skipped when a job queued after it, and recorded on the status row, covers its
+    request; other status changes (e.g. a synchronous analysis) do not stop it. The running
+    write is conditional on the row read for that check, and the later status writes on the
+    running write, so a status changed meanwhile by someone else is not overwritten
+    """
+    image_id = job["imageId"]
+    repository = ImageAnalysisRepository()
+    started = time.perf_counter()
+    status_etag = None
     
     try:
-        # Create health response
-        health_data = {
-            "status": "healthy",
-            "service": "Image Recognition Service",
-            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
-            "version": "1.0.0"
-        }
+        for _ in range(JOB_STATUS_ATTEMPTS):
+            latest, row_etag = repository.get_status_job(image_id)
+            if job_superseded(job, latest):
+                logging.info(f"Skipping analysis job {job.get('jobId')} for image {image_id}: job {latest['jobId']} covers it")
+                metrics.increment("analysis_jobs.superseded")
+                return
+            try:
+                status_etag = repository.update_status(image_id, STATUS_RUNNING, etag=row_etag)
+                break
+            except StatusConflictError:
+                continue
+        else:
+            raise RuntimeError(f"Status of image {image_id} kept changing; job not started")
         
-        return func.HttpResponse(
-            json.dumps(health_data),
-            status_code=200,
-            mimetype="application/json"
-        )
+        blob_entry = resolve_blob_entry(image_id)
+        if not blob_entry:
+            raise LookupError(f"Image with ID {image_id} not found")
         
-    except Exception as e:
-        logging.error(f"Health check failed: {str(e)}")
+        _, saved_to_storage, _, _ = run_analysis(
+            image_id, blob_entry, force=job.get("force", False), features=parse_features(job.get("features")),
+            reuse_similar=job.get("reuse_similar", False), status_etag=status_etag
+        )
+        if not saved_to_storage:
+            raise RuntimeError("Analysis results could not be saved")
         
-        error_response = {
-            "status": "unhealthy",
-            "service": "Image Recognition Service", 
-            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
-            "error": str(e)
-        }
+        metrics.increment("analysis_jobs.completed")
         
-        return func.HttpResponse(
-            json.dumps(error_response),
-            status_code=500,
-            mimetype="application/json"
-        )
+    except Exception as e:
+        logging.error(f"Analysis job for image {image_id} failed: {str(e)}")
+        try:
+            repository.update_status(image_id, STATUS_FAILED, error=str(e), etag=status_etag)
+        except StatusConflictError:
+            logging.info(f"Status of image {image_id} changed during the failed job; leaving it")
+        metrics.increment("analysis_jobs.failed")
+    
+    finally:
+        metrics.observe("analysis_jobs.duration", (time.perf_counter() - started) * 1000)
 
-@app.route(route="images/upload", auth_level=func.AuthLevel.ANONYMOUS, methods=["POST"])
-def upload_image(req: func.HttpRequest) -> func.HttpResponse:
+@app.queue_trigger(arg_name="msg", queue_name=ANALYSIS_QUEUE_NAME, connection="AzureWebJobsStorage")
+def process_analysis_job(msg: func.QueueMessage) -> None:
     """
-    Upload image endpoint
-    Accepts multipart/form-data with image file
-    Validates and stores in Azure Blob Storage
+    Queue-triggered worker for asynchronous analysis
+    Failures are recorded on the image status rather than retried
     """
-    logging.info('Image upload endpoint called')
+    logging.info('Analysis job received')
+    handle_analysis_job(json.loads(msg.get_body().decode("utf-8")))
+
+def send_analysis_job(repository, job, pending_etag, analysis_queue=None):
+    """
+    Queue a job whose pending status has been written; returns whether it was sent
+    If sending fails the status is set to failed, unless it changed since the pending write,
+    so pollers are not left waiting on a job that will never run
+    """
+    try:
+        (analysis_queue or get_analysis_queue()).send(job)
+        return True
+    except Exception as e:
+        logging.error(f"Error queuing analysis of image {job['imageId']}: {str(e)}")
+        metrics.increment("analysis_jobs.send_failures")
+        try:
+            repository.update_status(job["imageId"], STATUS_FAILED, f"Could not queue the analysis job: {str(e)}",
+                                     etag=pending_etag)
+        except StatusConflictError:
+            pass
+        return False
+
+def queue_batch_analysis(image_ids, force, features, reuse_similar):
+    """
+    Mark images pending with concurrent status updates, then queue a job for each
+    imageIds are resolved through the blob index first, as the synchronous path does, so
+    unknown ones get neither a status row nor a job
+    Returns ([{"imageId", "statusUrl"}] for the queued images, [{"imageId", "status", "error"}] for the others)
+    """
+    with ThreadPoolExecutor(max_workers=min(8, len(image_ids)), thread_name_prefix="batch-resolve") as executor:
+        known = {image_id for image_id, blob_entry in zip(image_ids, executor.map(resolve_blob_entry, image_ids)) if blob_entry}
+    failed = [{"imageId": image_id, "status": STATUS_FAILED, "error": f"Image with ID {image_id} not found"}
+              for image_id in image_ids if image_id not in known]
+    known = [image_id for image_id in image_ids if image_id in known]
+    if not known:
+        return [], failed
+    
+    # One job id for the batch: each image's status row records it, and its jobs differ only by imageId
+    job = new_analysis_job(None, force, features, reuse_similar)
+    repository = ImageAnalysisRepository()
+    status_etags = repository.update_statuses(known, STATUS_PENDING, job=job)
+    analysis_queue = get_analysis_queue()
+    
+    def send(image_id):
+        return image_id, send_analysis_job(repository, {**job, "imageId": image_id}, status_etags[image_id], analysis_queue)
+    
+    queued = [image_id for image_id in known if status_etags.get(image_id)]
+    failed.extend({"imageId": image_id, "status": STATUS_FAILED, "error": "Could not record the analysis job"}
+                  for image_id in known if not status_etags.get(image_id))
+    if not queued:
+        return [], failed
+    jobs = []
+    with ThreadPoolExecutor(max_workers=min(8, len(queued)), thread_name_prefix="batch-queue") as executor:
+        for image_id, sent in executor.map(send, queued):
+            if sent:
+                jobs.append({"imageId": image_id, "statusUrl": f"/api/images/{image_id}/status"})
+            else:
+                failed.append({"imageId": image_id, "status": STATUS_FAILED, "error": "Could not queue the analysis job"})
+    return jobs, failed
+
+@app.route(route="images/batch/analyze", auth_level=func.AuthLevel.ANONYMOUS, methods=["POST"])
+def analyze_images_batch(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Batch analysis endpoint
+    Body: {"imageIds": [...], "force": false, "concurrency": 8, "features": ["tags", "text"], "reuse_similar": false,
+           "async": false}
+    Analyzes already-uploaded images with bounded parallelism and returns per-image outcomes,
+    or with "async": true marks them all pending, queues one job each and returns 202
+    """
+    logging.info('Batch image analysis endpoint called')
     
     try:
-        # Check if request has files
-        if not hasattr(req, 'files') or not req.files:
-            return func.HttpResponse(
-                json.dumps({
-                    "success": False,
-                    "error": "No file provided. Please upload an image file.",
-                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        # Get the uploaded file
-        file_data = None
-        original_filename = None
-        
-        # Handle different ways files might be sent
-        for field_name in req.files:
-            file_data = req.files[field_name]
-            original_filename = getattr(file_data, 'filename', 'upload.jpg')
-            break
+        try:
+            body = req.get_json()
+        except ValueError:
+            body = None
         
-        if not file_data:
+        image_ids = body.get("imageIds") if isinstance(body, dict) else None
+        max_images = int(os.environ.get("BATCH_MAX_IMAGES", "1000"))
+        if not isinstance(image_ids, list) or not image_ids or not all(isinstance(i, str) and i for i in image_ids):
             return func.HttpResponse(
                 json.dumps({
                     "success": False,
-                    "error": "No valid file found in request",
+                    "error": "Request body must be JSON with a non-empty 'imageIds' list of strings",
                     "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
                 }),
                 status_code=400,
                 mimetype="application/json"
             )
         
-        # Read file content
-        file_content = file_data.read()
-        file_size = len(file_content)
-        
-        # Validate file size (4MB limit)
-        max_size = 4 * 1024 * 1024  # 4MB in bytes
-        if file_size > max_size:
+        # Duplicate IDs would only analyze the same image twice
+        image_ids = list(dict.fromkeys(image_ids))
+        if len(image_ids) > max_images:
             return func.HttpResponse(
                 json.dumps({
                     "success": False,
-                    "error": f"File too large. Maximum size is 4MB, got {file_size / (1024*1024):.2f}MB",
+                    "error": f"Too many images. Maximum per batch is {max_images}, got {len(image_ids)}",
                     "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
                 }),
                 status_code=400,
                 mimetype="application/json"
             )
         
-        # Validate file format using PIL
         try:
-            image = Image.open(io.BytesIO(file_content))
-            image_format = image.format.lower() if image.format else None
-            
-            # Check allowed formats
-            allowed_formats = ['jpeg', 'jpg', 'png']
-            if image_format not in allowed_formats:
-                return func.HttpResponse(
-                    json.dumps({
-                        "success": False,
-                        "error": f"Unsupported format '{image_format}'. Allowed: JPEG, PNG",
-                        "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
-                    }),
-                    status_code=400,
-                    mimetype="application/json"
-                )
-            
-            # Check image dimensions
-            width, height = image.size
-            max_dimension = 4000
-            if width > max_dimension or height > max_dimension:
-                return func.HttpResponse(
-                    json.dumps({
-                        "success": False,
-                        "error": f"Image too large. Max dimensions: {max_dimension}x{max_dimension}, got {width}x{height}",
-                        "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
-                    }),
-                    status_code=400,
-                    mimetype="application/json"
-                )
-            
-        except Exception as img_error:
+            features = parse_features(body.get("features"))
+            force = body_flag(body, "force")
+            reuse_similar = body_flag(body, "reuse_similar", NEAR_DUPLICATE_REUSE)
+            run_async = body_flag(body, "async")
+            concurrency = body.get("concurrency", os.environ.get("BATCH_CONCURRENCY", "8"))
+            if isinstance(concurrency, bool) or not isinstance(concurrency, (int, str)) or not str(concurrency).strip().isdigit():
+                raise ValueError(f"concurrency must be a whole number, got {json.dumps(concurrency)}")
+        except ValueError as e:
             return func.HttpResponse(
                 json.dumps({
                     "success": False,
-                    "error": f"Invalid image file: {str(img_error)}",
+                    "error": str(e),
                     "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
                 }),
                 status_code=400,
                 mimetype="application/json"
             )
         
-        # Generate unique filename
-        image_id = str(uuid.uuid4())
-        timestamp = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        file_extension = image_format if image_format == 'png' else 'jpg'
-        blob_name = f"{timestamp}_{image_id}.{file_extension}"
+        max_concurrency = int(os.environ.get("BATCH_MAX_CONCURRENCY", "32"))
+        concurrency = max(1, min(int(concurrency), max_concurrency))
         
-        # Upload to Azure Blob Storage
-        try:
-            blob_service_client = get_blob_service_client()
-            container_name = "images-upload"
-            
-            # Get blob client
-            blob_client = blob_service_client.get_blob_client(
-                container=container_name, 
-                blob=blob_name
-            )
-            
-            # Upload with metadata
-            metadata = {
-                "image_id": image_id,
-                "original_name": original_filename,
-                "upload_time": datetime.datetime.utcnow().isoformat() + "Z",
-                "file_size": str(file_size),
-                "dimensions": f"{width}x{height}",
-                "format": image_format
-            }
-            
-            # Reset file pointer and upload
-            blob_client.upload_blob(
-                file_content, 
-                overwrite=True, 
-                metadata=metadata,
-                content_type=f"image/{image_format}"
-            )
-            
-            # Generate blob URL
-            blob_url = blob_client.url
-            
-            logging.info(f"Successfully uploaded image: {blob_name}")
-            
-            # Return success response
-            response_data = {
-                "success": True,
-                "imageId": image_id,
-                "blobName": blob_name,
-                "uploadUrl": blob_url,
-                "message": "Image uploaded successfully",
-                "metadata": {
-                    "originalName": original_filename,
-                    "fileSize": file_size,
-                    "dimensions": f"{width}x{height}",
-                    "format": image_format,
-                    "uploadTime": datetime.datetime.utcnow().isoformat() + "Z"
-                }
-            }
-            
-            return func.HttpResponse(
-                json.dumps(response_data),
-                status_code=200,
-                mimetype="application/json"
-            )
-            
-        except Exception as storage_error:
-            logging.error(f"Blob storage error: {str(storage_error)}")
+        if run_async:
+            jobs, failed = queue_batch_analysis(image_ids, force, features, reuse_similar)
             return func.HttpResponse(
                 json.dumps({
-                    "success": False,
-                    "error": f"Storage error: {str(storage_error)}",
+                    "success": True,
+                    "message": f"Queued {len(jobs)} of {len(image_ids)} images for analysis",
+                    "total": len(image_ids),
+                    "queued": len(jobs),
+                    "failed": len(failed),
+                    "jobs": jobs,
+                    "failures": failed,
                     "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
                 }),
-                status_code=500,
+                status_code=202,
                 mimetype="application/json"
             )
-            
+        
+        started = time.perf_counter()
+        results = run_batch_analysis(
+            image_ids, force=force, concurrency=concurrency, features=features, reuse_similar=reuse_similar
+        )
+        elapsed = time.perf_counter() - started
+        
+        succeeded = sum(1 for result in results if result["status"] == STATUS_COMPLETED)
+        metrics.increment("batch.images", len(results))
+        metrics.observe("batch.duration", elapsed * 1000)
+        
+        return func.HttpResponse(
+            json.dumps({
+                "success": True,
+                "message": f"Analyzed {succeeded} of {len(results)} images",
+                "total": len(results),
+                "succeeded": succeeded,
+                "failed": len(results) - succeeded,
+                "concurrency": concurrency,
+                "elapsed_seconds": round(elapsed, 3),
+                "results": results
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+        
     except Exception as e:
-        logging.error(f"Upload function error: {str(e)}")
+        logging.error(f"Batch analysis function error: {str(e)}")
         return func.HttpResponse(
             json.dumps({
                 "success": False,
-                "error": f"Server error: {str(e)}",
+                "error": f"Batch analysis error: {str(e)}",
                 "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
             }),
             status_code=500,
             mimetype="application/json"
         )
 
-
 @app.route(route="images/{imageId}/analyze", auth_level=func.AuthLevel.ANONYMOUS, methods=["POST"])
 def analyze_image(req: func.HttpRequest) -> func.HttpResponse:
     """
     Analyze image endpoint
-    Takes an imageId and analyzes the corresponding blob
-    Returns comprehensive analysis results
+    Takes an imageId and analyzes the corresponding blob, limited to ?features= if given
+    ?reuse_similar=true takes coordinate-free features from a near-duplicate's analysis
+    Returns comprehensive analysis results, or 202 + status URL with ?async=true
     """
     logging.info('Image analysis endpoint called')
     
@@ -490,251 +4496,195 @@ def analyze_image(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
         
-        # Find the blob with this imageId        
-        blob_service_client = get_blob_service_client()
-        container_client = blob_service_client.get_container_client("images-upload")
-        
-        # Debug: Log all blobs and their metadata
-        logging.info(f"Looking for image_id: {image_id}")
-        blob_count = 0
-        target_blob = None
-        
-        for blob in container_client.list_blobs(include=['metadata']):
-            blob_count += 1
-            logging.info(f"Blob {blob_count}: {blob.name}")
-            if blob.metadata:
-                logging.info(f"  Metadata: {blob.metadata}")
-                if blob.metadata.get('image_id') == image_id:
-                    target_blob = blob
-                    logging.info(f"  ✅ MATCH FOUND!")
-                    break
-            else:
-                logging.info(f"  No metadata found")
+        force = req.params.get('force', '').lower() == 'true'
+        run_async = req.params.get('async', '').lower() == 'true'
+        reuse_similar = req.params.get('reuse_similar', str(NEAR_DUPLICATE_REUSE)).lower() == 'true'
+        try:
+            features = parse_features(req.params.get('features'))
+        except ValueError as e:
+            return func.HttpResponse(
+                json.dumps({
+                    "success": False,
+                    "error": str(e),
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=400,
+                mimetype="application/json"
+            )
         
-        logging.info(f"Total blobs found: {blob_count}")
+        # Resolve the blob for this imageId from the lookup index
+        blob_entry = resolve_blob_entry(image_id)
         
-        if not target_blob:
+        if not blob_entry:
             return func.HttpResponse(
                 json.dumps({
                     "success": False,
-                    "error": f"Image with ID {image_id} not found. Searched {blob_count} blobs.",
-                    "debug": f"Looking for image_id: {image_id}",
+                    "error": f"Image with ID {image_id} not found",
                     "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
                 }),
                 status_code=404,
                 mimetype="application/json"
             )
         
-        # Get blob URL for Computer Vision API
-        blob_client = blob_service_client.get_blob_client(
-            container="images-upload", 
-            blob=target_blob.name
-        )
-        blob_url = blob_client.url
-        
-        # Initialize Computer Vision client
-        cv_client = get_computer_vision_client()
-        
-        # Perform comprehensive analysis
-        logging.info(f"Analyzing image: {blob_url}")
-        
-        # Visual features to extract
-        visual_features = [
-            VisualFeatureTypes.categories,
-            VisualFeatureTypes.description,
-            VisualFeatureTypes.faces,
-            VisualFeatureTypes.objects,
-            VisualFeatureTypes.tags,
-            VisualFeatureTypes.adult,
-            VisualFeatureTypes.color,
-            VisualFeatureTypes.image_type
-        ]
-        
-        # Call Computer Vision API
-        analysis_result = cv_client.analyze_image(blob_url, visual_features=visual_features)
-        
-        # Extract objects
-        objects = []
-        if analysis_result.objects:
-            for obj in analysis_result.objects:
-                objects.append({
-                    "name": obj.object_property,
-                    "confidence": round(obj.confidence, 4),
-                    "rectangle": {
-                        "x": obj.rectangle.x,
-                        "y": obj.rectangle.y,
-                        "w": obj.rectangle.w,
-                        "h": obj.rectangle.h
-                    }
-                })
-        
-        # Extract faces
-        faces = []
-        if analysis_result.faces:
-            for face in analysis_result.faces:
-                faces.append({
-                    "age": face.age,
-                    "gender": face.gender.value if face.gender else None,
-                    "rectangle": {
-                        "left": face.face_rectangle.left,
-                        "top": face.face_rectangle.top,
-                        "width": face.face_rectangle.width,
-                        "height": face.face_rectangle.height
-                    }
-                })
-        
-        # Extract descriptions
-        descriptions = []
-        if analysis_result.description and analysis_result.description.captions:
-            for caption in analysis_result.description.captions:
-                descriptions.append({
-                    "text": caption.text,
-                    "confidence": round(caption.confidence, 4)
-                })
-        
-        # Extract tags
-        tags = []
-        if analysis_result.tags:
-            for tag in analysis_result.tags:
-                tags.append({
-                    "name": tag.name,
-                    "confidence": round(tag.confidence, 4)
-                })
+        if run_async:
+            # Record the job before enqueueing so the status URL works immediately
+            job = new_analysis_job(image_id, force, features, reuse_similar)
+            repository = ImageAnalysisRepository()
+            pending_etag = repository.update_status(image_id, STATUS_PENDING, job=job)
+            # A job queued without its status row could not be polled or told apart from newer ones
+            error = None if pending_etag else "Could not record the analysis job"
+            if pending_etag and not send_analysis_job(repository, job, pending_etag):
+                error = "Could not queue the analysis job"
+            if error:
+                return func.HttpResponse(
+                    json.dumps({
+                        "success": False,
+                        "error": f"{error}, retry later",
+                        "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                    }),
+                    status_code=503,
+                    mimetype="application/json",
+                    headers={"Retry-After": "1"}
+                )
+            
+            status_url = f"/api/images/{image_id}/status"
+            return func.HttpResponse(
+                json.dumps({
+                    "success": True,
+                    "message": "Image analysis queued",
+                    "imageId": image_id,
+                    "status": STATUS_PENDING,
+                    "statusUrl": status_url,
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=202,
+                mimetype="application/json",
+                headers={"Location": status_url}
+            )
         
-        # Extract categories
-        categories = []
-        if analysis_result.categories:
-            for category in analysis_result.categories:
-                categories.append({
-                    "name": category.name,
-                    "score": round(category.score, 4)
-                })
+        document, saved_to_storage, reused_from, computed = run_analysis(
+            image_id, blob_entry, force=force, features=features, reuse_similar=reuse_similar
+        )
         
-        # Perform OCR for text extraction
-        ocr_result = None
-        try:
-            read_operation = cv_client.read(blob_url, raw=True)
-            operation_id = read_operation.headers["Operation-Location"].split("/")[-1]
-            
-            # Wait for OCR to complete
-            max_attempts = 10
-            for attempt in range(max_attempts):
-                read_result = cv_client.get_read_result(operation_id)
-                if read_result.status == OperationStatusCodes.succeeded:
-                    break
-                elif read_result.status == OperationStatusCodes.failed:
-                    logging.warning("OCR operation failed")
-                    break
-                time.sleep(1)
-            
-            # Extract text if successful
-            if read_result.status == OperationStatusCodes.succeeded:
-                extracted_text = []
-                for page in read_result.analyze_result.read_results:
-                    for line in page.lines:
-                        extracted_text.append({
-                            "text": line.text,
-                            "bounding_box": line.bounding_box
-                        })
-                
-                ocr_result = {
-                    "text_detected": len(extracted_text) > 0,
-                    "total_lines": len(extracted_text),
-                    "extracted_text": extracted_text[:20]  # Limit to first 20 lines
-                }
+        # Return success response, with the document's members spliced in as serialized for storage
+        return func.HttpResponse(
+            splice_members({
+                "success": True,
+                "message": "Image analysis completed successfully",
+                "saved_to_storage": saved_to_storage,
+                "deduplicated": reused_from is not None,
+                "features_computed": sorted(computed)
+            }, document),
+            status_code=200,
+            mimetype="application/json"
+        )
         
-        except Exception as ocr_error:
-            logging.warning(f"OCR failed: {str(ocr_error)}")
-            ocr_result = {
-                "text_detected": False,
-                "error": str(ocr_error)
-            }
+    except ComputerVisionThrottledError as e:
+        logging.warning(f"Analysis throttled: {str(e)}")
+        retry_after = max(1, round(e.retry_after or CV_RETRY_MAX_SECONDS))
+        return func.HttpResponse(
+            json.dumps({
+                "success": False,
+                "error": f"Computer Vision is busy, retry later: {str(e)}",
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+            }),
+            status_code=503,
+            mimetype="application/json",
+            headers={"Retry-After": str(retry_after)}
+        )
         
-        # Compile comprehensive analysis results
-        analysis_data = {
-            "imageId": image_id,
-            "blobName": target_blob.name,
-            "analysis": {
-                "objects": objects,
-                "faces": faces,
-                "descriptions": descriptions,
-                "tags": tags,
-                "categories": categories,
-                "text": ocr_result,
-                "metadata": {
-                    "dominant_colors": list(analysis_result.color.dominant_colors) if analysis_result.color else [],
-                    "accent_color": analysis_result.color.accent_color if analysis_result.color else None,
-                    "is_bw_image": analysis_result.color.is_bw_img if analysis_result.color else False,
-                    "adult_content": {
-                        "is_adult": analysis_result.adult.is_adult_content if analysis_result.adult else False,
-                        "adult_score": round(analysis_result.adult.adult_score, 4) if analysis_result.adult else 0,
-                        "is_racy": analysis_result.adult.is_racy_content if analysis_result.adult else False,
-                        "racy_score": round(analysis_result.adult.racy_score, 4) if analysis_result.adult else 0
-                    }
-                }
-            },
-            "analysis_timestamp": datetime.datetime.utcnow().isoformat() + "Z"
-        }
+    except Exception as e:
+        logging.error(f"Analysis function error: {str(e)}")
+        return func.HttpResponse(
+            json.dumps({
+                "success": False,
+                "error": f"Analysis error: {str(e)}",
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+@app.route(route="images/{imageId}/status", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
+def get_analysis_status(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Get the analysis status of an image
+    Poll target for asynchronous analysis: pending, running, completed or failed
+    """
+    logging.info('Get analysis status endpoint called')
+    
+    try:
+        # Get imageId from route
+        image_id = req.route_params.get('imageId')
+        if not image_id:
+            return func.HttpResponse(
+                json.dumps({
+                    "success": False,
+                    "error": "Image ID is required in URL path",
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=400,
+                mimetype="application/json"
+            )
         
-        logging.info(f"Analysis completed for image {image_id}")
+        repository = ImageAnalysisRepository()
+        status = repository.get_status(image_id)
         
-        # 🔥 SAVE RESULTS TO TABLE STORAGE (FIXED LOCATION)
-        saved_to_storage = False
-        try:
-            repository = ImageAnalysisRepository()
-            file_metadata = {
-                "fileSize": target_blob.metadata.get("file_size", "0"),
-                "dimensions": target_blob.metadata.get("dimensions", ""),
-                "format": target_blob.metadata.get("format", "")
-            }
-            
-            saved = repository.save_analysis_result(
-                image_id=image_id,
-                blob_name=target_blob.name,
-                analysis_data=analysis_data,
-                upload_time=target_blob.metadata.get("upload_time", ""),
-                file_metadata=file_metadata
+        if not status:
+            return func.HttpResponse(
+                json.dumps({
+                    "success": False,
+                    "error": f"No analysis found for image ID {image_id}",
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=404,
+                mimetype="application/json"
             )
-            
-            if saved:
-                logging.info(f"✅ Analysis results saved to Table Storage for image {image_id}")
-                saved_to_storage = True
-            else:
-                logging.warning(f"❌ Failed to save analysis results for image {image_id}")
-                
-        except Exception as save_error:
-            logging.error(f"💥 Error saving to Table Storage: {str(save_error)}")
-            # Don't fail the request if saving fails
         
-        # Return success response
+        if status["status"] == STATUS_COMPLETED:
+            status["resultsUrl"] = f"/api/images/{image_id}/results"
+        
         return func.HttpResponse(
             json.dumps({
                 "success": True,
-                "message": "Image analysis completed successfully",
-                "saved_to_storage": saved_to_storage,
-                **analysis_data
+                **status
             }),
             status_code=200,
             mimetype="application/json"
         )
         
     except Exception as e:
-        logging.error(f"Analysis function error: {str(e)}")
+        logging.error(f"Get status function error: {str(e)}")
         return func.HttpResponse(
             json.dumps({
                 "success": False,
-                "error": f"Analysis error: {str(e)}",
+                "error": f"Status error: {str(e)}",
                 "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
             }),
             status_code=500,
             mimetype="application/json"
         )
 
+def _results_headers(etag):
+    # no-cache: browsers may keep the body but must revalidate it with If-None-Match before reuse
+    headers = {"Cache-Control": "no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+def _results_response(body, etag):
+    return func.HttpResponse(body, status_code=200, mimetype="application/json", headers=_results_headers(etag))
+
+def _not_modified(etag):
+    metrics.increment("results_cache.not_modified")
+    return func.HttpResponse(status_code=304, headers=_results_headers(etag))
+
 @app.route(route="images/{imageId}/results", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
 def get_analysis_results(req: func.HttpRequest) -> func.HttpResponse:
     """
     Get stored analysis results by image ID
-    Returns cached results from Table Storage
+    Returns cached results from Table Storage; responses carry an ETag and If-None-Match gets a 304
+    Serialized bodies are kept in results_cache until the result or its status changes, or the TTL runs out
     """
     logging.info('Get analysis results endpoint called')
     
@@ -752,9 +4702,24 @@ def get_analysis_results(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
         
-        # Get results from Table Storage
+        if_none_match = req.headers.get("If-None-Match")
+        cached = results_cache.get(image_id)
+        if cached is not None:
+            etag, body = cached
+            if etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+            return _results_response(body, etag)
+        
+        # Revalidation needs only the lookup row's ETag, not the stored document
         repository = ImageAnalysisRepository()
-        result = repository.get_analysis_result(image_id)
+        if if_none_match:
+            row_etag = repository.get_result_etag(image_id)
+            if row_etag and etag_matches(if_none_match, result_etag(row_etag)):
+                return _not_modified(result_etag(row_etag))
+        
+        # Get results from Table Storage
+        generation = results_cache.generation
+        result, row_etag = repository.get_analysis_result_with_etag(image_id, raw=True)
         
         if not result:
             return func.HttpResponse(
@@ -767,34 +4732,148 @@ def get_analysis_results(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
         
+        # analysisResults is spliced in as stored, without a parse and re-encode
+        body = dumps_json({
+            "success": True,
+            "message": "Analysis results retrieved successfully",
+            "cached": True,
+            **result
+        })
+        etag = result_etag(row_etag) if row_etag else None
+        if etag:
+            results_cache.put(image_id, etag, body, generation)
+        return _results_response(body, etag)
+        
+    except Exception as e:
+        logging.error(f"Get results function error: {str(e)}")
+        return func.HttpResponse(
+            json.dumps({
+                "success": False,
+                "error": f"Retrieval error: {str(e)}",
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+@app.route(route="images/{imageId}/similar", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
+def find_similar_images(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Find uploaded images that look like this one (resized, re-encoded or lightly edited copies)
+    Query parameters: max_distance (bits of perceptual hash that may differ, 0-7), max_results
+    """
+    logging.info('Find similar images endpoint called')
+    
+    try:
+        image_id = req.route_params.get('imageId')
+        if not image_id:
+            return _bad_request("Image ID is required in URL path")
+        max_distance = int(req.params.get('max_distance', str(NEAR_DUPLICATE_MAX_DISTANCE)))
+        max_results = max(1, min(int(req.params.get('max_results', '20')), 100))
+        
+        blob_entry = ImageIndexRepository().get_blob_entry(image_id)
+        if not blob_entry or not blob_entry.get("perceptualHash"):
+            return func.HttpResponse(
+                json.dumps({
+                    "success": False,
+                    "error": f"No perceptual hash found for image ID {image_id}",
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                }),
+                status_code=404,
+                mimetype="application/json"
+            )
+        
+        try:
+            similar = ImageHashIndexRepository().find_similar(
+                blob_entry["perceptualHash"], max_distance, exclude=image_id, max_results=max_results
+            )
+        except ValueError as e:
+            return _bad_request(str(e))
+        
         return func.HttpResponse(
             json.dumps({
                 "success": True,
-                "message": "Analysis results retrieved successfully",
-                "cached": True,
-                **result
+                "message": f"Found {len(similar)} similar images",
+                "imageId": image_id,
+                "perceptualHash": blob_entry["perceptualHash"],
+                "max_distance": max_distance,
+                "total_found": len(similar),
+                "results": similar
             }),
             status_code=200,
             mimetype="application/json"
         )
         
     except Exception as e:
-        logging.error(f"Get results function error: {str(e)}")
+        logging.error(f"Similar images function error: {str(e)}")
         return func.HttpResponse(
             json.dumps({
                 "success": False,
-                "error": f"Retrieval error: {str(e)}",
+                "error": f"Similarity search error: {str(e)}",
                 "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
             }),
             status_code=500,
             mimetype="application/json"
         )
 
+SEARCH_MAX_PAGES = int(os.environ.get("SEARCH_MAX_PAGES", "10"))
+
+def _bad_request(message):
+    return func.HttpResponse(
+        json.dumps({
+            "success": False,
+            "error": message,
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+        }),
+        status_code=400,
+        mimetype="application/json"
+    )
+
+def search_by_terms(tags, objects, days_back, max_results, cursor):
+    """Tag/object mode of the search endpoint, answered from the term index"""
+    since = None
+    if days_back is not None:
+        since = (datetime.datetime.utcnow() - datetime.timedelta(days=days_back)).strftime("%Y-%m-%d")
+    keys = [TermIndexRepository.key("tag", tag) for tag in tags] + [TermIndexRepository.key("object", name) for name in objects]
+    
+    repository = TermIndexRepository()
+    try:
+        results, next_cursor = repository.search(keys, since, max_results, cursor=cursor)
+    except ValueError as e:
+        return _bad_request(str(e))
+    
+    if cursor:
+        # Later pages continue the query the cursor was issued for
+        query, _ = repository.decode_cursor(cursor)
+        keys, since = query["terms"], query["since"]
+    
+    return func.HttpResponse(
+        json.dumps({
+            "success": True,
+            "message": f"Found {len(results)} results",
+            "query": {
+                "tags": sorted(key.split(":", 1)[1] for key in keys if key.startswith("tag:")),
+                "objects": sorted(key.split(":", 1)[1] for key in keys if key.startswith("object:")),
+                "analyzed_since": since,
+                "max_results": max_results
+            },
+            "total_found": len(results),
+            "results": results,
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
+        }),
+        status_code=200,
+        mimetype="application/json"
+    )
+
 @app.route(route="results/search", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
 def search_results(req: func.HttpRequest) -> func.HttpResponse:
     """
     Search analysis results with filters
-    Query parameters: days_back, max_results, has_faces, has_objects, has_text
+    Query parameters: days_back, max_results, has_faces, has_objects, has_text, cursor
+    Filters are applied by Table Storage; pass next_cursor back as cursor for the next page
+    With tag and/or object (comma-separated names) the search is answered from the term index
+    instead, returning images that carry every one of them
     """
     logging.info('Search results endpoint called')
     
@@ -805,52 +4884,69 @@ def search_results(req: func.HttpRequest) -> func.HttpResponse:
         has_faces = req.params.get('has_faces', '').lower() == 'true'
         has_objects = req.params.get('has_objects', '').lower() == 'true'
         has_text = req.params.get('has_text', '').lower() == 'true'
+        cursor = req.params.get('cursor') or None
+        tags = [tag for tag in req.params.get('tag', '').split(',') if TermIndexRepository.normalize(tag)]
+        objects = [name for name in req.params.get('object', '').split(',') if TermIndexRepository.normalize(name)]
         
         # Limit max_results for performance
-        max_results = min(max_results, 100)
+        max_results = max(1, min(max_results, 100))
+        
+        # Tag/object queries, and later pages of them, are answered from the term index
+        term_search = bool(tags or objects)
+        if not term_search and cursor:
+            try:
+                TermIndexRepository.decode_cursor(cursor)
+                term_search = True
+            except ValueError:
+                pass
+        if term_search:
+            if has_faces or has_objects or has_text:
+                return _bad_request("has_faces, has_objects and has_text cannot be combined with tag or object")
+            # The index holds every analysis, so the date range only applies when asked for
+            return search_by_terms(tags, objects, days_back if 'days_back' in req.params else None, max_results, cursor)
         
         # Calculate date range
         end_date = datetime.datetime.utcnow()
         start_date = end_date - datetime.timedelta(days=days_back)
+        filters = [name for name, enabled in (("has_faces", has_faces), ("has_objects", has_objects), ("has_text", has_text)) if enabled]
         
-        # Get results from Table Storage
+        # Get matching results from Table Storage
         repository = ImageAnalysisRepository()
-        results = repository.get_results_by_date_range(start_date, end_date, max_results)
+        try:
+            results, next_cursor = repository.search_results(
+                start_date, end_date, filters, max_results, cursor=cursor, max_pages=SEARCH_MAX_PAGES
+            )
+        except ValueError as e:
+            return _bad_request(str(e))
         
-        # Apply filters
-        filtered_results = []
-        for result in results:
-            summary = result.get("summary", {})
-            
-            # Apply filters
-            if has_faces and summary.get("faceCount", 0) == 0:
-                continue
-            if has_objects and summary.get("objectCount", 0) == 0:
-                continue
-            if has_text and not summary.get("hasText", False):
-                continue
-            
-            filtered_results.append(result)
+        if cursor:
+            # Later pages continue the query the cursor was issued for
+            query, _ = repository.decode_cursor(cursor)
+            filters = query["filters"]
+            start_date = datetime.datetime.strptime(query["start"], "%Y-%m-%d")
+            end_date = datetime.datetime.strptime(query["end"], "%Y-%m-%d")
         
         return func.HttpResponse(
             json.dumps({
                 "success": True,
-                "message": f"Found {len(filtered_results)} results",
+                "message": f"Found {len(results)} results",
                 "query": {
                     "days_back": days_back,
                     "max_results": max_results,
                     "filters": {
-                        "has_faces": has_faces,
-                        "has_objects": has_objects,
-                        "has_text": has_text
+                        "has_faces": "has_faces" in filters,
+                        "has_objects": "has_objects" in filters,
+                        "has_text": "has_text" in filters
                     },
                     "date_range": {
                         "start": start_date.isoformat() + "Z",
                         "end": end_date.isoformat() + "Z"
                     }
                 },
-                "total_found": len(filtered_results),
-                "results": filtered_results
+                "total_found": len(results),
+                "results": results,
+                "has_more": next_cursor is not None,
+                "next_cursor": next_cursor
             }),
             status_code=200,
             mimetype="application/json"
@@ -868,37 +4964,169 @@ def search_results(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
+@app.route(route="results/text-search", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
+def search_text(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Full-text search over the OCR text of each image's latest analysis
+    Query parameters: q (required), days_back, max_results, cursor
+    Images must contain every word of q; phrase matches rank first. Each result lists the
+    matching lines with their bounding boxes
+    """
+    logging.info('Text search endpoint called')
+    
+    try:
+        text = req.params.get('q', '')
+        max_results = max(1, min(int(req.params.get('max_results', '20')), 100))
+        cursor = req.params.get('cursor') or None
+        since = None
+        if 'days_back' in req.params:
+            since = (datetime.datetime.utcnow() - datetime.timedelta(days=int(req.params['days_back']))).strftime("%Y-%m-%d")
+        
+        repository = TextIndexRepository()
+        try:
+            results, next_cursor, truncated = repository.search(text, since, max_results, cursor=cursor)
+        except ValueError as e:
+            return _bad_request(str(e))
+        
+        if cursor:
+            # Later pages continue the query the cursor was issued for
+            query, _ = repository.decode_cursor(cursor)
+            text, since = query["q"], query["since"]
+        
+        return func.HttpResponse(
+            json.dumps({
+                "success": True,
+                "message": f"Found {len(results)} results",
+                "query": {
+                    "q": text,
+                    "words": repository.tokenize(text),
+                    "analyzed_since": since,
+                    "max_results": max_results
+                },
+                "total_found": len(results),
+                "results": results,
+                "candidates_truncated": truncated,
+                "has_more": next_cursor is not None,
+                "next_cursor": next_cursor
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+        
+    except Exception as e:
+        logging.error(f"Text search function error: {str(e)}")
+        return func.HttpResponse(
+            json.dumps({
+                "success": False,
+                "error": f"Search error: {str(e)}",
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+@app.route(route="results/color-search", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
+def search_colors(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Find images with a similar palette to an analyzed image (imageId) or to given colours
+    Query parameters: imageId, or colors (comma-separated names) and/or accent (hex RGB) and bw;
+    max_results
+    """
+    logging.info('Color search endpoint called')
+    
+    try:
+        image_id = req.params.get('imageId') or None
+        max_results = max(1, min(int(req.params.get('max_results', '20')), 100))
+        
+        index = get_color_index()
+        index.ensure_fresh()
+        if image_id:
+            vector = index.vector_of(image_id)
+            if vector is None:
+                return func.HttpResponse(
+                    json.dumps({
+                        "success": False,
+                        "error": f"No color analysis found for image ID {image_id}",
+                        "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+                    }),
+                    status_code=404,
+                    mimetype="application/json"
+                )
+        else:
+            try:
+                colors = ColorFeatureIndex.parse_query(
+                    req.params.get('colors', ''), req.params.get('accent', ''),
+                    req.params.get('bw', '').lower() == 'true'
+                )
+            except ValueError as e:
+                return _bad_request(str(e))
+            vector = ColorFeatureIndex.vector(colors)
+        
+        started = time.perf_counter()
+        results = index.nearest(vector, max_results, exclude=image_id)
+        metrics.observe("color_index.query", (time.perf_counter() - started) * 1000)
+        
+        return func.HttpResponse(
+            json.dumps({
+                "success": True,
+                "message": f"Found {len(results)} results",
+                "query": {"imageId": image_id, **ColorFeatureIndex.decode(vector), "max_results": max_results},
+                "indexed_images": len(index),
+                "total_found": len(results),
+                "results": results
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+        
+    except Exception as e:
+        logging.error(f"Color search function error: {str(e)}")
+        return func.HttpResponse(
+            json.dumps({
+                "success": False,
+                "error": f"Search error: {str(e)}",
+                "timestamp": datetime.datetime.utcnow().isoformat() + "Z"
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+STATS_MAX_DAYS_BACK = int(os.environ.get("STATS_MAX_DAYS_BACK", "366"))
+
 @app.route(route="results/stats", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
 def get_analysis_stats(req: func.HttpRequest) -> func.HttpResponse:
     """
     Get analysis statistics and summary
+    Totals come from the per-day rollups kept up to date on every save
     """
     logging.info('Get stats endpoint called')
     
     try:
         days_back = int(req.params.get('days_back', '7'))
+        days_back = max(0, min(days_back, STATS_MAX_DAYS_BACK))
         
         # Calculate date range
         end_date = datetime.datetime.utcnow()
         start_date = end_date - datetime.timedelta(days=days_back)
         
-        # Get results
-        repository = ImageAnalysisRepository()
-        results = repository.get_results_by_date_range(start_date, end_date, 1000)
+        # One rollup row per day, instead of scanning the analyses themselves
+        repository = AnalysisStatsRepository()
+        totals = Counter()
+        for day_totals in repository.get_days(days_between(start_date, end_date)).values():
+            totals.update(day_totals)
         
         # Calculate statistics
-        total_images = len(results)
-        images_with_faces = sum(1 for r in results if r.get("summary", {}).get("faceCount", 0) > 0)
-        images_with_objects = sum(1 for r in results if r.get("summary", {}).get("objectCount", 0) > 0)
-        images_with_text = sum(1 for r in results if r.get("summary", {}).get("hasText", False))
+        total_images = totals["images"]
+        images_with_faces = totals["imagesWithFaces"]
+        images_with_objects = totals["imagesWithObjects"]
+        images_with_text = totals["imagesWithText"]
         
         # Average confidence
-        confidences = [r.get("summary", {}).get("confidence", 0) for r in results if r.get("summary", {}).get("confidence", 0) > 0]
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+        avg_confidence = totals["confidenceSum"] / totals["confidenceCount"] if totals["confidenceCount"] else 0
         
         # Total objects and faces
-        total_objects = sum(r.get("summary", {}).get("objectCount", 0) for r in results)
-        total_faces = sum(r.get("summary", {}).get("faceCount", 0) for r in results)
+        total_objects = totals["totalObjects"]
+        total_faces = totals["totalFaces"]
         
         stats = {
             "success": True,
@@ -939,4 +5167,40 @@ def get_analysis_stats(req: func.HttpRequest) -> func.HttpResponse:
             }),
             status_code=500,
             mimetype="application/json"
-        )
\ No newline at end of file
+        )
+
+# Optional warm-up: a new worker loads the lazy imports and builds the pooled clients in the
+# background, so the first analyze or results request does not pay for them
+WARMUP_ON_START = env_flag("WARMUP_ON_START")
+
+def warm_up():
+    """
+    Import the lazily loaded SDKs and build the pooled clients, tables and containers
+    Returns milliseconds per step; a failed step is logged and the rest still run
+    """
+    steps = [
+        ("imports", lambda: [lazy.resolve() for lazy in LazyImport.instances]),
+        ("table", get_table_service_client),
+        ("blob", get_blob_service_client),
+        ("repositories", lambda: (ImageAnalysisRepository().documents, ImageHashIndexRepository())),
+        ("analysis_queue", get_analysis_queue),
+        ("cv_rate_limiter", get_cv_rate_limiter),
+    ]
+    if os.environ.get("COMPUTER_VISION_ENDPOINT"):
+        steps.append(("computer_vision", get_computer_vision_client))
+    
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logging.warning(f"Warm-up step {name} failed: {str(e)}")
+            continue
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+        metrics.observe(f"warmup.{name}", timings[name])
+    logging.info(f"Warm-up complete: {timings}")
+    return timings
+
+if WARMUP_ON_START:
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
@@ -0,0 +1,114 @@
+"""
+Maintenance commands for the Image Recognition Service
+Run from the backend folder with the same app settings as the function app, e.g.
+
+    python manage.py backfill-blob-index
+"""
+import argparse
+import json
+import logging
+
+from function_app import (
+    UPLOAD_CONTAINER,
+    ImageAnalysisRepository,
+    ImageHashIndexRepository,
+    ImageIndexRepository,
+    get_blob_service_client,
+)
+
+
+def backfill_blob_index(args):
+    """Write imageId -> blob lookup rows for blobs uploaded before the index existed"""
+    container_client = get_blob_service_client().get_container_client(UPLOAD_CONTAINER)
+    return ImageIndexRepository().backfill_blob_index(container_client)
+
+
+def backfill_latest_analysis(args):
+    """Write imageId-keyed "latest" lookup rows for analyses saved before the index existed"""
+    repository = ImageAnalysisRepository()
+    results_table = repository.table_service.get_table_client(repository.table_name)
+    return repository.index.backfill_latest_analysis(results_table)
+
+
+def offload_analysis_documents(args):
+    """Move analysis documents stored inline in Table entities into compressed blobs"""
+    return ImageAnalysisRepository().offload_inline_documents()
+
+
+def rebuild_stats(args):
+    """Recompute the per-day stats rollups from the analysis history table"""
+    repository = ImageAnalysisRepository()
+    results_table = repository.table_service.get_table_client(repository.table_name)
+    return repository.stats.rebuild(results_table)
+
+
+def reshard_results(args):
+    """Move analysis history rows into the partitions of the current RESULTS_PARTITION_SHARDS scheme"""
+    return ImageAnalysisRepository().reshard_results()
+
+
+def rebuild_term_index(args):
+    """Rebuild the tag and object search index from the latest analysis of every image"""
+    return ImageAnalysisRepository().rebuild_term_index()
+
+
+def rebuild_text_index(args):
+    """Rebuild the OCR full-text search index from the latest analysis of every image"""
+    return ImageAnalysisRepository().rebuild_text_index()
+
+
+def backfill_perceptual_hashes(args):
+    """Hash images uploaded without a perceptual hash and (re)index every hash for similarity search"""
+    container_client = get_blob_service_client().get_container_client(UPLOAD_CONTAINER)
+    return ImageHashIndexRepository().backfill(container_client, ImageIndexRepository())
+
+
+def backfill_color_features(args):
+    """Add the colorFeatures column used by /results/color-search to analyses saved before it existed"""
+    return ImageAnalysisRepository().backfill_color_features()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Image Recognition Service maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill-blob-index", help=backfill_blob_index.__doc__)
+    backfill.set_defaults(handler=backfill_blob_index)
+
+    latest = commands.add_parser("backfill-latest-analysis", help=backfill_latest_analysis.__doc__)
+    latest.set_defaults(handler=backfill_latest_analysis)
+
+    offload = commands.add_parser("offload-analysis-documents", help=offload_analysis_documents.__doc__)
+    offload.set_defaults(handler=offload_analysis_documents)
+
+    stats = commands.add_parser("rebuild-stats", help=rebuild_stats.__doc__)
+    stats.set_defaults(handler=rebuild_stats)
+
+    reshard = commands.add_parser("reshard-results", help=reshard_results.__doc__)
+    reshard.set_defaults(handler=reshard_results)
+
+    terms = commands.add_parser("rebuild-term-index", help=rebuild_term_index.__doc__)
+    terms.set_defaults(handler=rebuild_term_index)
+
+    text = commands.add_parser("rebuild-text-index", help=rebuild_text_index.__doc__)
+    text.set_defaults(handler=rebuild_text_index)
+
+    hashes = commands.add_parser("backfill-perceptual-hashes", help=backfill_perceptual_hashes.__doc__)
+    hashes.set_defaults(handler=backfill_perceptual_hashes)
+
+    colors = commands.add_parser("backfill-color-features", help=backfill_color_features.__doc__)
+    colors.set_defaults(handler=backfill_color_features)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    result = args.handler(args)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Shared fixtures: every test runs against fresh in-memory services from benchmarks.fakes
+
+    cd backend && python -m pytest tests
+"""
+import json
+
+import azure.functions as func
+import pytest
+
+import function_app
+from benchmarks.fakes import (
+    FakeBlobServiceClient, FakeComputerVisionClient, FakeTableServiceClient, Latency, UnlimitedRateLimiter
+)
+
+
+class RecordingQueue:
+    """Analysis queue that keeps sent jobs until the test delivers them"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def ensure_exists(self):
+        pass
+
+    def send(self, job):
+        self.jobs.append(json.loads(json.dumps(job)))
+
+    def deliver(self, **kwargs):
+        while self.jobs:
+            function_app.handle_analysis_job(self.jobs.pop(0), **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def services():
+    function_app.clients.reset()
+    function_app.clients.set("blob", FakeBlobServiceClient(Latency()))
+    function_app.clients.set("table", FakeTableServiceClient(Latency()))
+    function_app.clients.set("computer_vision", FakeComputerVisionClient(analyze_ms=0, ocr_ms=0))
+    function_app.clients.set("cv_rate_limiter", UnlimitedRateLimiter())
+    function_app.clients.set("analysis_queue", RecordingQueue())
+    function_app.results_cache.clear()
+    function_app.metrics.reset()
+    yield
+    function_app.clients.reset()
+
+
+@pytest.fixture
+def analysis_queue():
+    return function_app.get_analysis_queue()
+
+
+@pytest.fixture
+def repository():
+    return function_app.ImageAnalysisRepository()
+
+
+@pytest.fixture
+def seed_image():
+    """Index an uploaded image without blob bytes (Computer Vision gets its URL); returns its imageId"""
+    def seed(image_id):
+        function_app.ImageIndexRepository().save_blob_entry(image_id, f"{image_id}.jpg", {
+            "upload_time": "2026-10-16T00:00:00Z", "file_size": "1024", "dimensions": "640x480", "format": "jpeg"
+        })
+        return image_id
+    return seed
+
+
+@pytest.fixture
+def call():
+    """Invoke a route function; returns (status code, parsed JSON body or None, response)"""
+    def invoke(route, method="GET", url="/api", route_params=None, params=None, body=b"", headers=None):
+        response = route.build().get_user_function()(func.HttpRequest(
+            method, url, body=body, route_params=route_params or {}, params=params or {}, headers=headers or {}))
+        data = response.get_body()
+        return response.status_code, json.loads(data) if data else None, response
+    return invoke
@@ -0,0 +1,248 @@
+import function_app
+from function_app import STATUS_COMPLETED, STATUS_FAILED, STATUS_PENDING, analyze_image, analyze_images_batch
+
+
+def analyze(call, image_id, **params):
+    return call(analyze_image, "POST", f"/api/images/{image_id}/analyze", {"imageId": image_id}, params)
+
+
+def stored_features(repository, image_id):
+    return repository.get_analysis_result(image_id)["analysisResults"]["features"]
+
+
+def test_async_job_completes_and_stores_features(call, seed_image, repository, analysis_queue):
+    image_id = seed_image("img-async")
+    status, body, _ = analyze(call, image_id, features="tags", **{"async": "true"})
+    assert status == 202
+    assert repository.get_status(image_id)["status"] == STATUS_PENDING
+
+    analysis_queue.deliver()
+    assert repository.get_status(image_id)["status"] == STATUS_COMPLETED
+    assert stored_features(repository, image_id) == ["tags"]
+
+
+def test_async_job_for_stored_features_completes(call, seed_image, repository, analysis_queue):
+    image_id = seed_image("img-noop")
+    assert analyze(call, image_id, features="tags")[0] == 200
+    assert analyze(call, image_id, features="tags", **{"async": "true"})[0] == 202
+
+    analysis_queue.deliver()
+    assert repository.get_status(image_id)["status"] == STATUS_COMPLETED
+    assert function_app.get_computer_vision_client().calls["analyze_image"] == 1
+
+
+def test_sync_request_for_stored_features_clears_stale_status(call, seed_image, repository):
+    image_id = seed_image("img-stale")
+    assert analyze(call, image_id, features="tags")[0] == 200
+    repository.update_status(image_id, STATUS_FAILED, error="earlier job failed")
+
+    status, body, _ = analyze(call, image_id, features="tags")
+    assert status == 200 and body["features_computed"] == []
+    assert repository.get_status(image_id)["status"] == STATUS_COMPLETED
+
+
+def test_batch_request_for_stored_features_clears_stale_status(call, seed_image, repository):
+    image_id = seed_image("img-batch")
+    assert analyze(call, image_id, features="tags")[0] == 200
+    repository.update_status(image_id, STATUS_PENDING)
+
+    status, body, _ = call(analyze_images_batch, "POST", "/api/images/batch/analyze",
+                           body=b'{"imageIds": ["img-batch"], "features": ["tags"]}')
+    assert status == 200
+    assert repository.get_status(image_id)["status"] == STATUS_COMPLETED
+
+
+def test_failed_job_records_failure(repository, analysis_queue):
+    job = function_app.new_analysis_job("img-unknown", False, {"tags"}, False)
+    repository.update_status("img-unknown", STATUS_PENDING, job=job)
+    analysis_queue.send(job)
+
+    analysis_queue.deliver()
+    status = repository.get_status("img-unknown")
+    assert status["status"] == STATUS_FAILED and "not found" in status["error"]
+
+
+def counters():
+    return function_app.metrics.snapshot()["counters"]
+
+
+def test_job_survives_unrelated_sync_analysis(call, seed_image, repository, analysis_queue):
+    image_id = seed_image("img-mixed")
+    assert analyze(call, image_id, features="text", **{"async": "true"})[0] == 202
+    assert analyze(call, image_id, features="tags")[0] == 200
+
+    analysis_queue.deliver()
+    assert counters().get("analysis_jobs.superseded", 0) == 0
+    assert repository.get_status(image_id)["status"] == STATUS_COMPLETED
+    assert stored_features(repository, image_id) == ["tags", "text"]
+
+
+def test_job_covered_by_newer_job_is_skipped(call, seed_image, repository, analysis_queue):
+    image_id = seed_image("img-twice")
+    assert analyze(call, image_id, features="tags", **{"async": "true"})[0] == 202
+    assert analyze(call, image_id, features="tags,text", **{"async": "true"})[0] == 202
+
+    analysis_queue.deliver()
+    assert counters()["analysis_jobs.superseded"] == 1
+    assert counters()["analysis_jobs.completed"] == 1
+    assert repository.get_status(image_id)["status"] == STATUS_COMPLETED
+    assert stored_features(repository, image_id) == ["tags", "text"]
+
+
+def test_job_not_covered_by_newer_job_still_runs(call, seed_image, repository, analysis_queue):
+    image_id = seed_image("img-narrower")
+    assert analyze(call, image_id, features="text", **{"async": "true"})[0] == 202
+    assert analyze(call, image_id, features="tags", **{"async": "true"})[0] == 202
+
+    analysis_queue.deliver()
+    assert counters().get("analysis_jobs.superseded", 0) == 0
+    assert stored_features(repository, image_id) == ["tags", "text"]
+
+
+def test_forced_job_is_not_covered_by_unforced_one():
+    job = {"jobId": "a", "features": ["tags"], "force": True, "reuse_similar": False}
+    assert not function_app.job_superseded(job, {**job, "jobId": "b", "force": False})
+    assert function_app.job_superseded(job, {**job, "jobId": "b", "features": ["tags", "text"]})
+    assert not function_app.job_superseded(job, {**job, "jobId": "b", "reuse_similar": True})
+    assert not function_app.job_superseded(job, job)
+    assert not function_app.job_superseded(job, None)
+    # A job without a jobId cannot be matched against the status row, so it always runs
+    assert not function_app.job_superseded({key: value for key, value in job.items() if key != "jobId"}, job)
+
+
+def test_redelivered_job_runs_again(call, seed_image, repository, analysis_queue):
+    image_id = seed_image("img-redelivered")
+    assert analyze(call, image_id, features="tags", **{"async": "true"})[0] == 202
+    job = analysis_queue.jobs[0]
+    repository.update_status(image_id, function_app.STATUS_RUNNING)
+
+    analysis_queue.deliver()
+    function_app.handle_analysis_job(job)
+    assert counters().get("analysis_jobs.superseded", 0) == 0
+    assert counters()["analysis_jobs.completed"] == 2
+    assert repository.get_status(image_id)["status"] == STATUS_COMPLETED
+
+
+def test_batch_async_queues_one_job_per_image(call, seed_image, repository, analysis_queue):
+    image_ids = [seed_image(f"img-b{index}") for index in range(3)]
+    status, body, _ = call(analyze_images_batch, "POST", "/api/images/batch/analyze",
+                           body=b'{"imageIds": ["img-b0", "img-b1", "img-b2"], "features": ["tags"], "async": true}')
+    assert status == 202 and body["queued"] == 3
+    assert len({job["jobId"] for job in analysis_queue.jobs}) == 1
+    assert all(repository.get_status(image_id)["status"] == STATUS_PENDING for image_id in image_ids)
+
+    analysis_queue.deliver()
+    assert all(repository.get_status(image_id)["status"] == STATUS_COMPLETED for image_id in image_ids)
+
+
+def test_bulk_status_update_skips_conflicting_images(repository):
+    etags = repository.update_statuses(["img-a", "img-b"], STATUS_PENDING)
+    repository.update_status("img-b", function_app.STATUS_RUNNING)
+
+    updated = repository.update_statuses(["img-a", "img-b", "img-a"], STATUS_COMPLETED, etags=etags)
+    assert updated["img-a"] and updated["img-b"] is None
+    assert repository.get_status("img-a")["status"] == STATUS_COMPLETED
+    assert repository.get_status("img-b")["status"] == function_app.STATUS_RUNNING
+
+
+def test_async_request_is_not_queued_when_its_status_cannot_be_recorded(call, seed_image, analysis_queue, monkeypatch):
+    image_id = seed_image("img-unrecorded")
+    monkeypatch.setattr(function_app.ImageAnalysisRepository, "update_status", lambda self, *args, **kwargs: None)
+
+    status, body, response = analyze(call, image_id, features="tags", **{"async": "true"})
+    assert status == 503 and not body["success"]
+    assert response.headers.get("Retry-After")
+    assert analysis_queue.jobs == []
+
+
+def test_async_status_lifecycle_through_the_routes(call, seed_image, analysis_queue):
+    image_id = seed_image("img-polled")
+    status, body, response = analyze(call, image_id, features="tags,description", **{"async": "true"})
+    assert status == 202 and body["status"] == STATUS_PENDING
+    status_url = response.headers["Location"]
+    assert status_url == body["statusUrl"] == f"/api/images/{image_id}/status"
+
+    def poll():
+        return call(function_app.get_analysis_status, url=status_url, route_params={"imageId": image_id})[1]
+
+    assert poll()["status"] == STATUS_PENDING and "resultsUrl" not in poll()
+    analysis_queue.deliver()
+    polled = poll()
+    assert polled["status"] == STATUS_COMPLETED
+    status, body, _ = call(function_app.get_analysis_results, url=polled["resultsUrl"], route_params={"imageId": image_id})
+    assert status == 200 and sorted(body["analysisResults"]["features"]) == ["description", "tags"]
+
+
+def test_status_of_unknown_image_is_not_found(call):
+    status, body, _ = call(function_app.get_analysis_status, route_params={"imageId": "img-never"})
+    assert status == 404 and not body["success"]
+
+
+def test_batch_async_reports_unknown_images_without_queuing_them(call, seed_image, repository, analysis_queue):
+    seed_image("img-known")
+    status, body, _ = call(analyze_images_batch, "POST", "/api/images/batch/analyze",
+                           body=b'{"imageIds": ["img-known", "img-made-up"], "features": ["tags"], "async": true}')
+    assert status == 202 and body["queued"] == 1 and body["failed"] == 1
+    assert [job["imageId"] for job in body["jobs"]] == ["img-known"]
+    assert body["failures"] == [{"imageId": "img-made-up", "status": STATUS_FAILED,
+                                 "error": "Image with ID img-made-up not found"}]
+    assert [job["imageId"] for job in analysis_queue.jobs] == ["img-known"]
+    assert repository.get_status("img-made-up") is None
+
+
+class BrokenQueue:
+    """Analysis queue whose sends fail for the given imageIds (all of them by default)"""
+
+    def __init__(self, failing=None):
+        self.failing = failing
+        self.jobs = []
+
+    def ensure_exists(self):
+        pass
+
+    def send(self, job):
+        if self.failing is None or job["imageId"] in self.failing:
+            raise ConnectionError("queue unavailable")
+        self.jobs.append(job)
+
+
+def test_failed_send_marks_the_job_failed(call, seed_image, repository):
+    image_id = seed_image("img-unsent")
+    function_app.clients.set("analysis_queue", BrokenQueue())
+
+    status, body, response = analyze(call, image_id, features="tags", **{"async": "true"})
+    assert status == 503 and response.headers.get("Retry-After")
+    status = repository.get_status(image_id)
+    assert status["status"] == STATUS_FAILED and "queue unavailable" in status["error"]
+    assert counters()["analysis_jobs.send_failures"] == 1
+
+
+def test_failed_send_in_a_batch_fails_only_that_image(call, seed_image, repository):
+    image_ids = [seed_image(f"img-s{index}") for index in range(3)]
+    queue = BrokenQueue(failing={"img-s1"})
+    function_app.clients.set("analysis_queue", queue)
+
+    status, body, _ = call(analyze_images_batch, "POST", "/api/images/batch/analyze",
+                           body=b'{"imageIds": ["img-s0", "img-s1", "img-s2"], "features": ["tags"], "async": true}')
+    assert status == 202 and body["queued"] == 2
+    assert [failure["imageId"] for failure in body["failures"]] == ["img-s1"]
+    assert sorted(job["imageId"] for job in queue.jobs) == ["img-s0", "img-s2"]
+    assert [repository.get_status(image_id)["status"] for image_id in image_ids] == \
+        [STATUS_PENDING, STATUS_FAILED, STATUS_PENDING]
+
+
+def test_batch_flags_and_concurrency_are_validated(call, seed_image, repository, analysis_queue):
+    seed_image("img-flags")
+    for body in (b'{"imageIds": ["img-flags"], "concurrency": "fast"}', b'{"imageIds": ["img-flags"], "concurrency": null}',
+                 b'{"imageIds": ["img-flags"], "concurrency": true}', b'{"imageIds": ["img-flags"], "force": "no"}',
+                 b'{"imageIds": ["img-flags"], "async": 1}', b'{"imageIds": ["img-flags"], "reuse_similar": null}'):
+        status, response, _ = call(analyze_images_batch, "POST", "/api/images/batch/analyze", body=body)
+        assert status == 400 and not response["success"], body
+
+    # "false" is false for every flag, as it is in query parameters
+    status, body, _ = call(analyze_images_batch, "POST", "/api/images/batch/analyze",
+                           body=b'{"imageIds": ["img-flags"], "features": ["tags"], "force": "false", "async": "false", "concurrency": "4"}')
+    assert status == 200 and not analysis_queue.jobs
+    status, body, _ = call(analyze_images_batch, "POST", "/api/images/batch/analyze",
+                           body=b'{"imageIds": ["img-flags"], "features": ["tags"], "async": "true"}')
+    assert status == 202 and body["queued"] == 1
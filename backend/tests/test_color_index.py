@@ -0,0 +1,91 @@
+"""Colour feature matrix: builds, incremental refreshes, blanked rows and the colour search route"""
+import uuid
+
+import function_app
+from function_app import ColorFeatureIndex, search_colors
+
+
+def save(repository, image_id, dominant=None, accent="", bw=False):
+    """Save an analysis; with dominant colours it includes colour results"""
+    analysis = {"tags": [{"name": "thing", "confidence": 0.9}]}
+    features = ["tags"]
+    if dominant is not None:
+        analysis["metadata"] = {"dominant_colors": dominant, "accent_color": accent, "is_bw_image": bw}
+        features.append("color")
+    assert repository.save_analysis_result(image_id, f"{image_id}.jpg",
+                                           {"imageId": image_id, "features": features, "analysis": analysis}, "", {})
+
+
+def nearest_ids(index, colors, max_results=10):
+    return [match["imageId"] for match in index.nearest(ColorFeatureIndex.vector(colors), max_results)]
+
+
+def test_refresh_appends_updates_and_blanks_rows(repository, tmp_path):
+    red, blue, green, gray = (str(uuid.uuid4()) for _ in range(4))
+    save(repository, red, ["Red"], "C0392B")
+    save(repository, blue, ["Blue", "White"], "2E86C1")
+    save(repository, gray, [], "808080", bw=True)
+    index = ColorFeatureIndex(repository, str(tmp_path))
+    index.refresh()
+    assert len(index) == 3
+    assert nearest_ids(index, {"dominant": ["red"], "accent": "C0392B"})[0] == red
+
+    # A new image is appended, a changed one updated in place, one without colours any more blanked
+    save(repository, green, ["Green"], "27AE60")
+    save(repository, blue, ["Red"], "C0392B")
+    save(repository, gray)
+    index.refresh()
+    assert len(index) == 4
+    assert index.vector_of(gray) is None
+    assert gray not in nearest_ids(index, {"dominant": [], "accent": "808080", "bw": True})
+    assert set(nearest_ids(index, {"dominant": ["red"], "accent": "C0392B"})[:2]) == {red, blue}
+    assert index.decode(index.vector_of(green))["dominantColors"] == ["green"]
+    counters = function_app.metrics.snapshot()["counters"]
+    assert counters["color_index.builds"] == 1 and counters["color_index.refreshes"] == 1
+
+    # Another process opens the same files without reading Table Storage again
+    reopened = ColorFeatureIndex(repository, str(tmp_path))
+    reopened.refresh()
+    assert len(reopened) == 4 and reopened.vector_of(gray) is None
+    assert function_app.metrics.snapshot()["counters"]["color_index.builds"] == 1
+
+    # A rebuild leaves the blanked row out
+    reopened.refresh(force_rebuild=True)
+    assert len(reopened) == 3
+    assert sorted(nearest_ids(reopened, {"dominant": ["green"]})) == sorted([red, blue, green])
+
+
+def test_color_search_route(call, repository, tmp_path):
+    red, orange = str(uuid.uuid4()), str(uuid.uuid4())
+    save(repository, red, ["Red"], "C0392B")
+    save(repository, orange, ["Orange", "Red"], "E67E22")
+    function_app.clients.set("color_index", ColorFeatureIndex(repository, str(tmp_path)))
+
+    status, body, _ = call(search_colors, url="/api/results/color-search", params={"colors": "red", "accent": "#c0392b"})
+    assert status == 200
+    assert [result["imageId"] for result in body["results"]] == [red, orange]
+    assert body["results"][0]["distance"] == 0.0
+
+    # By example: the image itself is left out
+    status, body, _ = call(search_colors, url="/api/results/color-search", params={"imageId": red})
+    assert status == 200 and [result["imageId"] for result in body["results"]] == [orange]
+
+    status, body, _ = call(search_colors, url="/api/results/color-search", params={"colors": "mauve"})
+    assert status == 400 and "mauve" in body["error"]
+
+
+def test_ids_that_are_not_uuids_are_left_out(repository, tmp_path):
+    red = str(uuid.uuid4())
+    save(repository, red, ["Red"], "C0392B")
+    save(repository, "img-café", ["Red"], "C0392B")
+    index = ColorFeatureIndex(repository, str(tmp_path))
+    index.refresh()
+    assert nearest_ids(index, {"dominant": ["red"]}) == [red]
+
+    # Longer than a UUID: stored whole it would be truncated to another id
+    longer = red + "-copy"
+    save(repository, longer, ["Red"], "C0392B")
+    index.refresh()
+    assert nearest_ids(index, {"dominant": ["red"]}) == [red]
+    assert index.vector_of(longer) is None and index.vector_of("img-café") is None
+    assert function_app.metrics.snapshot()["counters"]["color_index.skipped_ids"] == 2
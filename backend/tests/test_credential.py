@@ -0,0 +1,40 @@
+"""Shared credential: one cached token per scope and token options, claims challenges always fetched"""
+import time
+from collections import namedtuple
+
+import function_app
+from function_app import CachingCredential
+
+AccessToken = namedtuple("AccessToken", "token expires_on")
+
+
+class CountingCredential:
+    def __init__(self):
+        self.requests = []
+
+    def get_token(self, *scopes, **kwargs):
+        self.requests.append((scopes, kwargs))
+        return AccessToken(f"token-{len(self.requests)}", int(time.time()) + 3600)
+
+
+def test_tokens_are_cached_per_scope_and_options():
+    inner = CountingCredential()
+    credential = CachingCredential(inner)
+    scope = "https://storage.azure.com/.default"
+
+    first = credential.get_token(scope)
+    assert credential.get_token(scope) is first
+    cae = credential.get_token(scope, enable_cae=True)
+    assert cae is not first and credential.get_token(scope, enable_cae=True) is cae
+    tenant = credential.get_token(scope, tenant_id="other-tenant")
+    assert tenant not in (first, cae) and credential.get_token(scope, tenant_id="other-tenant") is tenant
+    assert len(inner.requests) == 3
+
+    # A claims challenge needs a new token, and does not replace the cached one
+    challenged = credential.get_token(scope, enable_cae=True, claims="{\"access_token\": {}}")
+    assert challenged is not cae and credential.get_token(scope, enable_cae=True) is cae
+
+    counters = function_app.metrics.snapshot()["counters"]
+    assert counters["credential.token_fetches"] == 4
+    assert counters["credential.token_cache_hits"] == 4
+    assert counters["credential.token_cache_bypasses"] == 1
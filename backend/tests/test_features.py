@@ -0,0 +1,73 @@
+"""Feature-selective analysis: parsing features=, merging stored and new features"""
+import pytest
+
+import function_app
+from function_app import ALL_FEATURES, analyze_image, merge_features, parse_features
+
+
+def analyze(call, image_id, **params):
+    return call(analyze_image, "POST", f"/api/images/{image_id}/analyze", {"imageId": image_id}, params)
+
+
+def stored(repository, image_id):
+    return repository.get_analysis_result(image_id)["analysisResults"]
+
+
+def test_parse_features():
+    assert parse_features("") == ALL_FEATURES
+    assert parse_features("tags, all") == ALL_FEATURES
+    assert parse_features(" Tags,TEXT ,") == {"tags", "text"}
+    assert parse_features(["objects", "faces"]) == {"objects", "faces"}
+    with pytest.raises(ValueError, match="captions"):
+        parse_features("tags,captions")
+
+
+def test_merge_features_copies_only_the_named_fields():
+    analysis = {"tags": [{"name": "dog"}], "metadata": {"image_type": {"clip_art_type": 0}, "width": 640}}
+    update = {"tags": [{"name": "cat"}], "objects": [{"object": "cat"}],
+              "metadata": {"dominant_colors": ["Black"], "accent_color": "101010", "is_bw_image": True,
+                           "image_type": {"clip_art_type": 3}}}
+
+    merge_features(analysis, update, {"color", "objects"})
+    assert analysis == {
+        "tags": [{"name": "dog"}],
+        "objects": [{"object": "cat"}],
+        "metadata": {"image_type": {"clip_art_type": 0}, "width": 640, "dominant_colors": ["Black"],
+                     "accent_color": "101010", "is_bw_image": True}
+    }
+
+
+def test_missing_features_are_computed_and_merged(call, seed_image, repository):
+    image_id = seed_image("img-incremental")
+    cv_calls = function_app.get_computer_vision_client().calls
+
+    status, body, _ = analyze(call, image_id, features="tags")
+    assert status == 200 and body["features_computed"] == ["tags"]
+    tags = stored(repository, image_id)["analysis"]["tags"]
+
+    status, body, _ = analyze(call, image_id, features="tags,text")
+    assert status == 200 and body["features_computed"] == ["text"]
+    document = stored(repository, image_id)
+    assert document["features"] == ["tags", "text"]
+    assert document["analysis"]["tags"] == tags
+    assert document["analysis"]["text"]["text_detected"]
+
+    # Everything requested is stored: answered without Computer Vision or a save
+    calls_before = sum(cv_calls.values())
+    status, body, _ = analyze(call, image_id, features="text")
+    assert status == 200 and body["features_computed"] == [] and body["features"] == ["tags", "text"]
+    assert sum(cv_calls.values()) == calls_before
+
+
+def test_force_recomputes_only_the_requested_features(call, seed_image, repository):
+    image_id = seed_image("img-forced")
+    assert analyze(call, image_id, features="tags,objects")[0] == 200
+
+    status, body, _ = analyze(call, image_id, features="objects", force="true")
+    assert status == 200 and body["features_computed"] == ["objects"]
+    assert stored(repository, image_id)["features"] == ["objects", "tags"]
+
+
+def test_unknown_feature_is_rejected(call, seed_image):
+    status, body, _ = analyze(call, seed_image("img-bad-feature"), features="colour")
+    assert status == 400 and "colour" in body["error"]
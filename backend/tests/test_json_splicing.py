@@ -0,0 +1,71 @@
+"""Stored analysis documents spliced into responses: the output must be what json.dumps would give"""
+import json
+
+import pytest
+
+import function_app
+from function_app import RawJSON, analyze_image, dumps_json, encode_document, get_analysis_results, splice_members
+
+DOCUMENT = {
+    "imageId": "img-1",
+    "features": ["tags", "text"],
+    "analysis": {
+        "tags": [{"name": "straße", "confidence": 0.987654321}, {"name": "\"quoted\" \\ tag", "confidence": 1e-7}],
+        "text": {"text_detected": True, "extracted_text": [{"text": "日本語 ✓ \u2028", "bounding_box": [1, 2, 3, 4]}]},
+        "metadata": {"width": 640, "empty": {}, "none": None, "list": []}
+    },
+}
+
+
+@pytest.fixture(params=["json", "orjson"])
+def encoder(request, monkeypatch):
+    """Run a test with the standard library encoder and, if it is installed, with orjson"""
+    if request.param == "json":
+        monkeypatch.setattr(function_app, "orjson", None)
+    elif function_app.orjson is None:
+        pytest.skip("orjson is not installed")
+    return request.param
+
+
+def test_dumps_json_matches_json_dumps(encoder):
+    encoded = dumps_json(DOCUMENT)
+    assert json.loads(encoded) == DOCUMENT
+    if encoder == "json":
+        assert encoded == json.dumps(DOCUMENT, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def test_raw_values_are_spliced_as_stored(encoder):
+    raw = RawJSON(json.dumps(DOCUMENT).encode("utf-8"))
+    envelope = {"success": True, "analysisResults": raw, "nested": [raw, {"again": raw}]}
+    assert json.loads(dumps_json(envelope)) == {"success": True, "analysisResults": DOCUMENT,
+                                                "nested": [DOCUMENT, {"again": DOCUMENT}]}
+
+
+@pytest.mark.parametrize("envelope", [
+    {"success": True, "message": "done", "features_computed": ["tags"]},
+    {},
+    {"imageId": "overridden", "cached": False},
+])
+@pytest.mark.parametrize("document", [DOCUMENT, {}])
+def test_splice_members_equals_merged_dump(encoder, envelope, document):
+    spliced = splice_members(envelope, encode_document(document))
+    assert json.loads(spliced) == json.loads(json.dumps({**envelope, **document}))
+
+
+def test_encode_document_keeps_the_object():
+    encoded = encode_document(DOCUMENT)
+    assert encoded.value is DOCUMENT
+    assert RawJSON(encoded.data).value == DOCUMENT
+
+
+def test_analyze_and_results_responses_carry_the_stored_document(call, seed_image, repository):
+    image_id = seed_image("img-spliced")
+    status, analyzed, _ = call(analyze_image, "POST", f"/api/images/{image_id}/analyze",
+                               {"imageId": image_id}, {"features": "tags,text"})
+    assert status == 200 and analyzed["success"] and analyzed["features_computed"] == ["tags", "text"]
+
+    stored = repository.get_analysis_result(image_id)["analysisResults"]
+    assert {key: analyzed[key] for key in stored} == stored
+
+    status, results, _ = call(get_analysis_results, route_params={"imageId": image_id})
+    assert status == 200 and results["analysisResults"] == stored
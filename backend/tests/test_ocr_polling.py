@@ -0,0 +1,64 @@
+"""OCR: polling a Read operation until it succeeds, fails or runs out of time"""
+import asyncio
+import time
+
+from azure.cognitiveservices.vision.computervision import models
+from msrest.pipeline import ClientRawResponse
+
+import function_app
+from benchmarks.fakes import FakeComputerVisionClient
+from function_app import extract_text
+
+IMAGE_URL = "https://fake.blob.core.windows.net/images/ocr.jpg"
+
+
+def run_ocr(cv_client):
+    return asyncio.run(extract_text(cv_client, IMAGE_URL))
+
+
+def counters():
+    return function_app.metrics.snapshot()["counters"]
+
+
+def test_polls_until_the_operation_succeeds(monkeypatch):
+    monkeypatch.setattr(function_app, "OCR_POLL_INITIAL_SECONDS", 0.01)
+    cv_client = FakeComputerVisionClient(ocr_ms=60, ocr_lines=3)
+
+    result = run_ocr(cv_client)
+    assert result["status"] == "succeeded" and result["total_lines"] == 3
+    assert result["extracted_text"][0]["text"] == "line 0 of fake text"
+    # Intervals of 10, 20, 40 ms...: a 60 ms operation is done within a handful of polls
+    assert 2 <= cv_client.calls["get_read_result"] <= 5
+    assert counters()["ocr.polls"] == cv_client.calls["get_read_result"]
+
+
+def test_retry_after_replaces_the_poll_interval(monkeypatch):
+    monkeypatch.setattr(function_app, "OCR_POLL_INITIAL_SECONDS", 5.0)
+    started = time.perf_counter()
+    result = run_ocr(FakeComputerVisionClient(ocr_ms=30, retry_after=0.02))
+    assert result["status"] == "succeeded"
+    assert time.perf_counter() - started < 1.0
+
+
+def test_operation_still_running_at_the_deadline_times_out(monkeypatch):
+    monkeypatch.setattr(function_app, "OCR_POLL_INITIAL_SECONDS", 0.01)
+    monkeypatch.setattr(function_app, "OCR_DEADLINE_SECONDS", 0.1)
+    cv_client = FakeComputerVisionClient(ocr_ms=10_000)
+
+    result = run_ocr(cv_client)
+    assert result == {"text_detected": False, "status": "timeout", "error": "OCR did not finish within 0.1 seconds"}
+    assert counters()["ocr.timeouts"] == 1
+    assert cv_client.calls["get_read_result"] <= 6
+
+
+def test_failed_operation_and_polling_errors_are_reported(monkeypatch):
+    cv_client = FakeComputerVisionClient(ocr_ms=0)
+    monkeypatch.setattr(cv_client, "get_read_result", lambda operation_id, raw=False: ClientRawResponse(
+        models.ReadOperationResult(status=models.OperationStatusCodes.failed), None))
+    assert run_ocr(cv_client) == {"text_detected": False, "status": "failed", "error": "OCR operation failed"}
+
+    def unavailable(operation_id, raw=False):
+        raise ConnectionError("service unavailable")
+    monkeypatch.setattr(cv_client, "get_read_result", unavailable)
+    assert run_ocr(cv_client) == {"text_detected": False, "status": "error", "error": "service unavailable"}
+    assert counters()["ocr.failures"] == 2
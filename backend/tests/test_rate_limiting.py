@@ -0,0 +1,105 @@
+"""Computer Vision rate limiting: the shared Table Storage token bucket, and 429 retries with backoff"""
+from types import SimpleNamespace
+
+import pytest
+
+import function_app
+from benchmarks.fakes import throttled_error
+from function_app import (
+    ComputerVisionThrottledError, InMemoryTokenBucketStore, RateLimiter, TableTokenBucketStore, call_computer_vision
+)
+
+
+def counters():
+    return function_app.metrics.snapshot()["counters"]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Seconds passed to time.sleep, without sleeping"""
+    slept = []
+    monkeypatch.setattr(function_app.time, "sleep", slept.append)
+    return slept
+
+
+def test_table_bucket_is_shared_between_instances():
+    table_service = function_app.get_table_service_client()
+    first, second = TableTokenBucketStore(table_service), TableTokenBucketStore(table_service)
+
+    # Burst of 2 at 1 token per second, taken by two instances at the same moment
+    assert first.take("cv", 1.0, 2.0, 100.0) == 0.0
+    assert second.take("cv", 1.0, 2.0, 100.0) == 0.0
+    assert first.take("cv", 1.0, 2.0, 100.0) == pytest.approx(1.0)
+    assert second.take("cv", 1.0, 2.0, 100.5) == pytest.approx(0.5)
+    assert first.take("cv", 1.0, 2.0, 101.0) == 0.0
+    assert first.take("other", 1.0, 2.0, 101.0) == 0.0
+
+
+def test_table_bucket_retries_a_conflicting_write():
+    table_service = function_app.get_table_service_client()
+    store, rival = TableTokenBucketStore(table_service), TableTokenBucketStore(table_service)
+    assert store.take("cv", 1.0, 5.0, 100.0) == 0.0
+
+    # Another instance takes a token between this one's read and write
+    update_entity = store.table_client.update_entity
+    def update_after_rival(*args, **kwargs):
+        store.table_client.update_entity = update_entity
+        assert rival.take("cv", 1.0, 5.0, 100.0) == 0.0
+        return update_entity(*args, **kwargs)
+    store.table_client.update_entity = update_after_rival
+
+    assert store.take("cv", 1.0, 5.0, 100.0) == 0.0
+    assert counters()["cv.rate_limit.conflicts"] == 1
+    entity = store.table_client.get_entity(partition_key="cv", row_key=TableTokenBucketStore.ROW_KEY)
+    assert entity["tokens"] == pytest.approx(2.0)
+
+
+def test_limiter_waits_for_tokens_and_falls_back_when_the_store_fails(sleeps):
+    limiter = RateLimiter(InMemoryTokenBucketStore(), "cv", rate=10.0, burst=1.0)
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() > 0 and sleeps and counters()["cv.rate_limit.throttled"] == 1
+
+    class BrokenStore:
+        def take(self, *args):
+            raise ConnectionError("table unavailable")
+
+    limiter = RateLimiter(BrokenStore(), "cv", rate=10.0, burst=2.0)
+    assert limiter.acquire() == 0.0
+    assert counters()["cv.rate_limit.store_errors"] == 1
+
+
+def test_throttled_calls_are_retried_after_retry_after(sleeps):
+    responses = [throttled_error(0.25), throttled_error(0.25)]
+    def analyze():
+        if responses:
+            raise responses.pop(0)
+        return "result"
+
+    assert call_computer_vision("analyze", analyze) == "result"
+    assert len(sleeps) == 2
+    assert all(0.25 <= delay <= 0.25 + function_app.CV_RETRY_BASE_SECONDS for delay in sleeps)
+    assert counters()["cv.calls.analyze"] == 3 and counters()["cv.retries.analyze"] == 2
+
+
+def test_backoff_without_retry_after_grows_then_gives_up(sleeps, monkeypatch):
+    monkeypatch.setattr(function_app, "CV_MAX_RETRIES", 3)
+    error = Exception("Too Many Requests")
+    error.response = SimpleNamespace(status_code=429, headers={})
+    def analyze():
+        raise error
+
+    with pytest.raises(ComputerVisionThrottledError) as raised:
+        call_computer_vision("analyze", analyze)
+    assert raised.value.retry_after is None
+    assert len(sleeps) == 3
+    assert all(0 <= delay <= function_app.CV_RETRY_BASE_SECONDS * 2 ** attempt for attempt, delay in enumerate(sleeps))
+    assert counters()["cv.throttled.analyze"] == 4
+
+
+def test_other_errors_are_not_retried(sleeps):
+    def analyze():
+        raise ValueError("bad image")
+
+    with pytest.raises(ValueError):
+        call_computer_vision("analyze", analyze)
+    assert sleeps == [] and "cv.retries.analyze" not in counters()
@@ -0,0 +1,53 @@
+"""reshard-results: history rows moved into the current shard partitions, with lookup rows repointed"""
+import function_app
+from function_app import results_partition_key
+
+IMAGE_IDS = [f"img-shard-{index}" for index in range(6)]
+
+
+def save_all(repository):
+    for image_id in IMAGE_IDS:
+        assert repository.save_analysis_result(image_id, f"{image_id}.jpg", {
+            "imageId": image_id, "features": ["tags"], "analysis": {"tags": [{"name": "dog", "confidence": 0.9}]}
+        }, "", {})
+
+
+def history(repository):
+    """imageId -> PartitionKey of its history row"""
+    table_client = repository.table_service.get_table_client(repository.table_name)
+    return {entity["imageId"]: entity["PartitionKey"] for entity in table_client.list_entities()}
+
+
+def latest_partition(repository, image_id):
+    return repository.index.get_latest_analysis(image_id)["resultPartitionKey"]
+
+
+def test_unsharded_rows_are_moved_and_lookups_repointed(repository):
+    save_all(repository)
+    # Rows written before sharding sit in one partition per day
+    table_client = repository.table_service.get_table_client(repository.table_name)
+    table_client.repartition(lambda entity: entity["analysisTime"][:10])
+    index_client = repository.table_service.get_table_client(repository.index.table_name)
+    for image_id, partition_key in history(repository).items():
+        index_client.upsert_entity({"PartitionKey": image_id, "RowKey": repository.index.LATEST_ROW_KEY,
+                                    "resultPartitionKey": partition_key})
+
+    assert repository.reshard_results() == {"moved": 6, "alreadyInPlace": 0, "shards": function_app.RESULTS_PARTITION_SHARDS}
+    for image_id, partition_key in history(repository).items():
+        assert partition_key == results_partition_key(partition_key[:10], image_id)
+        assert latest_partition(repository, image_id) == partition_key
+        assert repository.get_analysis_result(image_id)["analysisResults"]["analysis"]["tags"][0]["name"] == "dog"
+
+    assert repository.reshard_results()["moved"] == 0
+
+
+def test_rows_follow_a_new_shard_count(repository, monkeypatch):
+    save_all(repository)
+    monkeypatch.setattr(function_app, "RESULTS_PARTITION_SHARDS", 2)
+    expected = {image_id: results_partition_key(partition_key[:10], image_id)
+                for image_id, partition_key in history(repository).items()}
+
+    result = repository.reshard_results()
+    assert result["moved"] + result["alreadyInPlace"] == 6 and result["shards"] == 2
+    assert history(repository) == expected
+    assert all(latest_partition(repository, image_id) == expected[image_id] for image_id in IMAGE_IDS)
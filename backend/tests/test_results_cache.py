@@ -0,0 +1,93 @@
+"""GET results: the response cache, ETags and If-None-Match revalidation"""
+import function_app
+from function_app import ResponseCache, etag_matches, get_analysis_results
+
+
+def save(repository, image_id, caption="a dog on a beach"):
+    assert repository.save_analysis_result(image_id, f"{image_id}.jpg", {
+        "imageId": image_id, "features": ["description"],
+        "analysis": {"descriptions": [{"text": caption, "confidence": 0.9}]}
+    }, "", {})
+
+
+def get(call, image_id, etag=None):
+    return call(get_analysis_results, url=f"/api/images/{image_id}/results", route_params={"imageId": image_id},
+                headers={"If-None-Match": etag} if etag else None)
+
+
+def test_etag_and_not_modified(call, repository):
+    save(repository, "img-polled")
+    status, body, response = get(call, "img-polled")
+    etag = response.headers["ETag"]
+    assert status == 200 and response.headers["Cache-Control"] == "no-cache"
+    assert body["analysisResults"]["analysis"]["descriptions"][0]["text"] == "a dog on a beach"
+
+    status, body, response = get(call, "img-polled", etag)
+    assert status == 304 and body is None and response.headers["ETag"] == etag
+    status, _, _ = get(call, "img-polled", f'"other", W/{etag}')
+    assert status == 304
+    assert get(call, "img-polled", '"other"')[0] == 200
+
+
+def test_revalidation_without_a_cached_body_reads_only_the_etag(call, repository):
+    save(repository, "img-cold")
+    etag = get(call, "img-cold")[2].headers["ETag"]
+    function_app.results_cache.clear()
+
+    latency = repository.table_service.latency
+    latency.round_trips = 0
+    assert get(call, "img-cold", etag)[0] == 304
+    assert latency.round_trips == 1
+
+
+def test_cache_serves_repeats_and_is_invalidated_by_saves_and_status_updates(call, repository):
+    save(repository, "img-changing")
+    first = get(call, "img-changing")[2].headers["ETag"]
+    hits = function_app.results_cache.stats()["hits"]
+    assert get(call, "img-changing")[2].headers["ETag"] == first
+    assert function_app.results_cache.stats()["hits"] == hits + 1
+
+    save(repository, "img-changing", "a cat on a sofa")
+    status, body, response = get(call, "img-changing", first)
+    assert status == 200 and response.headers["ETag"] != first
+    assert body["analysisResults"]["analysis"]["descriptions"][0]["text"] == "a cat on a sofa"
+
+    second = response.headers["ETag"]
+    repository.update_status("img-changing", function_app.STATUS_RUNNING)
+    status, body, response = get(call, "img-changing", second)
+    assert status == 200 and body["status"] == function_app.STATUS_RUNNING
+    assert response.headers["ETag"] != second
+
+
+def test_missing_results_are_not_cached(call, repository):
+    assert get(call, "img-later")[0] == 404
+    save(repository, "img-later")
+    assert get(call, "img-later")[0] == 200
+
+
+def test_response_cache_bounds_and_ttl():
+    now = [0.0]
+    cache = ResponseCache(max_entries=2, max_bytes=10_000, ttl_seconds=5, clock=lambda: now[0])
+    for key in ("a", "b", "c"):
+        cache.put(key, '"e"', b"{}")
+    assert cache.get("a") is None and cache.get("c") == ('"e"', b"{}")
+    assert cache.stats()["evictions"] == 1
+
+    now[0] = 6
+    assert cache.get("c") is None and cache.stats()["expirations"] == 1
+
+    # A fill that read its data before an invalidation is dropped
+    generation = cache.generation
+    cache.invalidate("d")
+    cache.put("d", '"e"', b"{}", generation)
+    assert cache.get("d") is None
+    cache.put("d", '"e"', b"{}", cache.generation)
+    assert cache.get("d") == ('"e"', b"{}")
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
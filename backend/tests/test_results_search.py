@@ -0,0 +1,76 @@
+"""Filtered result search over the sharded daily history partitions"""
+import datetime
+
+import pytest
+
+import function_app
+from function_app import results_partition_key, search_results
+
+
+@pytest.fixture
+def history(repository):
+    """40 analyses spread over the last 5 days and their shards; every third one has faces"""
+    today = datetime.datetime.utcnow()
+    day_of = {}
+    for index in range(40):
+        image_id = f"img-{index:02d}"
+        day_of[image_id] = (today - datetime.timedelta(days=index % 5)).strftime("%Y-%m-%d")
+        faces = [{"age": 30}] if index % 3 == 0 else []
+        repository.save_analysis_result(image_id, f"{image_id}.jpg", {
+            "imageId": image_id, "analysis": {"faces": faces, "objects": [], "tags": [], "descriptions": []}
+        }, "", {})
+    table_client = repository.table_service.get_table_client(repository.table_name)
+    table_client.repartition(lambda entity: results_partition_key(day_of[entity["imageId"]], entity["imageId"]))
+    # (PartitionKey, RowKey) order, as a single range query returns the rows
+    ordered = sorted(table_client.list_entities(), key=lambda entity: (entity["PartitionKey"], entity["RowKey"]))
+    return [(entity["imageId"], entity["faceCount"] > 0) for entity in ordered]
+
+
+def page_through(call, params):
+    seen = []
+    pages = 0
+    while True:
+        status, body, _ = call(search_results, url="/api/results/search", params=params)
+        assert status == 200
+        seen.extend(result["imageId"] for result in body["results"])
+        pages += 1
+        if not body["has_more"]:
+            return seen, pages
+        params = {"cursor": body["next_cursor"], "max_results": params["max_results"]}
+
+
+def test_search_pages_follow_key_order(call, history):
+    seen, _ = page_through(call, {"days_back": "6", "max_results": "7"})
+    assert seen == [image_id for image_id, _ in history]
+
+
+def test_filtered_search_cursor_round_trip(call, history):
+    seen, _ = page_through(call, {"days_back": "6", "max_results": "3", "has_faces": "true"})
+    assert seen == [image_id for image_id, has_faces in history if has_faces]
+
+
+def test_small_page_budget_still_reaches_every_match(call, history, monkeypatch):
+    monkeypatch.setattr(function_app, "SEARCH_MAX_PAGES", 2)
+    seen, pages = page_through(call, {"days_back": "6", "max_results": "100", "has_faces": "true"})
+    assert seen == [image_id for image_id, has_faces in history if has_faces]
+    assert pages > 1
+
+
+def test_partition_queries_ask_only_for_rows_still_needed(repository, history, monkeypatch):
+    requested = []
+    query_partition = function_app.ImageAnalysisRepository._query_partition
+
+    def recording(self, partition_key, clauses, limit, row_start="", token=None):
+        requested.append(limit)
+        return query_partition(self, partition_key, clauses, limit, row_start, token)
+
+    monkeypatch.setattr(function_app.ImageAnalysisRepository, "_query_partition", recording)
+    end = datetime.datetime.utcnow()
+    results, cursor = repository.search_results(end - datetime.timedelta(days=6), end, max_results=5, max_pages=None, concurrency=2)
+    assert [result["imageId"] for result in results] == [image_id for image_id, _ in history[:5]]
+    assert cursor is not None
+    # Waves of two partitions; later waves ask for less, and partitions past the page are never read
+    assert requested == sorted(requested, reverse=True) and requested[0] == 5
+    assert len(requested) < len(function_app.day_partitions("2026-01-01")) * 7
+    assert repository.get_results_by_date_range(end - datetime.timedelta(days=6), end, 100) == \
+        repository.search_results(end - datetime.timedelta(days=6), end, max_results=100, max_pages=None)[0]
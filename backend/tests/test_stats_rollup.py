@@ -0,0 +1,67 @@
+"""Per-day stats rollups: a re-analysis replacing its row moves the totals by the difference only"""
+import datetime
+
+import pytest
+
+import function_app
+from function_app import get_analysis_stats
+
+
+class FrozenDateTime(datetime.datetime):
+    now_value = datetime.datetime(2026, 10, 16, 12, 0, 0)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now_value
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Pins utcnow, so saves land in the same history row until the test moves it"""
+    monkeypatch.setattr(function_app.datetime, "datetime", FrozenDateTime)
+    return FrozenDateTime
+
+
+def save(repository, image_id, faces=0, text=False, confidence=0.9):
+    assert repository.save_analysis_result(image_id, f"{image_id}.jpg", {
+        "imageId": image_id, "features": ["description", "faces", "text"],
+        "analysis": {"descriptions": [{"text": "a photo", "confidence": confidence}],
+                     "faces": [{"age": 30}] * faces,
+                     "text": {"text_detected": text, "extracted_text": [{"text": "hello"}] if text else []}}
+    }, "", {})
+
+
+def summary(call):
+    status, body, _ = call(get_analysis_stats, url="/api/results/stats", params={"days_back": "0"})
+    assert status == 200, body
+    return body["summary"]
+
+
+def test_reanalysis_replaces_its_contribution(call, repository, clock):
+    save(repository, "img-stats-a", faces=2, text=True, confidence=0.8)
+    save(repository, "img-stats-b", confidence=0.6)
+    assert summary(call) == {
+        "total_images_analyzed": 2, "images_with_faces": 1, "images_with_objects": 0, "images_with_text": 1,
+        "total_objects_detected": 0, "total_faces_detected": 2, "average_confidence": 0.7
+    }
+
+    # Same second: the history row is replaced, and only the difference reaches the totals
+    save(repository, "img-stats-a", faces=0, text=False, confidence=0.4)
+    assert summary(call) == {
+        "total_images_analyzed": 2, "images_with_faces": 0, "images_with_objects": 0, "images_with_text": 0,
+        "total_objects_detected": 0, "total_faces_detected": 0, "average_confidence": 0.5
+    }
+
+    # A later analysis is a new history row, and counts as one more
+    clock.now_value += datetime.timedelta(seconds=1)
+    save(repository, "img-stats-a", faces=1, confidence=0.8)
+    assert summary(call)["total_images_analyzed"] == 3 and summary(call)["total_faces_detected"] == 1
+
+
+def test_delta_of_a_replaced_row():
+    before = {"faceCount": 3, "objectCount": 1, "hasText": True, "confidence": 0.5}
+    after = {"faceCount": 1, "objectCount": 0, "hasText": True, "confidence": 0.0}
+    assert function_app.AnalysisStatsRepository.delta(after, before) == {
+        "images": 0, "imagesWithFaces": 0, "imagesWithObjects": -1, "imagesWithText": 0,
+        "totalFaces": -2, "totalObjects": -1, "confidenceCount": -1, "confidenceSum": -0.5
+    }
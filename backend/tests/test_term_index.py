@@ -0,0 +1,53 @@
+"""Tag and object index: entries kept in line with re-analyses, and tag search paging"""
+from function_app import TermIndexRepository, search_results
+
+
+def save(repository, image_id, tags, objects=()):
+    assert repository.save_analysis_result(image_id, f"{image_id}.jpg", {
+        "imageId": image_id, "features": ["objects", "tags"],
+        "analysis": {"tags": [{"name": name, "confidence": 0.9} for name in tags],
+                     "objects": [{"name": name, "confidence": 0.8} for name in objects]}
+    }, "", {})
+
+
+def search(call, **params):
+    status, body, _ = call(search_results, url="/api/results/search", params=params)
+    assert status == 200, body
+    return body
+
+
+def test_tag_search_cursor_round_trip(call, repository):
+    for index in range(7):
+        save(repository, f"img-{index}", ["Dog", "outdoor"] if index % 2 == 0 else ["dog"], ["person"])
+    save(repository, "img-cat", ["cat", "outdoor"])
+
+    seen = []
+    body = search(call, tag="dog, Outdoor", object="person", max_results="2")
+    assert body["query"]["tags"] == ["dog", "outdoor"] and body["query"]["objects"] == ["person"]
+    while True:
+        seen.extend(result["imageId"] for result in body["results"])
+        assert all(set(result["matches"]) == {"tag:dog", "tag:outdoor", "object:person"} for result in body["results"])
+        if not body["has_more"]:
+            break
+        body = search(call, cursor=body["next_cursor"], max_results="2")
+        # The cursor carries the terms; later pages report the same query
+        assert body["query"]["tags"] == ["dog", "outdoor"]
+    assert seen == ["img-0", "img-2", "img-4", "img-6"]
+
+
+def test_reanalysis_removes_entries_for_dropped_tags(call, repository):
+    save(repository, "img-changed", ["dog", "beach"])
+    assert [result["imageId"] for result in search(call, tag="beach")["results"]] == ["img-changed"]
+
+    save(repository, "img-changed", ["dog", "park"])
+    assert search(call, tag="beach")["results"] == []
+    assert [result["imageId"] for result in search(call, tag="park")["results"]] == ["img-changed"]
+    table_client = repository.table_service.get_table_client(TermIndexRepository.TABLE_NAME)
+    assert sorted(entry["PartitionKey"] for entry in table_client.list_entities()) == ["tag:dog", "tag:park"]
+
+
+def test_tag_search_rejects_filters_and_bad_cursors(call):
+    status, body, _ = call(search_results, url="/api/results/search", params={"tag": "dog", "has_faces": "true"})
+    assert status == 400
+    status, body, _ = call(search_results, url="/api/results/search", params={"cursor": "bm90LWEtY3Vyc29y"})
+    assert status == 400
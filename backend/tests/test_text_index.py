@@ -0,0 +1,98 @@
+"""OCR text index: size limits of the textTerms column and index transactions, and text search paging"""
+import json
+
+import function_app
+from function_app import TextIndexRepository, search_text
+
+
+def ocr_document(image_id, lines):
+    return {
+        "imageId": image_id,
+        "features": ["text"],
+        "analysis": {"text": {"text_detected": bool(lines), "total_lines": len(lines),
+                              "extracted_text": [{"text": line, "bounding_box": [0, 0, 10, 0, 10, 10, 0, 10]}
+                                                 for line in lines]}},
+    }
+
+
+def save(repository, image_id, lines):
+    assert repository.save_analysis_result(image_id, f"{image_id}.jpg", ocr_document(image_id, lines), "", {})
+
+
+def test_text_terms_column_fits_the_property_limit(repository):
+    # Long non-ASCII tokens are escaped in the column, so far fewer than MAX_IMAGE_TOKENS fit
+    lines = [" ".join(f"ŵörd{line:03d}{word:02d}{'é' * 80}" for word in range(20)) for line in range(100)]
+    save(repository, "img-long", lines)
+
+    latest = repository.index.get_latest_analysis("img-long")
+    column = latest[TextIndexRepository.COLUMN]
+    assert len(column) <= TextIndexRepository.MAX_COLUMN_JSON
+    tokens = json.loads(column)
+    assert 0 < len(tokens) < len(lines) * 20
+
+    # The entries written are exactly the ones the column records, so a re-analysis can delete them
+    table_client = repository.table_service.get_table_client(TextIndexRepository.TABLE_NAME)
+    assert {entry["PartitionKey"] for entry in table_client.list_entities()} == set(tokens)
+    save(repository, "img-long", ["short text"])
+    assert {entry["PartitionKey"] for entry in table_client.list_entities()} == {"short", "text"}
+
+
+def large_entry_operations(index, images):
+    # Every image's entry for "common" carries ~60K characters of positions and lines
+    operations = []
+    for number in range(images):
+        entity = {"imageId": f"img-{number:03d}", "blobName": "", "analysisTime": ""}
+        operations.extend(index.operations(entity, ocr_document(entity["imageId"], [" ".join(["common"] * 2000)] * 3)))
+    return operations
+
+
+def test_index_transactions_stay_under_the_payload_limit(repository):
+    index = TextIndexRepository(repository.table_service)
+    operations = large_entry_operations(index, 100)
+    latency = repository.table_service.latency
+    latency.round_trips = 0
+    index.apply_operations(operations)
+
+    table_client = repository.table_service.get_table_client(TextIndexRepository.TABLE_NAME)
+    assert sum(1 for _ in table_client.list_entities()) == 100
+    # A few transactions, none rejected and replaced by 100 single writes
+    assert latency.round_trips <= 5
+    counters = function_app.metrics.snapshot()["counters"]
+    assert counters.get("text_index.failures", 0) == 0
+    assert "text_index.transactions_split" not in counters
+
+
+def test_transaction_rejected_as_too_large_is_split(repository, monkeypatch):
+    monkeypatch.setattr(function_app.ImageAnalysisRepository, "MAX_TRANSACTION_BYTES", 64 * 1024 * 1024)
+    index = TextIndexRepository(repository.table_service)
+    index.apply_operations(large_entry_operations(index, 100))
+
+    table_client = repository.table_service.get_table_client(TextIndexRepository.TABLE_NAME)
+    assert sum(1 for _ in table_client.list_entities()) == 100
+    counters = function_app.metrics.snapshot()["counters"]
+    assert counters["text_index.transactions_split"] >= 1
+    assert counters.get("text_index.failures", 0) == 0
+
+
+def test_text_search_cursor_round_trip(call, repository):
+    for index in range(5):
+        save(repository, f"img-{index}", [f"invoice number {index}", "total due"])
+    save(repository, "img-other", ["shopping list"])
+
+    seen = []
+    params = {"q": "Invoice", "max_results": "2"}
+    for _ in range(5):
+        status, body, _ = call(search_text, url="/api/results/text-search", params=params)
+        assert status == 200
+        assert body["query"]["q"] == "Invoice"
+        seen.extend(result["imageId"] for result in body["results"])
+        if not body["has_more"]:
+            break
+        params = {"cursor": body["next_cursor"], "max_results": "2"}
+    assert sorted(seen) == [f"img-{index}" for index in range(5)]
+    assert body["results"][-1]["hits"][0]["text"].startswith("invoice number")
+
+
+def test_text_search_rejects_foreign_cursor(call):
+    status, body, _ = call(search_text, url="/api/results/text-search", params={"cursor": "bm90LWEtY3Vyc29y"})
+    assert status == 400
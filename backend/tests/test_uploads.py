@@ -0,0 +1,35 @@
+"""Chunked uploads: blocks committed to Blob Storage, and the perceptual hash computed and indexed"""
+import io
+
+from PIL import Image
+
+import function_app
+from function_app import ImageHashIndexRepository, ImageIndexRepository, perceptual_hash, upload_image_stream
+
+
+def jpeg(side=600):
+    image = Image.linear_gradient("L").resize((side, side)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def test_chunked_upload_is_hashed_and_indexed(call, monkeypatch):
+    monkeypatch.setattr(function_app, "STREAM_CHUNK_BYTES", 4096)
+    data = jpeg()
+    status, body, _ = call(upload_image_stream, "POST", "/api/images/upload/stream", body=data,
+                           headers={"Content-Type": "image/jpeg", "X-File-Name": "gradient.jpg"})
+    assert status == 200 and body["metadata"]["fileSize"] == len(data)
+    assert function_app.metrics.snapshot()["counters"]["uploads.streamed_blocks"] == -(-len(data) // 4096)
+
+    phash = body["metadata"]["perceptualHash"]
+    assert phash == perceptual_hash(Image.open(io.BytesIO(data)))
+    assert ImageIndexRepository().get_blob_entry(body["imageId"])["perceptualHash"] == phash
+    similar = ImageHashIndexRepository().find_similar(phash, 0)
+    assert [match["imageId"] for match in similar] == [body["imageId"]]
+
+
+def test_chunked_upload_rejects_other_formats(call):
+    status, body, _ = call(upload_image_stream, "POST", "/api/images/upload/stream", body=b"GIF89a" + bytes(64),
+                           headers={"Content-Type": "image/png"})
+    assert status == 400 and not body["success"]